@@ -1,9 +1,69 @@
+import json
+import logging
+import multiprocessing
+import random
+import time
+import snapshot
 from board import Board
+from const import *
+from difficulty import Difficulty
+from move import Move
+from pawns import PawnTable, PAWN_TABLE_SIZE
 from piece import *
+from picker import MovePicker, KILLER_SLOTS, MAX_PLY
+from transposition import TranspositionTable, TT_SIZE, EXACT, LOWER, UPPER
+
+# Evaluation weights that can be overridden with AI.set_weights()
+WEIGHTS = [
+    'MATERIAL_VALUES', 'PAWN_TABLE', 'PIECE_VALUES', 'MOBILITY_BONUS', 'KING_SAFETY_BONUS',
+    'DOUBLED_PAWN_PENALTY', 'ISOLATED_PAWN_PENALTY', 'BACKWARD_PAWN_PENALTY', 'PASSED_PAWN_BONUS'
+]
+PIECE_TYPES = {'pawn': PAWN, 'knight': KNIGHT, 'bishop': BISHOP, 'rook': ROOK, 'queen': QUEEN, 'king': KING}
+
+logger = logging.getLogger(__name__)
+
+_worker_ai: 'AI | None' = None
+
+
+def _init_search_worker():
+    global _worker_ai
+    _worker_ai = AI()
+
+
+'''
+Searches a share of the root moves in a worker process
+
+@return tuple[list[tuple[int, int]], int, int] scores with encoded moves, nodes and depth completed
+'''
+def _search_root_moves(job):
+    position, history, codes, depth, time_limit, max_nodes, multipv, weights, network = job
+    ai = _worker_ai
+    
+    # The position comes as a snapshot, the history only for finding repetitions
+    board = snapshot.from_bytes(position)
+    board.history = history
+    
+    # Keep the warm pawn table unless the weights changed
+    if weights != ai.get_weights():
+        ai.set_weights(weights)
+    
+    if network != (ai.network.path if ai.network else None):
+        ai.load_network(network)
+    
+    ai.max_nodes = max_nodes
+    ai.multipv = multipv
+    ai.nodes = 0
+    ai.stopped = False
+    ai.clear_killers()
+    ai.deadline = time.perf_counter() + time_limit if time_limit else None
+    
+    scores = ai.iterative_deepening(board, depth, set(codes))
+    return [(value, move.encode()) for value, _, move in scores], ai.nodes, ai.completed_depth
+
 
 class AI:
     
-    def __init__(self):
+    def __init__(self, pawn_table_size=PAWN_TABLE_SIZE, tt_size=TT_SIZE, cache=None):
         self.MATERIAL_VALUES = {
             PAWN: 100,
             KNIGHT: 320,
@@ -33,31 +93,173 @@ class AI:
 
         self.MOBILITY_BONUS = 5
         self.KING_SAFETY_BONUS = 10
+        
+        # Pawn structure terms
+        self.DOUBLED_PAWN_PENALTY = 10
+        self.ISOLATED_PAWN_PENALTY = 15
+        self.BACKWARD_PAWN_PENALTY = 8
+        
+        # Passed pawn bonus by rank, counted from the pawn's own side
+        self.PASSED_PAWN_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]
+        
         self.CHECKMATE_SCORE = 10000
         self.STALEMATE_SCORE = 0
+        
+        # Pawn structure scores, keyed by the board's pawn key
+        self.pawn_table = PawnTable(pawn_table_size)
+        
+        # Search results keyed by the board's Zobrist key, kept from one search to the next
+        self.tt = TranspositionTable(tt_size)
+        
+        # Optional AnalysisCache, root results kept on disk across runs
+        self.cache = cache
+        
+        # Optional nnue.Network evaluating positions instead of the terms above
+        self.network = None
+        
+        # Optional book.Book, moves of known openings are played without a search
+        self.book = None
+        
+        # Number of positions visited by the last search and the deepest iteration it completed
+        self.nodes = 0
+        self.completed_depth = 0
+        
+        # Time and node budgets of the current search
+        self.deadline: float | None = None
+        self.max_nodes: int | None = None
+        self.stopped = False
+        
+        # Set from another thread to stop the search, see Ponder
+        self.abort = False
+        
+        # Called with the depth and root scores of every completed iteration, see epd.py
+        self.on_iteration = None
+        
+        # Quiet moves that caused a cutoff, for every ply below the root
+        self.root_ply = 0
+        self.killers = [[None] * KILLER_SLOTS for _ in range(MAX_PLY)]
+        
+        # Strength settings, see set_difficulty()
+        self.multipv = 1
+        self.noise = 0
+        self.workers = 1
+        self.random = random.Random()
+        self.pool = None
+    
+    # Overrides evaluation weights, tables keyed by piece type also accept piece names
+    def set_weights(self, weights: dict):
+        for name, value in weights.items():
+            if name not in WEIGHTS:
+                raise KeyError(f'Unknown evaluation weight: {name}')
+            
+            if isinstance(value, dict):
+                table = getattr(self, name)
+                for piece_type, piece_value in value.items():
+                    table[PIECE_TYPES.get(piece_type, piece_type)] = piece_value
+            else:
+                setattr(self, name, value)
+        
+        # Cached pawn and search scores were computed with the old weights
+        self.pawn_table.clear()
+        self.tt.clear()
+    
+    # Evaluates with the network in a file from now on, or with the weights again when path is None
+    def load_network(self, path):
+        if path is None:
+            self.network = None
+        else:
+            # NumPy is only imported by the engine when a network is used
+            from nnue import Network
+            self.network = Network(path)
+        
+        self.tt.clear()
+    
+    # Plays from an opening book file from now on, or searches every move again when path is None
+    def load_book(self, path):
+        if self.book is not None:
+            self.book.close()
+        
+        if path is None:
+            self.book = None
+        else:
+            from book import Book
+            self.book = Book(path)
+    
+    # Reads weights written as JSON, e.g. by the tuner in tune.py
+    def load_weights(self, path):
+        with open(path) as file:
+            self.set_weights(json.load(file))
+    
+    def set_difficulty(self, difficulty: Difficulty):
+        self.max_nodes = difficulty.nodes
+        self.multipv = difficulty.multipv
+        self.noise = difficulty.noise
+        
+        if difficulty.workers != self.workers:
+            self.close()
+            self.workers = difficulty.workers
+        
+        # Start the worker processes now rather than on the first move
+        if self.workers > 1:
+            self.get_pool()
+    
+    def get_pool(self):
+        if self.pool is None:
+            # Spawned workers do not inherit the display and audio of the game
+            self.pool = multiprocessing.get_context('spawn').Pool(self.workers, initializer=_init_search_worker)
+        
+        return self.pool
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+    
+    def get_weights(self):
+        names = {piece_type: name for name, piece_type in PIECE_TYPES.items()}
+        weights = {}
+        
+        for name in WEIGHTS:
+            value = getattr(self, name)
+            
+            if isinstance(value, dict):
+                value = {names[piece_type]: piece_value for piece_type, piece_value in value.items()}
+            elif isinstance(value, list):
+                value = list(value)
+            
+            weights[name] = value
+        
+        return weights
     
     def evaluate(self, board: Board):
+        if self.network is not None:
+            return self.network.evaluate(board)
+        
         material_score = 0
         for piece_type, value in self.MATERIAL_VALUES.items():
             material_score += len(board.pieces(piece_type, 'white')) * value
             material_score -= len(board.pieces(piece_type, 'black')) * value
             
-        pawn_score = 0
-        for square, piece in board.get_board_pieces().items():
-            if piece.type == PAWN:
-                if piece.color == 'white':
-                    pawn_score += self.PAWN_TABLE[square]
-                else:
-                    pawn_score -= self.PAWN_TABLE[board.square_mirror(square)]
-                    
+        pawn_score = self.pawn_table.probe(board.pawn_hash)
+        if pawn_score is None:
+            pawn_score = self.evaluate_pawns(board)
+            self.pawn_table.store(board.pawn_hash, pawn_score)
+        
         mobility_score = 0
         for _, piece in board.get_legal_moves().items():
             for move in piece.valid_moves:
                 if board.is_capture_move(move, piece.color):
-                    if not isinstance(board.squares[move.final.row][move.final.col].piece, Pawn) and not isinstance(board.squares[move.final.row][move.final.col].piece, King):
-                        mobility_score += self.PIECE_VALUES[board.squares[move.final.row][move.final.col].piece.type]
+                    captured = board.squares[move.final.row][move.final.col].piece
+                    
+                    # Only captures that do not lose material in the exchange count
+                    if captured.type in self.PIECE_VALUES and self.see(board, move) >= 0:
+                        mobility_score += self.PIECE_VALUES[captured.type]
                 else:
                     mobility_score += self.MOBILITY_BONUS
+        
+        # Mobility is counted for the side to move
+        if board.current_player == 'black':
+            mobility_score = -mobility_score
                     
         king_square = board.king('white')
         if board.is_checkmate(color='white'):
@@ -73,76 +275,474 @@ class AI:
         return score if board.current_player == 'white' else -score
     
 
-    # Implement the minimax algorithm with alpha-beta pruning
-    def minimax(self, board: Board, depth, alpha, beta, maximizing_player):
-        print(f"Depth: {depth}, Alpha: {alpha}, Beta: {beta}, MaxP: {maximizing_player}")
+    '''
+    Static exchange evaluation: resolves the sequence of captures
+    on the target square of a capture, each side always recapturing
+    with its least valuable attacker and free to stop at any point
+    
+    @return int material won by the side making the capture
+    '''
+    def see(self, board: Board, move: Move):
+        squares = board.squares
+        target = move.final.row * 8 + move.final.col
+        piece: Piece = squares[move.initial.row][move.initial.col].piece
+        captured: Piece | None = squares[move.final.row][move.final.col].piece
         
-        # Check if the search has reached the maximum depth or a terminal node
-        if depth == 0 or board.is_game_over():
-            return self.evaluate(board)
-
-        # Determine the legal moves for the current player
-        if maximizing_player:
-            legal_moves = board.get_legal_moves()
-            best_value = -float("inf")
+        # A pawn moving diagonally to an empty square captures en passant
+        gains = [self.MATERIAL_VALUES[captured.type] if captured else self.MATERIAL_VALUES[PAWN] if isinstance(piece, Pawn) else 0]
+        
+        # Pieces taken off the board uncover the sliders standing behind them
+        removed = [(move.initial.row, move.initial.col, piece)]
+        squares[move.initial.row][move.initial.col].piece = None
+        
+        on_target = self.MATERIAL_VALUES[piece.type]
+        color = 'black' if piece.color == 'white' else 'white'
+        
+        while True:
+            attackers = board.attackers(color, target)
+            if not attackers:
+                break
             
-            for _, piece in legal_moves.items():
-                print(f'Evaluating {piece.name}@{piece.color} at depth {depth}')
+            attacker, (row, col) = min(attackers, key=lambda item: self.MATERIAL_VALUES[item[0].type])
+            gains.append(on_target - gains[-1])
+            on_target = self.MATERIAL_VALUES[attacker.type]
+            removed.append((row, col, attacker))
+            squares[row][col].piece = None
+            color = 'black' if color == 'white' else 'white'
+        
+        for row, col, removed_piece in removed:
+            squares[row][col].piece = removed_piece
+        
+        # Every side stops capturing as soon as going on would lose material
+        for index in range(len(gains) - 1, 0, -1):
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+        
+        return gains[0]
+    
+    def is_capture(self, board: Board, piece: Piece, move: Move):
+        return board.is_capture_move(move, piece.color) or isinstance(piece, Pawn) and move.initial.col != move.final.col
+    
+    '''
+    Orders the moves of a position: the best move stored in the
+    transposition table, winning and even captures by their
+    exchange value, then quiet moves, then the captures that
+    lose material
+    
+    @return list[tuple[Piece, Move]]
+    '''
+    def order_moves(self, board: Board, legal_moves: dict, hash_move: int | None = None):
+        ordered = []
+        
+        for piece in legal_moves.values():
+            for move in piece.valid_moves:
+                score = self.see(board, move) if self.is_capture(board, piece, move) else None
                 
-                for move in piece.valid_moves:
-                    board.move(piece, move)
-                    value = self.minimax(board, depth - 1, alpha, beta, False)
-                    board.undo_last_move()
-                    
-                    best_value = max(best_value, value)
-                    alpha = max(alpha, best_value)
-                    
-                    if beta <= alpha:
-                        break
+                if hash_move is not None and move.encode() == hash_move:
+                    ordered.append((2 * self.MATERIAL_VALUES[KING], piece, move))
+                elif score is None:
+                    ordered.append((0, piece, move))
+                elif score >= 0:
+                    ordered.append((score + self.MATERIAL_VALUES[KING], piece, move))
+                else:
+                    ordered.append((score - self.MATERIAL_VALUES[KING], piece, move))
+        
+        ordered.sort(key=lambda item: -item[0])
+        return [(piece, move) for _, piece, move in ordered]
+    
+    def check_time(self):
+        self.nodes += 1
+        
+        # Give up once the time or node budget is spent, the caller throws this iteration away
+        if self.abort or self.deadline and time.perf_counter() >= self.deadline or self.max_nodes and self.nodes >= self.max_nodes:
+            self.stopped = True
+        
+        return self.stopped
+    
+    '''
+    Searches captures only until the position is quiet, so the
+    evaluation is never taken in the middle of an exchange.
+    Captures that lose material by SEE are not searched
+    
+    @return int score from the side to move's point of view
+    '''
+    def quiescence(self, board: Board, alpha, beta):
+        if self.check_time():
+            return 0
+        
+        stand_pat = self.evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        
+        alpha = max(alpha, stand_pat)
+        
+        for piece, move in MovePicker(self, board, captures_only=True):
+            board.move(piece, move, testing=True)
+            value = -self.quiescence(board, -beta, -alpha)
+            board.undo_last_move()
+            
+            if self.stopped:
+                return 0
+            
+            if value >= beta:
+                return value
+            
+            alpha = max(alpha, value)
+        
+        return alpha
+    
+    '''
+    Scores the pawn structure from white's point of view: the
+    pawn table plus doubled, isolated, backward and passed pawns.
+    Depends on the pawns alone, which is what lets it be cached
+    
+    @return int
+    '''
+    def evaluate_pawns(self, board: Board):
+        # Rows of the pawns of each color on every file
+        files = {'white': [[] for _ in range(COLS)], 'black': [[] for _ in range(COLS)]}
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board.squares[row][col].piece
                 
-            return best_value
-        else:
-            legal_moves = board.get_legal_moves()
-            best_value = float("inf")
+                if isinstance(piece, Pawn):
+                    files[piece.color][col].append(row)
+        
+        score = 0
+        
+        for color, sign in (('white', 1), ('black', -1)):
+            own = files[color]
+            enemy = files['black' if color == 'white' else 'white']
+            
+            # White pawns move towards row 0, "ahead" means a smaller row for white
+            ahead = (lambda a, b: a < b) if color == 'white' else (lambda a, b: a > b)
+            direction = -1 if color == 'white' else 1
             
-            for _, piece in legal_moves.items():
-                print(f'Evaluating {piece.name}@{piece.color} at depth {depth}')
+            for col in range(COLS):
+                if len(own[col]) > 1:
+                    score -= sign * self.DOUBLED_PAWN_PENALTY * (len(own[col]) - 1)
                 
-                for move in piece.valid_moves:
-                    board.move(piece, move)
-                    value = self.minimax(board, depth - 1, alpha, beta, True)
-                    board.undo_last_move()
+                neighbours = [own[_col] for _col in (col - 1, col + 1) if 0 <= _col < COLS]
+                isolated = not any(neighbours)
+                
+                for row in own[col]:
+                    # The table is laid out for white, black reads it with the ranks flipped
+                    score += sign * self.PAWN_TABLE[row * 8 + col if color == 'white' else (7 - row) * 8 + col]
                     
-                    best_value = min(best_value, value)
-                    beta = min(beta, best_value)
+                    if isolated:
+                        score -= sign * self.ISOLATED_PAWN_PENALTY
                     
-                    if beta <= alpha:
-                        break
-                
-            return best_value
+                    # Passed: no enemy pawn ahead on its own or an adjacent file
+                    if not any(ahead(_row, row) for _col in (col - 1, col, col + 1) if 0 <= _col < COLS for _row in enemy[_col]):
+                        score += sign * self.PASSED_PAWN_BONUS[7 - row if color == 'white' else row]
+                    
+                    # Backward: every neighbour is ahead of it and an enemy pawn guards its stop square
+                    elif not isolated and not any(not ahead(_row, row) for pawns in neighbours for _row in pawns):
+                        guard_row = row + 2 * direction
+                        if any(guard_row in enemy[_col] for _col in (col - 1, col + 1) if 0 <= _col < COLS):
+                            score -= sign * self.BACKWARD_PAWN_PENALTY
+        
+        return score
+    
+    # Implement the negamax form of minimax with alpha-beta pruning, scores are from the side to move's point of view
+    def minimax(self, board: Board, depth, alpha, beta):
+        if self.check_time():
+            return 0
+        
+        # Repetitions and the 50-move rule are draws inside the search tree
+        if board.repetitions() > 1 or board.move_counter >= 100 or board.is_insufficient_material():
+            return 0
+        
+        # Check if the search has reached the maximum depth
+        if depth == 0:
+            return self.quiescence(board, alpha, beta)
+        
+        key = board.hash
+        entry = self.tt.probe(key)
+        hash_move = None
+        
+        if entry is not None:
+            entry_depth, flag, score, hash_move = entry
+            
+            # A result searched at least as deep answers this node when its bound allows
+            if entry_depth >= depth and (flag == EXACT or flag == LOWER and score >= beta or flag == UPPER and score <= alpha):
+                return score
+        
+        ply = min(len(board.history) - self.root_ply, MAX_PLY - 1)
+        original_alpha = alpha
+        best_value = -float("inf")
+        best_move = None
+        
+        for piece, move in MovePicker(self, board, hash_move, self.killers[ply]):
+            board.move(piece, move, testing=True)
+            value = -self.minimax(board, depth - 1, -beta, -alpha)
+            board.undo_last_move()
+            
+            if self.stopped:
+                return 0
+            
+            if value > best_value:
+                best_value = value
+                best_move = move
+            
+            alpha = max(alpha, best_value)
+            
+            if beta <= alpha:
+                if not self.is_capture(board, piece, move):
+                    self.store_killer(ply, move.encode())
+                break
+        
+        # No legal moves: checkmate or stalemate
+        if best_move is None:
+            return -self.CHECKMATE_SCORE if board.is_check() else self.STALEMATE_SCORE
+        
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        
+        self.tt.store(key, depth, flag, best_value, best_move.encode())
+        return best_value
 
+    def store_killer(self, ply, code):
+        killers = self.killers[ply]
+        
+        if killers[0] != code:
+            killers[1:] = killers[:-1]
+            killers[0] = code
+    
+    def clear_killers(self):
+        for killers in self.killers:
+            killers[:] = [None] * KILLER_SLOTS
+    
     # Find the best move using the minimax algorithm with alpha-beta pruning
-    def find_best_move(self, board: Board, depth):
-        print("AI is thinking...")
-        legal_moves = board.get_legal_moves()
-        first_value = next(iter(legal_moves.values()))
-        best_move = (first_value, first_value.valid_moves)
-        best_value = -float("inf")
-        alpha = -float("inf")
-        beta = float("inf")
+    def find_best_move(self, board: Board, depth, time_limit=None):
+        logger.debug("AI is thinking...")
+        self.nodes = 0
+        self.completed_depth = 0
+        self.stopped = False
+        self.clear_killers()
         
-        for _, piece in legal_moves.items():
-            for move in piece.valid_moves:
-                board.move(piece, move)
-                value = self.minimax(board, depth - 1, alpha, beta, False)
-                board.undo_last_move()
-                
-                if value > best_value:
-                    best_value = value
-                    best_move = (piece, move)
-                    
-                alpha = max(alpha, best_value)
-                if beta <= alpha:
-                    break
+        if self.book is not None:
+            best_move = self.legal_move(board, self.book.choose(board.hash, self.random))
+            
+            if best_move is not None:
+                return best_move
+        
+        # A single best move is all the cache keeps, weaker levels pick among several
+        if self.cache is not None and self.multipv == 1:
+            entry = self.cache.probe(board.hash, depth)
+            best_move = self.legal_move(board, entry[2][0]) if entry else None
+            
+            if best_move is not None:
+                self.completed_depth = entry[0]
+                return best_move
+        
+        self.deadline = time.perf_counter() + time_limit if time_limit else None
+        
+        if self.workers > 1:
+            scores = self.search_parallel(board, depth, time_limit)
+        else:
+            scores = self.iterative_deepening(board, depth)
+        
+        self.deadline = None
+        
+        if self.cache is not None and scores and self.completed_depth:
+            value, piece, move = scores[0]
+            pv = [move] + [reply for _, reply in self.principal_variation(board, piece, move, self.completed_depth - 1)]
+            self.cache.store(board.hash, self.completed_depth, value, [move.encode() for move in pv])
+        
+        return self.choose_move(board, scores)
+    
+    '''
+    Deepens one ply at a time and keeps the root scores of the
+    last completed iteration. The best moves each iteration
+    leaves in the transposition table order the next one
+    
+    @return list[tuple[int, Piece, Move]]
+    '''
+    def iterative_deepening(self, board: Board, depth, codes: set | None = None):
+        scores = []
+        
+        for current_depth in range(1, depth + 1):
+            current = self.search_root(board, current_depth, codes)
+            
+            # A partial iteration only counts when no iteration was completed
+            if not self.stopped or not scores:
+                scores = current
+            
+            if not self.stopped:
+                self.completed_depth = current_depth
                 
-        return best_move
+                if self.on_iteration is not None:
+                    self.on_iteration(current_depth, current)
+            
+            if self.stopped:
+                break
+        
+        return scores
+    
+    '''
+    Searches the root moves, best first. Only the best multipv
+    scores are exact, the others are upper bounds
+    
+    @return list[tuple[int, Piece, Move]]
+    '''
+    def search_root(self, board: Board, depth, codes: set | None = None):
+        self.root_ply = len(board.history)
+        moves = self.order_moves(board, board.get_legal_moves(), self.tt.best_move(board.hash))
+        scores = []
+        beta = float("inf")
+        
+        for piece, move in moves:
+            if codes is not None and move.encode() not in codes:
+                continue
+            
+            # A move has to beat the worst of the best multipv moves, not just the best one
+            alpha = scores[self.multipv - 1][0] if len(scores) >= self.multipv else -float("inf")
+            
+            board.move(piece, move, testing=True)
+            value = -self.minimax(board, depth - 1, -beta, -alpha)
+            board.undo_last_move()
+            
+            if self.stopped:
+                break
+            
+            scores.append((value, piece, move))
+            scores.sort(key=lambda score: -score[0])
+        
+        # Only a fully searched root is exact, a share of the moves or a stopped search is not
+        if scores and codes is None and not self.stopped:
+            value, _, move = scores[0]
+            self.tt.store(board.hash, depth, EXACT, value, move.encode())
+        
+        return scores
+    
+    '''
+    Searches a position until it is done or aborted, without a
+    budget of its own: the position the AI expects after its move
+    and the player's reply. Ponder sets a deadline on a ponder hit
+    
+    @return list[tuple[int, Piece, Move]]
+    '''
+    def ponder(self, board: Board, depth):
+        self.nodes = 0
+        self.completed_depth = 0
+        self.stopped = False
+        self.clear_killers()
+        
+        return self.iterative_deepening(board, depth)
+    
+    '''
+    The reply the last search expects from the opponent:
+    the best move stored for the position, if it is legal
+    
+    @return tuple[Piece, Move]|None
+    '''
+    def expected_reply(self, board: Board):
+        return self.legal_move(board, self.tt.best_move(board.hash))
+    
+    '''
+    Follows the best moves stored in the transposition table
+    from the position after a move, for at most length plies
+    
+    @return list[tuple[Piece, Move]]
+    '''
+    def principal_variation(self, board: Board, piece: Piece, move: Move, length):
+        pv = []
+        board.move(piece, move, testing=True)
+        
+        while len(pv) < length:
+            reply = self.expected_reply(board)
+            if reply is None:
+                break
+            
+            pv.append(reply)
+            board.move(*reply, testing=True)
+        
+        for _ in range(len(pv) + 1):
+            board.undo_last_move()
+        
+        return pv
+    
+    '''
+    Turns an encoded move from a table back into a
+    move of the board, if it is legal there
+    
+    @return tuple[Piece, Move]|None
+    '''
+    def legal_move(self, board: Board, code: int | None):
+        if code is None:
+            return None
+        
+        wanted = Move.decode(code)
+        piece = board.squares[wanted.initial.row][wanted.initial.col].piece
+        
+        # Another position may share the table slot
+        if piece is None or piece.color != board.current_player:
+            return None
+        
+        board.calc_moves(piece, wanted.initial.row, wanted.initial.col)
+        for move in piece.valid_moves:
+            if move == wanted:
+                return piece, move
+        
+        return None
+    
+    '''
+    Splits the root moves between the worker processes,
+    each one searching its share with its own budget
+    
+    @return list[tuple[int, Piece, Move]]
+    '''
+    def search_parallel(self, board: Board, depth, time_limit=None):
+        moves = {move.encode(): (piece, move) for piece, move in self.order_moves(board, board.get_legal_moves())}
+        codes = list(moves)
+        workers = min(self.workers, len(codes))
+        weights = self.get_weights()
+        network = self.network.path if self.network else None
+        
+        # Deal the ordered moves out in turn so every worker gets some of the likely best ones
+        position = snapshot.to_bytes(board)
+        history = board.history.records()
+        jobs = [
+            (position, history, codes[index::workers], depth, time_limit, self.max_nodes // workers if self.max_nodes else None, self.multipv, weights, network)
+            for index in range(workers)
+        ]
+        
+        scores = []
+        depths = []
+        for results, nodes, completed_depth in self.get_pool().map(_search_root_moves, jobs):
+            self.nodes += nodes
+            depths.append(completed_depth)
+            scores.extend((value, *moves[code]) for value, code in results)
+        
+        # The scores are only as deep as the shallowest share
+        self.completed_depth = min(depths)
+        
+        scores.sort(key=lambda score: -score[0])
+        return scores
+    
+    '''
+    Picks the move to play among the best multipv moves,
+    adding noise to their scores on the weaker levels
+    
+    @return tuple[Piece, Move]|None
+    '''
+    def choose_move(self, board: Board, scores: list):
+        # The budget ran out before a single root move was searched
+        if not scores:
+            scores = [(0, piece, move) for piece, move in self.order_moves(board, board.get_legal_moves())]
+        
+        if not scores:
+            return None
+        
+        candidates = scores[:self.multipv]
+        if self.noise:
+            _, piece, move = max(candidates, key=lambda score: score[0] + self.random.uniform(-self.noise, self.noise))
+        else:
+            _, piece, move = candidates[0]
+        
+        return piece, move
@@ -0,0 +1,226 @@
+import argparse
+import json
+import sqlite3
+import time
+from array import array
+import pgn
+from ai import AI
+from board import Board
+from const import *
+
+# Default number of positions kept before the least recently used are evicted
+MAX_ENTRIES = 100000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analysis (
+    key INTEGER PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    pv BLOB NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used);
+'''
+
+
+# SQLite integers are signed, Zobrist keys use all 64 bits
+def _signed(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class AnalysisCache:
+    '''
+    Root search results kept in a SQLite file across runs, keyed
+    by the board's Zobrist key: depth searched, score from the side
+    to move's point of view and the principal variation as encoded
+    moves, the best move first. Every lookup and store stamps the
+    entry, past max_entries the least recently used ones are evicted
+    '''
+    
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        if max_entries <= 0:
+            raise ValueError(f'Analysis cache size must be positive, got {max_entries}')
+        
+        self.path = path
+        self.max_entries = max_entries
+        
+        # The game searches in a new thread for every move
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        
+        self.count = self.connection.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+        self.clock = self.connection.execute('SELECT COALESCE(MAX(used), 0) FROM analysis').fetchone()[0]
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def close(self):
+        self.connection.close()
+    
+    def _tick(self):
+        self.clock += 1
+        return self.clock
+    
+    '''
+    Returns the entry of a position searched at least
+    depth plies deep, or None when there is none
+    
+    @return tuple[int, int, list[int]]|None depth, score and principal variation
+    '''
+    def probe(self, key, depth=0):
+        entry = self.entry(key)
+        
+        if entry is None or entry[0] < depth:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.connection.execute('UPDATE analysis SET used = ? WHERE key = ?', (self._tick(), _signed(key)))
+        return entry
+    
+    # Reads an entry without counting a lookup or making it recently used
+    def entry(self, key):
+        row = self.connection.execute('SELECT depth, score, pv FROM analysis WHERE key = ?', (_signed(key),)).fetchone()
+        if row is None:
+            return None
+        
+        depth, score, pv = row
+        return depth, score, list(array('H', pv))
+    
+    def store(self, key, depth, score, pv: list[int]):
+        key = _signed(key)
+        exists = self.connection.execute('SELECT 1 FROM analysis WHERE key = ?', (key,)).fetchone() is not None
+        
+        # A deeper result of the same position is worth more than a newer one
+        self.connection.execute(
+            '''
+            INSERT INTO analysis (key, depth, score, pv, used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET depth = excluded.depth, score = excluded.score, pv = excluded.pv, used = excluded.used
+            WHERE excluded.depth >= analysis.depth
+            ''',
+            (key, depth, score, array('H', pv).tobytes(), self._tick()),
+        )
+        
+        if not exists:
+            self.count += 1
+        
+        if self.count > self.max_entries:
+            self.evict(self.count - self.max_entries)
+    
+    def discard(self, key):
+        if self.connection.execute('DELETE FROM analysis WHERE key = ?', (_signed(key),)).rowcount:
+            self.count -= 1
+    
+    def evict(self, count):
+        self.connection.execute(
+            'DELETE FROM analysis WHERE key IN (SELECT key FROM analysis ORDER BY used LIMIT ?)', (count,)
+        )
+        self.count = self.connection.execute('SELECT COUNT(*) FROM analysis').fetchone()[0]
+    
+    def clear(self):
+        self.connection.execute('DELETE FROM analysis')
+        self.count = 0
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self):
+        probes = self.hits + self.misses
+        
+        return dict(
+            entries=self.count,
+            max_entries=self.max_entries,
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / probes if probes else 0.0,
+        )
+
+
+'''
+Analyzes a position through the cache, a search only
+runs when no entry is at least depth plies deep
+
+@return dict
+'''
+def analyze(ai: AI, board: Board, depth, time_limit=None):
+    start = time.perf_counter()
+    ai.find_best_move(board, depth, time_limit=time_limit)
+    elapsed = time.perf_counter() - start
+    
+    entry = ai.cache.entry(board.hash)
+    if entry is None:
+        return dict(key=f'{board.hash:016x}', depth=0, cached=False, ms=elapsed * 1000)
+    
+    stored_depth, score, codes = entry
+    
+    # Name the moves of the variation while playing them out, up to the first one that is not legal
+    sans = []
+    for code in codes:
+        legal = ai.legal_move(board, code)
+        if legal is None:
+            break
+        
+        piece, move = legal
+        sans.append(pgn.san(board, move))
+        board.move(piece, move, testing=True)
+    
+    for _ in sans:
+        board.undo_last_move()
+    
+    # The entry belongs to another position with the same key, search this one in its place
+    if not sans:
+        ai.cache.discard(board.hash)
+        return analyze(ai, board, depth, time_limit)
+    
+    return dict(
+        key=f'{board.hash:016x}',
+        depth=stored_depth,
+        score=score,
+        best_move=sans[0],
+        pv=sans,
+        # Answered from the cache without visiting a single node
+        cached=ai.nodes == 0,
+        nodes=ai.nodes,
+        ms=elapsed * 1000,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze positions through the persistent analysis cache')
+    parser.add_argument('cache', help='SQLite file, created when missing')
+    parser.add_argument('--fen', nargs='+', default=[STARTING_FEN], help='positions to analyze')
+    parser.add_argument('--moves', nargs='*', help='SAN moves played from every FEN')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, help='seconds per position')
+    parser.add_argument('--max-entries', type=int, default=MAX_ENTRIES, help='positions kept before evicting the least recently used')
+    parser.add_argument('--clear', action='store_true', help='empty the cache first')
+    args = parser.parse_args(argv)
+    
+    cache = AnalysisCache(args.cache, args.max_entries)
+    if args.clear:
+        cache.clear()
+    
+    ai = AI(cache=cache)
+    results = []
+    
+    for fen in args.fen:
+        board = Board()
+        board.load_fen(fen)
+        
+        for text in args.moves or []:
+            board.play(pgn.parse_san(board, text))
+        
+        result = analyze(ai, board, args.depth, args.time_limit)
+        
+        results.append(dict(fen=fen, **result))
+    
+    print(json.dumps(dict(results=results, cache=cache.stats()), indent=2))
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
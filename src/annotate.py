@@ -0,0 +1,304 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import pgn
+from ai import AI
+from board import Board
+from const import *
+from move import Move
+from piece import QUEEN
+
+# Iterations are only cut short by the budget
+MAX_DEPTH = 32
+
+# Eval drops in centipawns, from the mover's point of view, and their NAGs
+JUDGEMENTS = [
+    ('blunder', 300, '$4'),
+    ('mistake', 100, '$2'),
+    ('inaccuracy', 50, '$6'),
+]
+
+# Mate scores are cut down to this, so missing a mate is a blunder and not a drop of 100 pawns
+CLAMP = 1000
+
+COORDINATE = re.compile(r'^([a-h][1-8])([a-h][1-8])([nbrq])?$')
+
+_ai: AI | None = None
+
+
+def _init_worker(weights, network):
+    global _ai
+    
+    _ai = AI()
+    if weights:
+        _ai.load_weights(weights)
+    _ai.load_network(network)
+
+
+'''
+Resolves a move of a move list, in SAN or in coordinate
+notation (e2e4, e7e8q). A coordinate move is turned into a
+fully disambiguated SAN move and checked like one
+
+@return Move
+'''
+def parse_move(board: Board, text: str):
+    match = COORDINATE.match(text)
+    
+    if match:
+        piece = board.squares[ROWS - int(text[1])][ord(text[0]) - ord('a')].piece
+        letter = pgn.LETTERS.get(piece.type, '') if piece else ''
+        text = f'{letter}{match[1]}{match[2]}' + (f'={match[3].upper()}' if match[3] else '')
+    
+    return pgn.parse_san(board, text)
+
+
+'''
+Searches a position of the game with the budget, the table
+is kept from the previous positions
+
+@return tuple[int, Move|None] score from the side to move's point of view and best move
+'''
+def search(ai: AI, board: Board, depth, time_limit):
+    iterations = []
+    ai.on_iteration = lambda current_depth, scores: iterations.append(scores[0]) if scores else None
+    best_move = ai.find_best_move(board, depth, time_limit=time_limit)
+    ai.on_iteration = None
+    
+    # Not even the first iteration fit in the budget
+    if not iterations:
+        return ai.evaluate(board), best_move[1] if best_move else None
+    
+    value, _, move = iterations[-1]
+    return value, move
+
+
+'''
+Score of the move played, searched from the same position
+and as deep as the best move was, so both scores compare.
+The table is warm from the search of the best move
+
+@return int|None score from the side to move's point of view
+'''
+def played_score(ai: AI, board: Board, move: Move):
+    # The search only knows queen promotions by a missing promotion piece
+    code = Move(move.initial, move.final, None if move.promotion == QUEEN else move.promotion).encode()
+    nodes, max_nodes = ai.nodes, ai.max_nodes
+    
+    ai.nodes = 0
+    ai.max_nodes = None
+    ai.stopped = False
+    scores = ai.search_root(board, max(1, ai.completed_depth), {code})
+    
+    ai.nodes += nodes
+    ai.max_nodes = max_nodes
+    return scores[0][0] if scores else None
+
+
+def judgement(drop):
+    for name, threshold, nag in JUDGEMENTS:
+        if drop >= threshold:
+            return name, nag
+    
+    return None, None
+
+
+'''
+Searches every position of a game and judges every move by
+how much worse it leaves the mover than the best move would
+
+@return dict
+'''
+def annotate(job):
+    index, game, depth, time_limit, max_nodes = job
+    ai = _ai
+    board = Board()
+    board.load_fen(game.tags.get('FEN', STARTING_FEN))
+    
+    # One table for the whole game, positions later in it reuse what earlier searches found
+    ai.tt.clear()
+    ai.max_nodes = max_nodes
+    
+    start = time.perf_counter()
+    nodes = 0
+    moves = []
+    error = None
+    
+    try:
+        for text in game.moves:
+            move = parse_move(board, text)
+            white = board.current_player == 'white'
+            
+            best_score, best = search(ai, board, depth, time_limit)
+            
+            # Moves compare equal whatever they promote to, a missing promotion piece is a queen
+            is_best = best == move and (best.promotion or QUEEN) == (move.promotion or QUEEN)
+            score = best_score if is_best else played_score(ai, board, move)
+            nodes += ai.nodes
+            
+            played = pgn.san(board, move)
+            best_san = pgn.san(board, best) if best else None
+            board.play(move)
+            played += pgn.suffix(board)
+            
+            if score is None:
+                drop = 0
+                score = best_score
+            else:
+                drop = max(0, max(-CLAMP, min(CLAMP, best_score)) - max(-CLAMP, min(CLAMP, score)))
+            name, nag = judgement(drop)
+            
+            # Walking into a mate is a blunder however lost the position already was, unless the best move is mated too
+            if score <= -ai.CHECKMATE_SCORE // 2 < best_score:
+                name, nag = judgement(max(drop, JUDGEMENTS[0][1]))
+            
+            moves.append(dict(
+                ply=len(moves) + 1,
+                move=played,
+                best=played if is_best else best_san,
+                # Scores are from white's point of view
+                eval_best=best_score if white else -best_score,
+                eval_played=score if white else -score,
+                drop=drop,
+                judgement=name,
+                nag=nag,
+            ))
+    except ValueError as exception:
+        # An illegal or unreadable move ends the game, the moves before it are kept
+        error = str(exception)
+    
+    elapsed = time.perf_counter() - start
+    
+    return dict(
+        index=index,
+        tags=game.tags,
+        result=game.result,
+        positions=len(moves),
+        nodes=nodes,
+        time=elapsed,
+        moves=moves,
+        error=error,
+        **{name: sum(move['judgement'] == name for move in moves) for name, _, _ in JUDGEMENTS},
+    )
+
+
+'''
+Movetext of an annotated game for pgn.write_game: every judged
+move gets its NAG and a comment with the best move and both scores
+
+@return list[str]
+'''
+def annotated_sans(result: dict):
+    sans = []
+    
+    for move in result['moves']:
+        text = move['move']
+        
+        if move['judgement']:
+            text += (
+                f" {move['nag']} {{{move['judgement'].capitalize()} ({move['eval_played'] / 100:+.2f}). "
+                f"{move['best']} was best ({move['eval_best'] / 100:+.2f})}}"
+            )
+        
+        sans.append(text)
+    
+    return sans
+
+
+def read_input(files, move_lists, fen):
+    for moves in move_lists:
+        tags = {'FEN': fen, 'SetUp': '1'} if fen != STARTING_FEN else {}
+        yield pgn.Game(tags, moves.split())
+    
+    for file in files:
+        yield from pgn.read_games(file)
+
+
+'''
+Annotates games in parallel, each worker keeping one AI
+for the games it is given. Results are yielded in the
+order of the games as soon as they are ready
+
+@return Iterator[dict]
+'''
+def annotate_games(games, depth=MAX_DEPTH, time_limit=None, max_nodes=None, weights=None, network=None, workers=1):
+    jobs = ((index, game, depth, time_limit, max_nodes) for index, game in enumerate(games))
+    
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(weights, network)) as pool:
+        yield from pool.imap(annotate, jobs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find inaccuracies, mistakes and blunders in games')
+    parser.add_argument('input', nargs='*', help='PGN files, stdin when neither these nor --moves are given')
+    parser.add_argument('--moves', action='append', default=[], metavar='MOVES', help='a game as a move list, SAN or coordinates (can be repeated)')
+    parser.add_argument('--fen', default=STARTING_FEN, help='start position of the --moves games')
+    parser.add_argument('--time-limit', type=float, help='seconds per position')
+    parser.add_argument('--nodes', type=int, help='nodes per position')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH, help='deepest iteration')
+    parser.add_argument('--weights', metavar='PATH', help='JSON file of evaluation weights, see tune.py')
+    parser.add_argument('--network', metavar='PATH', help='evaluate with a network file instead, see nnue.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--format', choices=['pgn', 'json'], default='pgn')
+    parser.add_argument('--output', metavar='PATH', help='write to a file instead of stdout')
+    args = parser.parse_args(argv)
+    
+    if args.time_limit is None and args.nodes is None and args.depth == MAX_DEPTH:
+        parser.error('set a budget with --time-limit, --nodes or --depth')
+    
+    files = [open(path) for path in args.input] or ([] if args.moves else [sys.stdin])
+    output = open(args.output, 'w') if args.output else sys.stdout
+    
+    start = time.perf_counter()
+    results = []
+    positions = 0
+    errors = 0
+    
+    for result in annotate_games(read_input(files, args.moves, args.fen), args.depth, args.time_limit, args.nodes, args.weights, args.network, args.workers):
+        positions += result['positions']
+        
+        print(
+            f"game {result['index'] + 1}: {result['positions']} positions in {result['time']:.1f}s, "
+            f"{result['inaccuracy']} inaccuracies, {result['mistake']} mistakes, {result['blunder']} blunders",
+            file=sys.stderr
+        )
+        
+        if result['error']:
+            errors += 1
+            print(f"game {result['index'] + 1}: stopped after ply {result['positions']}, {result['error']}", file=sys.stderr)
+        
+        # Games are written as they come, only the JSON report keeps them all
+        if args.format == 'pgn':
+            # The moves of a broken game stop before its end, so its result is left open
+            pgn.write_game(output, result['tags'], annotated_sans(result), '*' if result['error'] else result['result'])
+            output.write('\n')
+        else:
+            results.append(result)
+    
+    elapsed = time.perf_counter() - start
+    
+    if args.format == 'json':
+        json.dump(dict(
+            games=len(results),
+            errors=errors,
+            positions=positions,
+            time=elapsed,
+            positions_per_second=positions / elapsed if elapsed else 0.0,
+            results=results,
+        ), output, indent=2)
+        output.write('\n')
+    
+    for file in files:
+        file.close()
+    if args.output:
+        output.close()
+    
+    print(f'{positions} positions in {elapsed:.1f}s, {positions / elapsed if elapsed else 0:.1f} positions/s, {errors} broken games', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import pygame
+from piece import Piece
+
+# Sizes the piece images ship in, in pixels
+SOURCE_SIZES = [80, 128]
+
+# Layout of an atlas: a row per color, a column per piece
+COLORS = ['white', 'black']
+NAMES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+
+
+# Size of a piece standing on a square, 80px on the default 100px squares
+def piece_size(sqsize):
+    return sqsize * 4 // 5
+
+
+# Size of a dragged piece, 128px on the default 100px squares
+def drag_size(sqsize):
+    return sqsize * 32 // 25
+
+
+class TextureAtlas:
+    '''
+    All piece images of one size on a single surface, every
+    piece drawn through a subsurface of it. Sizes that do not
+    ship are smooth-scaled once from the nearest larger atlas,
+    so drawing a frame never touches the disk
+    '''
+    
+    def __init__(self, directory=os.path.join('assets/images')):
+        self.directory = directory
+        self.atlases: dict[int, pygame.Surface] = {}
+        self.sprites: dict[tuple[int, str, str], pygame.Surface] = {}
+    
+    def _load(self, size):
+        atlas = pygame.Surface((size * len(NAMES), size * len(COLORS)), pygame.SRCALPHA)
+        
+        for row, color in enumerate(COLORS):
+            for col, name in enumerate(NAMES):
+                image = pygame.image.load(os.path.join(self.directory, f'imgs-{size}px', f'{color}_{name}.png'))
+                atlas.blit(image, (col * size, row * size))
+        
+        return atlas
+    
+    '''
+    Returns the atlas of a size, building it the first time
+    
+    @return pygame.Surface
+    '''
+    def atlas(self, size):
+        if size not in self.atlases:
+            if size in SOURCE_SIZES:
+                atlas = self._load(size)
+            else:
+                # Scaling down from a larger image keeps the edges sharp
+                source = min((source for source in SOURCE_SIZES if source >= size), default=max(SOURCE_SIZES))
+                atlas = pygame.transform.smoothscale(self.atlas(source), (size * len(NAMES), size * len(COLORS)))
+            
+            # Match the display's pixel format once there is a display
+            if pygame.display.get_surface() is not None:
+                atlas = atlas.convert_alpha()
+            
+            self.atlases[size] = atlas
+        
+        return self.atlases[size]
+    
+    '''
+    Returns the image of a piece at a size
+    
+    @return pygame.Surface
+    '''
+    def sprite(self, piece: Piece, size):
+        key = (size, piece.color, piece.name)
+        sprite = self.sprites.get(key)
+        
+        if sprite is None:
+            row, col = COLORS.index(piece.color), NAMES.index(piece.name)
+            sprite = self.atlas(size).subsurface((col * size, row * size, size, size))
+            self.sprites[key] = sprite
+        
+        return sprite
+    
+    def preload(self, *sizes):
+        for size in sizes:
+            self.atlas(size)
@@ -0,0 +1,62 @@
+from const import *
+
+# Precomputed attack tables, all squares given as (row, col)
+#
+# Attacks are symmetric for knights, kings and sliders, so the same
+# tables answer "where does a piece on X attack" and "where would a
+# piece attacking X stand". Pawns are the exception, see PAWN_ATTACKERS
+
+KNIGHT_OFFSETS = [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)]
+KING_OFFSETS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+ORTHOGONAL = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+DIAGONAL = [(-1, 1), (-1, -1), (1, 1), (1, -1)]
+
+
+def _in_range(row, col):
+    return 0 <= row < ROWS and 0 <= col < COLS
+
+
+def _leaper(offsets):
+    return [
+        [(row + row_incr, col + col_incr) for row_incr, col_incr in offsets if _in_range(row + row_incr, col + col_incr)]
+        for row in range(ROWS) for col in range(COLS)
+    ]
+
+
+def _rays(directions):
+    rays = []
+    
+    for row in range(ROWS):
+        for col in range(COLS):
+            square_rays = []
+            
+            for row_incr, col_incr in directions:
+                ray = []
+                _row, _col = row + row_incr, col + col_incr
+                
+                while _in_range(_row, _col):
+                    ray.append((_row, _col))
+                    _row, _col = _row + row_incr, _col + col_incr
+                
+                if ray:
+                    square_rays.append(ray)
+            
+            rays.append(square_rays)
+    
+    return rays
+
+
+# KNIGHT_ATTACKS[square], KING_ATTACKS[square]
+KNIGHT_ATTACKS = _leaper(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper(KING_OFFSETS)
+
+# Rays leaving a square, nearest square first: ROOK_RAYS[square][direction]
+ROOK_RAYS = _rays(ORTHOGONAL)
+BISHOP_RAYS = _rays(DIAGONAL)
+
+# Squares a pawn of a color has to stand on to attack a square: PAWN_ATTACKERS[color][square]
+# White pawns capture towards row 0, so they attack from the row below
+PAWN_ATTACKERS = {
+    'white': _leaper([(1, -1), (1, 1)]),
+    'black': _leaper([(-1, -1), (-1, 1)]),
+}
@@ -0,0 +1,422 @@
+import argparse
+import copy
+import cProfile
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import snapshot
+from collections import Counter
+from ai import AI
+from pawns import PAWN_TABLE_SIZE
+from transposition import TT_SIZE
+from board import Board
+from const import *
+from piece import Piece
+
+# Fixed position set, keep these stable so results stay comparable across commits
+POSITIONS = {
+    'startpos': 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'italian': 'r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'middlegame': 'r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 10',
+    'endgame': '8/5pk1/6p1/8/3R4/6P1/5PKP/3r4 w - - 0 40',
+}
+
+BENCHMARKS = ['calc_moves', 'move', 'undo', 'evaluate', 'nnue', 'snapshot', 'search']
+
+# Startup paths timed in a fresh interpreter: the rules and engine
+# alone, and the game up to its first drawn frame
+STARTUP = {
+    'engine': '''
+from ai import AI
+from board import Board
+AI().find_best_move(Board(), 1)
+''',
+    'ui': '''
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+from main import Main
+main = Main()
+main.game.show_bg(main.screen, main.chess_board)
+main.game.show_pieces(main.screen, main.chess_board)
+''',
+}
+
+STARTUP_SCRIPT = '''
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, 'src')
+{code}
+print(json.dumps(dict(setup_time=time.perf_counter() - start, pygame='pygame' in sys.modules)))
+'''
+
+
+class StackSampler:
+    '''
+    Samples the call stack of a thread at a fixed
+    interval and aggregates the samples in the
+    collapsed format used by flamegraph.pl
+    '''
+    
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._running = False
+        self._thread = None
+    
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._running = False
+        
+        if self._thread:
+            self._thread.join()
+    
+    def _sample(self):
+        while self._running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            
+            time.sleep(self.interval)
+    
+    def write(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class Bench:
+    
+    def __init__(self, iterations=3, trace_memory=True, pawn_table_size=PAWN_TABLE_SIZE, tt_size=TT_SIZE, network=None):
+        self.iterations = iterations
+        self.trace_memory = trace_memory
+        self.ai = AI(pawn_table_size, tt_size)
+        
+        # Network file of the nnue benchmark, a material-only network when not given
+        self.network_path = network
+        self.network = None
+    
+    def board(self, fen):
+        board = Board()
+        board.load_fen(fen)
+        return board
+    
+    def legal_moves(self, board: Board):
+        moves = []
+        
+        for _, piece in board.get_legal_moves().items():
+            for move in piece.valid_moves:
+                moves.append(move)
+            piece.clear_valid_moves()
+        
+        return moves
+    
+    '''
+    Runs every case of a benchmark, each case returns
+    the amount of work it has done (moves, nodes, evals)
+    
+    @return dict
+    '''
+    def measure(self, case, iterations):
+        count = 0
+        timer = 0.0
+        
+        for _ in range(iterations):
+            work, elapsed = case()
+            count += work
+            timer += elapsed
+        
+        peak = None
+        if self.trace_memory:
+            tracemalloc.start()
+            case()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        
+        return dict(
+            iterations=iterations,
+            count=count,
+            wall_time=timer,
+            per_iteration=timer / iterations if iterations else 0.0,
+            rate=count / timer if timer > 0 else 0.0,
+            peak_memory=peak,
+        )
+    
+    def calc_moves(self, board: Board):
+        def case():
+            count = 0
+            start = time.perf_counter()
+            
+            for row in range(ROWS):
+                for col in range(COLS):
+                    square = board.squares[row][col]
+                    
+                    if square.has_team_piece(board.current_player):
+                        piece: Piece = square.piece
+                        piece.clear_valid_moves()
+                        board.calc_moves(piece, row, col)
+                        count += len(piece.valid_moves)
+                        piece.clear_valid_moves()
+            
+            return count, time.perf_counter() - start
+        
+        return self.measure(case, self.iterations)
+    
+    def make_unmake(self, board: Board, timed):
+        moves = self.legal_moves(board)
+        
+        def case():
+            elapsed = 0.0
+            
+            for move in moves:
+                piece = board.squares[move.initial.row][move.initial.col].piece
+                
+                start = time.perf_counter()
+                board.move(piece, move)
+                if timed == 'move': elapsed += time.perf_counter() - start
+                
+                start = time.perf_counter()
+                board.undo_last_move()
+                if timed == 'undo': elapsed += time.perf_counter() - start
+            
+            return len(moves), elapsed
+        
+        return self.measure(case, self.iterations)
+    
+    def evaluate(self, board: Board):
+        def case():
+            start = time.perf_counter()
+            self.ai.evaluate(board)
+            return 1, time.perf_counter() - start
+        
+        return self.measure(case, self.iterations)
+    
+    '''
+    Evaluates every position one move away with the network and
+    with the hand-written terms. Moves and undos are timed in both,
+    they are what keeps the network's accumulator up to date
+    
+    @return dict evals per second of the network, the classic evaluator's alongside
+    '''
+    def nnue(self, board: Board):
+        if self.network is None:
+            from nnue import Network, material_network
+            self.network = Network(self.network_path) if self.network_path else material_network()
+        
+        moves = self.legal_moves(board)
+        
+        def case(evaluate):
+            def run():
+                start = time.perf_counter()
+                
+                for move in moves:
+                    board.move(board.squares[move.initial.row][move.initial.col].piece, move, testing=True)
+                    evaluate(board)
+                    board.undo_last_move()
+                
+                return len(moves), time.perf_counter() - start
+            
+            return run
+        
+        result = self.measure(case(self.network.evaluate), self.iterations)
+        classic = self.measure(case(self.ai.evaluate), self.iterations)
+        result['classic_rate'] = classic['rate']
+        result['speedup'] = result['rate'] / classic['rate'] if classic['rate'] else None
+        return result
+    
+    # Copies of the board the AI searches on, deepcopy's rate alongside
+    def snapshot(self, board: Board):
+        def case(copy_board):
+            def run():
+                start = time.perf_counter()
+                copy_board(board)
+                return 1, time.perf_counter() - start
+            
+            return run
+        
+        result = self.measure(case(snapshot.copy), self.iterations)
+        result['deepcopy_rate'] = self.measure(case(copy.deepcopy), self.iterations)['rate']
+        return result
+    
+    def search(self, board: Board, depth):
+        def case():
+            start = time.perf_counter()
+            self.ai.find_best_move(board, depth)
+            return self.ai.nodes, time.perf_counter() - start
+        
+        # Every search starts with empty tables so hit rates are comparable
+        self.ai.pawn_table.clear()
+        self.ai.tt.clear()
+        result = self.measure(case, 1)
+        result['pawn_table'] = self.ai.pawn_table.stats()
+        result['tt'] = self.ai.tt.stats()
+        return result
+    
+    '''
+    Starts a fresh interpreter for a startup path, the wall
+    time includes the interpreter's own startup, setup_time
+    only the imports and objects of the path
+    
+    @return dict
+    '''
+    def startup(self, path):
+        script = STARTUP_SCRIPT.format(code=STARTUP[path])
+        timer = 0.0
+        setup_time = 0.0
+        
+        for _ in range(self.iterations):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+            timer += time.perf_counter() - start
+            
+            child = json.loads(output.strip().splitlines()[-1])
+            setup_time += child['setup_time']
+        
+        return dict(
+            iterations=self.iterations,
+            count=self.iterations,
+            wall_time=timer,
+            per_iteration=timer / self.iterations,
+            rate=self.iterations / timer if timer > 0 else 0.0,
+            peak_memory=None,
+            setup_time=setup_time / self.iterations,
+            pygame=child['pygame'],
+        )
+    
+    def run(self, positions, benchmarks, depths):
+        for name in positions:
+            fen = POSITIONS[name]
+            
+            for benchmark in benchmarks:
+                runs = [(depth, ) for depth in depths] if benchmark == 'search' else [()]
+                
+                for args in runs:
+                    board = self.board(fen)
+                    
+                    if benchmark == 'calc_moves':
+                        result = self.calc_moves(board)
+                    elif benchmark in ('move', 'undo'):
+                        result = self.make_unmake(board, benchmark)
+                    elif benchmark == 'evaluate':
+                        result = self.evaluate(board)
+                    elif benchmark == 'nnue':
+                        result = self.nnue(board)
+                    elif benchmark == 'snapshot':
+                        result = self.snapshot(board)
+                    else:
+                        result = self.search(board, *args)
+                    
+                    yield dict(position=name, benchmark=benchmark, depth=args[0] if args else None, **result)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    
+    previous = {(r['position'], r['benchmark'], r['depth']): r for r in baseline['results']}
+    
+    for result in results:
+        old = previous.get((result['position'], result['benchmark'], result['depth']))
+        
+        if old and result['rate'] and old['rate']:
+            print(f"{result['position']:>12} {result['benchmark']:>10} rate x{result['rate'] / old['rate']:.2f}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of Board and AI')
+    parser.add_argument('--positions', nargs='+', default=list(POSITIONS), choices=list(POSITIONS))
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument('--depths', nargs='+', type=int, default=[1])
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--pawn-table', type=int, default=PAWN_TABLE_SIZE, help='pawn structure cache entries, a power of two')
+    parser.add_argument('--tt', type=int, default=TT_SIZE, help='transposition table entries, a power of two')
+    parser.add_argument('--network', metavar='PATH', help='network file of the nnue benchmark, see nnue.py')
+    parser.add_argument('--startup', nargs='*', choices=list(STARTUP), help='also time the startup of these paths (default: all)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--profile', metavar='PATH', help='write a cProfile/pstats dump')
+    parser.add_argument('--collapsed', metavar='PATH', help='write flamegraph-compatible collapsed stacks')
+    parser.add_argument('--interval', type=float, default=0.001, help='stack sampling interval in seconds')
+    parser.add_argument('--output', metavar='PATH', help='write JSON results to a file instead of stdout')
+    parser.add_argument('--compare', metavar='PATH', help='print rate ratios against a previous JSON run')
+    args = parser.parse_args(argv)
+    
+    bench = Bench(iterations=args.iterations, trace_memory=not args.no_memory, pawn_table_size=args.pawn_table, tt_size=args.tt, network=args.network)
+    profiler = cProfile.Profile() if args.profile else None
+    sampler = StackSampler(threading.get_ident(), args.interval) if args.collapsed else None
+    results = []
+    
+    if profiler: profiler.enable()
+    if sampler: sampler.start()
+    
+    for result in bench.run(args.positions, args.benchmarks, args.depths):
+        results.append(result)
+        print(f"{result['position']:>12} {result['benchmark']:>10} {result['wall_time']:.4f}s {result['rate']:.1f}/s", file=sys.stderr)
+    
+    if args.startup is not None:
+        for path in args.startup or list(STARTUP):
+            result = dict(position=path, benchmark='startup', depth=None, **bench.startup(path))
+            results.append(result)
+            print(f"{path:>12} {'startup':>10} {result['per_iteration']:.4f}s pygame={result['pygame']}", file=sys.stderr)
+    
+    if sampler:
+        sampler.stop()
+        sampler.write(args.collapsed)
+    
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    
+    report = dict(
+        revision=git_revision(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        config=dict(
+            positions=args.positions,
+            benchmarks=args.benchmarks,
+            depths=args.depths,
+            startup=args.startup,
+            iterations=args.iterations,
+        ),
+        results=results,
+    )
+    
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
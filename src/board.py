@@ -1,12 +1,25 @@
-import copy
-import os
+import logging
 import state
+import zobrist
+import attacks
 from typing import Type
 from const import *
 from piece import *
-from sound import Sound
 from square import Square
-from move import Move
+from move import Move, PROMOTION_CODES
+from undo import *
+
+# Castling rights lost when a piece moves from or to a square: the
+# kings' and rooks' home squares (bits as in Board.castling_rights())
+CASTLING_CLEARS = [0] * 64
+CASTLING_CLEARS[60] = 0b0011
+CASTLING_CLEARS[63] = 0b0001
+CASTLING_CLEARS[56] = 0b0010
+CASTLING_CLEARS[4] = 0b1100
+CASTLING_CLEARS[7] = 0b0100
+CASTLING_CLEARS[0] = 0b1000
+
+logger = logging.getLogger(__name__)
 
 class Board:
     
@@ -19,18 +32,32 @@ class Board:
         self.winner = ''
         self.score = 0
         
-        self.positions: list[str] = []
-        self.last_moves: list[dict] = []
+        self.history = UndoStack()
         self.move_counter: int = 0
+        self.start_fen = STARTING_FEN
+        
+        # Castling rights mask and en passant target square, kept up to date by move()
+        self.castling_mask = 0b1111
+        self.en_passant_square: int | None = None
         
         self._create()
         self._add_pieces('white')
         self._add_pieces('black')
+        self._locate_kings()
+        
+        # Zobrist keys of the current position and of its pawns alone, updated incrementally
+        self.hash = self.zobrist_key()
+        self.pawn_hash = self.pawn_key()
         
-        print(f"Initial State: {self.generate_fen()}")
-        coords = [(move // 8, move % 8) for move in list(self.get_legal_moves())]
-        print(coords)
+        # Network evaluator state, updated on every move and undo once an evaluator attached it, see nnue.py
+        self.accumulator = None
         
+    # The accumulator belongs to the evaluator of this board, copies and pickles start without one
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['accumulator'] = None
+        return state
+    
     '''
     Generates FEN string of the board's
     current state
@@ -73,6 +100,167 @@ class Board:
         fen = fen.removesuffix("/")
         return fen
     
+    '''
+    Loads a position from a FEN string,
+    replacing every piece on the board
+    
+    @return None
+    '''
+    def load_fen(self, fen: str):
+        fields = fen.split()
+        placement = fields[0]
+        side = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        halfmove = fields[4] if len(fields) > 4 else '0'
+        
+        pieces = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+        
+        self._create()
+        
+        for row, rank in enumerate(placement.split('/')):
+            col = 0
+            
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                
+                color = 'white' if char.isupper() else 'black'
+                piece: Piece = pieces[char.lower()](color, original_position=dict(row=row, col=col))
+                self.squares[row][col] = Square(row, col, piece)
+                col += 1
+        
+        # Kings and rooks only keep their unmoved state if they still have castling rights
+        rights = {
+            'K': (7, 7), 'Q': (7, 0),
+            'k': (0, 7), 'q': (0, 0)
+        }
+        unmoved = set()
+        for right, (row, rook_col) in rights.items():
+            if right in castling:
+                unmoved.add((row, 4))
+                unmoved.add((row, rook_col))
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                
+                if piece is None:
+                    continue
+                
+                if isinstance(piece, Pawn):
+                    piece.moved = row != (6 if piece.color == 'white' else 1)
+                elif isinstance(piece, (King, Rook)):
+                    piece.moved = (row, col) not in unmoved
+                else:
+                    piece.moved = True
+                
+                piece.current_position = dict(row=row, col=col)
+                
+                if piece.moved:
+                    piece.original_position = dict(row=None, col=None)
+        
+        self._locate_kings()
+        
+        self.castling_mask = 0
+        for bit, (row, rook_col, color) in enumerate([(7, 7, 'white'), (7, 0, 'white'), (0, 7, 'black'), (0, 0, 'black')]):
+            king = self.squares[row][4].piece
+            rook = self.squares[row][rook_col].piece
+            
+            if isinstance(king, King) and isinstance(rook, Rook) and king.color == color and rook.color == color \
+                and not king.moved and not rook.moved:
+                self.castling_mask |= 1 << bit
+        
+        # The en passant target square sits behind the pawn that just made a double step
+        self.en_passant_square = None
+        if en_passant != '-':
+            self.en_passant_square = (ROWS - int(en_passant[1])) * 8 + ord(en_passant[0]) - ord('a')
+        
+        self.current_player = 'white' if side == 'w' else 'black'
+        self.state = state.STATE_INITIAL
+        self.last_move = None
+        self.winner = ''
+        self.history.clear()
+        self.move_counter = int(halfmove)
+        self.start_fen = fen
+        self.hash = self.zobrist_key()
+        self.pawn_hash = self.pawn_key()
+    
+    '''
+    Returns the castling rights as a 4-bit mask: white king side,
+    white queen side, black king side, black queen side
+    
+    @return int
+    '''
+    def castling_rights(self):
+        return self.castling_mask
+    
+    '''
+    Returns the file of the pawn that can be captured en passant,
+    only if a pawn of the side to move can actually capture it
+    
+    @return int|None
+    '''
+    def en_passant_file(self):
+        if self.en_passant_square is None:
+            return None
+        
+        row = 3 if self.current_player == 'white' else 4
+        col = self.en_passant_square % 8
+        
+        for _col in (col - 1, col + 1):
+            if Square.in_range(_col):
+                capturer = self.squares[row][_col].piece
+                
+                if isinstance(capturer, Pawn) and capturer.color == self.current_player:
+                    return col
+        
+        return None
+    
+    '''
+    Computes the Zobrist key of the current position
+    
+    @return int
+    '''
+    def zobrist_key(self):
+        key = 0
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                
+                if piece is not None:
+                    key ^= zobrist.piece_key(piece, row * 8 + col)
+        
+        if self.current_player == 'black':
+            key ^= zobrist.SIDE_KEY
+        
+        key ^= zobrist.CASTLING_MASK_KEYS[self.castling_mask]
+        return key ^ self.en_passant_key()
+    
+    '''
+    Computes the Zobrist key of the pawns alone, the
+    key of the pawn structure cache
+    
+    @return int
+    '''
+    def pawn_key(self):
+        key = 0
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                
+                if isinstance(piece, Pawn):
+                    key ^= zobrist.piece_key(piece, row * 8 + col)
+        
+        return key
+    
+    def en_passant_key(self):
+        en_passant_file = self.en_passant_file()
+        return 0 if en_passant_file is None else zobrist.EN_PASSANT_KEYS[en_passant_file]
+    
     """Returns a dictionary mapping each square on the board to the piece
     currently occupying that square.
     """
@@ -109,7 +297,6 @@ class Board:
         return (7 - file) + (rank * 8)
     
     def get_legal_moves(self, color = None):
-        temp_board = copy.deepcopy(self)
         legal_moves = {}
 
         for row in range(ROWS):
@@ -118,7 +305,7 @@ class Board:
                 
                 if square.has_team_piece(self.current_player if color == None else color):
                     piece: Piece = square.piece 
-                    temp_board.calc_moves(piece, row, col)
+                    self.calc_moves(piece, row, col)
                     
                     if len(piece.valid_moves) > 0:
                         legal_moves[row * 8 + col] = piece
@@ -129,14 +316,17 @@ class Board:
         return self.squares[move.final.row][move.final.col].has_enemy_piece(color) 
     
     def king(self, color):
+        return self.king_squares[color]
+    
+    def _locate_kings(self):
+        self.king_squares: dict[str, int | None] = {'white': None, 'black': None}
+        
         for row in range(ROWS):
             for col in range(COLS):
-                square = self.squares[row][col]
-                
-                if square.has_piece() and isinstance(square.piece, King) and square.piece.color == color:
-                    return row * 8 + col
+                piece = self.squares[row][col].piece
                 
-        return None
+                if isinstance(piece, King):
+                    self.king_squares[piece.color] = row * 8 + col
     
     def is_game_over(self):
         if self.is_checkmate(color='white') or self.is_checkmate(color='black'):
@@ -197,170 +387,258 @@ class Board:
         return pieces
         
     '''
-    Undo last move played
-    on the board
+    Undo last move played on the board,
+    restoring everything from its undo record
     
     @return None
     '''
     def undo_last_move(self):
-        # Set the recent move as the current last_move
-        if len(self.last_moves) > 0:
-            # If the move_counter is greater than 0, decrement 1
-            if self.move_counter > 0:
-                self.move_counter -= 1
-                
-            # If positions has entries, pop the most recent position
-            if len(self.positions) > 0:
-                self.positions.pop()
-            
-            recent_move = self.last_moves.pop()
-            
-            is_castling: bool = recent_move.get('castling', False)
-            is_en_passant: bool = recent_move.get('en_passant', False)
-            captured_piece: Piece | None = recent_move.get('captured_piece', None)
-            is_capture_move: bool = recent_move.get('is_capture_move', False)
-            
-            last_move: Move = recent_move.get('move')
-            last_piece: Piece = recent_move.get('piece')
-            
-            last_piece_row = last_piece.original_position.get('row')
-            last_piece_col = last_piece.original_position.get('col')
-            
-            # If the previous move has captured a piece, return the captured piece to the board
-            if is_capture_move:
-                # If the previous move was an en passant move, return its captured piece to the board
-                if is_en_passant:
-                    self.squares[last_move.initial.row][last_move.initial.col].piece = None
-                    self.squares[captured_piece.en_passant_capture_location.get('row')][captured_piece.en_passant_capture_location.get('col')].piece = captured_piece
-                else:
-                    self.squares[last_move.initial.row][last_move.initial.col].piece = captured_piece
-            
-            # If the previous location of the piece was its original location, reset its "moved" state to False
-            if last_piece_row == last_move.final.row and last_piece_col == last_move.final.col:
-                last_piece.moved = False
-            
-            # If the previous move was a castling move, recursively call @self.undo_last_move()
-            # because castling has 2 moves, First is the king, next is the rook  
-            if is_castling:
-                self.undo_last_move()
-            
-            self.move(last_piece, last_move, revertMove=True, capture_move=is_capture_move)
-            self.last_move = self.last_moves[-1].get('move') if len(self.last_moves) > 0 else None
+        if len(self.history) == 0:
+            logger.info('No saved moves to undo')
+            return
+        
+        index = self.history.pop()
+        info = self.history.info[index]
+        piece: Piece = self.history.pieces[index]
+        captured_piece: Piece | None = self.history.captured[index]
+        
+        initial_row, initial_col = divmod(info & 63, 8)
+        final_row, final_col = divmod((info >> 6) & 63, 8)
+        
+        # Put the moving piece back, a promoted pawn replaces its promotion piece
+        self.squares[final_row][final_col].piece = None
+        self.squares[initial_row][initial_col].piece = piece
+        piece.moved = bool(info & MOVED_FLAG)
+        piece.current_position = dict(row=initial_row, col=initial_col)
+        
+        if isinstance(piece, King):
+            self.king_squares[piece.color] = info & 63
+        
+        # An en passant capture took the pawn beside the moving pawn
+        if info & EN_PASSANT_FLAG:
+            self.squares[initial_row][final_col].piece = captured_piece
         else:
-            print('No saved moves to undo')
+            self.squares[final_row][final_col].piece = captured_piece
         
-    def move(self, piece: Piece, move: Move, revertMove=False, capture_move=False, testing=False):
+        if info & CASTLING_FLAG:
+            rook_col, rook_final_col = (0, 3) if final_col < initial_col else (7, 5)
+            rook: Piece = self.squares[initial_row][rook_final_col].piece
+            self.squares[initial_row][rook_final_col].piece = None
+            self.squares[initial_row][rook_col].piece = rook
+            rook.moved = False
+            rook.current_position = dict(row=initial_row, col=rook_col)
+        
+        en_passant_square = (info >> EN_PASSANT_SHIFT) & 127
+        
+        self.castling_mask = (info >> CASTLING_SHIFT) & 15
+        self.en_passant_square = None if en_passant_square == NO_SQUARE else en_passant_square
+        self.move_counter = (info >> HALFMOVE_SHIFT) & 0xFFFF
+        self.state = (info >> STATE_SHIFT) & 15
+        self.hash = self.history.keys[index]
+        self.pawn_hash = self.history.pawn_keys[index]
+        self.current_player = 'black' if self.current_player == 'white' else 'white'
+        self.last_move = Move.decode(self.history.move_code(index - 1)) if index > 0 else None
+        
+        if self.accumulator is not None:
+            self.accumulator.pop()
+    
+    def move(self, piece: Piece, move: Move, testing=False):
         # Check if the pieces are not insufficient
-        if not testing and not revertMove:
+        if not testing:
             # If pieces are insufficient, do not make a move
             if self.is_insufficient_material():
-                print("Insufficient Material, The game is a Draw.")
+                logger.info("Insufficient Material, The game is a Draw.")
                 return
         
         initial = move.initial
         final = move.final
+        initial_square = initial.row * 8 + initial.col
+        final_square = final.row * 8 + final.col
+        
+        captured_piece: Piece | None = self.squares[final.row][final.col].piece
+        is_castling = isinstance(piece, King) and self.castling(initial, final)
+        promotion: int | None = None
         
-        en_passant_empty = self.squares[final.row][final.col].isempty()
-        is_en_passant = False
+        # Everything the move changes goes into a single undo record
+        info = (piece_code(captured_piece) << CAPTURED_SHIFT) \
+            | (self.castling_mask << CASTLING_SHIFT) \
+            | ((NO_SQUARE if self.en_passant_square is None else self.en_passant_square) << EN_PASSANT_SHIFT) \
+            | (min(self.move_counter, 0xFFFF) << HALFMOVE_SHIFT) \
+            | (self.state << STATE_SHIFT)
         
-        captured_piece: Piece | None = None
-        is_capture_move: bool = False
+        if piece.moved: info |= MOVED_FLAG
+        if is_castling: info |= CASTLING_FLAG
         
-        # If the target square has an enemy piece, save the enemy piece for reverting this move
-        if self.squares[final.row][final.col].has_enemy_piece(piece.color):
-            self.move_counter = 0 # Reset move counter for 50-move rule
-            captured_piece: Piece = self.squares[final.row][final.col].piece
-            is_capture_move = True
+        key = self.hash ^ self.en_passant_key() ^ zobrist.piece_key(piece, initial_square)
+        pawn_key = self.pawn_hash
+        if captured_piece is not None:
+            key ^= zobrist.piece_key(captured_piece, final_square)
+            
+            if isinstance(captured_piece, Pawn):
+                pawn_key ^= zobrist.piece_key(captured_piece, final_square)
         
-        # Only remove the piece from previous location if it is not a capture_move or we don't want to revertMove
-        if not capture_move or not revertMove:
-            self.squares[initial.row][initial.col].piece = None
+        self.squares[initial.row][initial.col].piece = None
         self.squares[final.row][final.col].piece = piece
+        self.en_passant_square = None
         
         # Pawn Promotion and en passant
-        if isinstance(piece, Pawn) and not revertMove:
-            # Reset move counter for 50-move rule
-            self.move_counter = 0
-            
-           # en passant capture
+        if isinstance(piece, Pawn):
             diff = final.col - initial.col
             
-            if diff != 0 and en_passant_empty:
-                captured_piece: Pawn = self.squares[initial.row][initial.col + diff].piece
-                captured_piece.en_passant_capture_location = dict(row=initial.row, col=initial.col + diff)
-                is_capture_move = True
-                is_en_passant = True
+            # en passant capture
+            if diff != 0 and captured_piece is None:
+                captured_piece = self.squares[initial.row][final.col].piece
+                info |= EN_PASSANT_FLAG | (piece_code(captured_piece) << CAPTURED_SHIFT)
+                key ^= zobrist.piece_key(captured_piece, initial.row * 8 + final.col)
+                pawn_key ^= zobrist.piece_key(captured_piece, initial.row * 8 + final.col)
                 
                 # console board move update
-                self.squares[initial.row][initial.col + diff].piece = None
-                self.squares[final.row][final.col].piece = piece
-                if not testing:
-                    sound = Sound(
-                        os.path.join('assets/sounds/capture.wav'))
-                    sound.play()
+                self.squares[initial.row][final.col].piece = None
             else:
-                self.check_promotion(piece, final)
+                promotion = self.check_promotion(piece, final, move.promotion)
+            
+            pawn_key ^= zobrist.piece_key(piece, initial_square)
+            if promotion is None:
+                pawn_key ^= zobrist.piece_key(piece, final_square)
+            
+            # Only a pawn that has just made a double step can be captured en passant
+            if self.en_passant(initial, final):
+                self.en_passant_square = (initial.row + final.row) // 2 * 8 + initial.col
+        
+        # King Castling, the rook move is part of the king's move
+        if is_castling:
+            rook_col, rook_final_col = (0, 3) if final.col < initial.col else (7, 5)
+            rook: Piece = self.squares[initial.row][rook_col].piece
+            self.squares[initial.row][rook_col].piece = None
+            self.squares[initial.row][rook_final_col].piece = rook
+            rook.moved = True
+            rook.current_position = dict(row=initial.row, col=rook_final_col)
+            key ^= zobrist.piece_key(rook, initial.row * 8 + rook_col) ^ zobrist.piece_key(rook, initial.row * 8 + rook_final_col)
         
-        # King Castling
-        if isinstance(piece, King) and not revertMove:
-            if self.castling(initial, final):
-                diff = final.col - initial.col
-                rook = piece.left_rook if diff < 0 else piece.right_rook
-                self.move(rook, rook.valid_moves[-1])
+        info |= initial_square | (final_square << 6) | (PROMOTION_CODES[promotion] << 12)
+        self.history.push(info, self.hash, self.pawn_hash, piece, captured_piece)
+        self.pawn_hash = pawn_key
+        
+        if isinstance(piece, King):
+            self.king_squares[piece.color] = final_square
         
         # Move Piece
-        piece.moved = True if not revertMove else piece.moved
+        piece.moved = True
         piece.current_position = dict(row=final.row, col=final.col)
         piece.clear_valid_moves()
         
+        castling_mask = self.castling_mask & ~(CASTLING_CLEARS[initial_square] | CASTLING_CLEARS[final_square])
+        key ^= zobrist.piece_key(self.squares[final.row][final.col].piece, final_square)
+        key ^= zobrist.CASTLING_MASK_KEYS[self.castling_mask ^ castling_mask] ^ zobrist.SIDE_KEY
+        self.castling_mask = castling_mask
+        
         # Set last move
         self.last_move = move
         self.current_player = 'black' if self.current_player == 'white' else 'white'
+        self.hash = key ^ self.en_passant_key()
+        
+        if self.accumulator is not None:
+            self.accumulator.push(self)
         
-        if not testing and not revertMove:
-            # Add current fen position to self.positions
-            self.positions.append(self.generate_fen())
-        
-        # Add piece and move to last_moves array if we're not reverting a move and not testing a move
-        if not revertMove and not testing:
-            move_history = Move(initial=move.final, final=move.initial)
-            self.last_moves.append(dict(
-                piece=copy.deepcopy(piece), 
-                move=copy.deepcopy(move_history),
-                castling=isinstance(piece, King) and self.castling(initial, final) and not (not piece.moved),
-                en_passant=is_en_passant,
-                captured_piece=copy.deepcopy(captured_piece),
-                is_capture_move=is_capture_move
-            ))
+        # Reset move counter for 50-move rule on captures and pawn moves
+        if captured_piece is not None or isinstance(piece, Pawn):
+            self.move_counter = 0
+        else:
+            self.move_counter += 1
         
         # Checkmate detection, stalemate detection, 50-move rule, Three-fold repitition draw
-        if not testing and not revertMove:
+        if not testing:
             # If the same positions occured in the board thrice, it is a Three-fold repetition
-            if len(self.positions) > 0 and self.positions.count(self.generate_fen()) >= 3:
-                print("Three-fold repetition! Game is a draw.")
+            if self.repetitions() >= 3:
+                logger.info("Three-fold repetition! Game is a draw.")
                 self.state = state.STATE_TF_DRAW
-                
-            # If no capture has been made or no pawn has been moved since the last move, increase the move_counter
-            if not is_capture_move and not isinstance(piece, Pawn):
-                self.move_counter += 1
-                
-                # If the move counter reaches 100, it means that both players
-                # have made 50 consecutive moves without capture or pawn movement
-                if self.move_counter >= 100:
-                    print("50 move Draw!")
-                    self.state = state.STATE_FM_DRAW
+            
+            # If the move counter reaches 100, it means that both players
+            # have made 50 consecutive moves without capture or pawn movement
+            if self.move_counter >= 100:
+                logger.info("50 move Draw!")
+                self.state = state.STATE_FM_DRAW
             
             # If enemy is in checkmate
             if self.is_checkmate(piece=piece):
-                print("CHECKMATE!")
+                logger.info("CHECKMATE!")
                 
             # If enemy is stalemate
             if self.is_stalemate(piece=piece):
-                print("STALEMATE!")
+                logger.info("STALEMATE!")
+    
+    '''
+    Counts how often the current position has occured, only
+    looking back to the last capture or pawn move since no
+    position before it can come back
+    
+    @return int
+    '''
+    def repetitions(self):
+        count = 1
+        size = len(self.history)
+        
+        for index in range(size - 1, max(size - self.move_counter, 0) - 1, -1):
+            if self.history.keys[index] == self.hash:
+                count += 1
+        
+        return count
+    
+    '''
+    Returns the moves played since the start
+    position, oldest first
+    
+    @return list[Move]
+    '''
+    def played_moves(self):
+        return [Move.decode(self.history.move_code(index)) for index in range(len(self.history))]
+    
+    '''
+    The piece taken by the last move, en passant included
+    
+    @return Piece|None
+    '''
+    def last_captured(self):
+        if not len(self.history):
+            return None
+        
+        return self.history.captured[len(self.history) - 1]
+    
+    '''
+    Plays a move on the board the way the UI does,
+    picking up the piece from the move's initial square
+    
+    @return None
+    '''
+    def play(self, move: Move):
+        self.move(self.squares[move.initial.row][move.initial.col].piece, move)
+    
+    '''
+    Returns the result of the game according to the
+    rules, or None while the game is still going on
+    
+    @return str|None
+    '''
+    def result(self):
+        if self.state in (state.STATE_TF_DRAW, state.STATE_FM_DRAW) or self.is_insufficient_material():
+            return '1/2-1/2'
         
-    def check_promotion(self, piece: Piece, final: Square):
+        if len(self.get_legal_moves()) == 0:
+            if self.is_check(color=self.current_player):
+                return '0-1' if self.current_player == 'white' else '1-0'
+            
+            return '1/2-1/2'
+        
+        return None
+    
+    def check_promotion(self, piece: Piece, final: Square, promotion: int | None = None):
         if final.row == 0 or final.row == 7:
-            self.squares[final.row][final.col].piece = Queen(piece.color, original_position=piece.original_position)
+            promoted = {KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook}.get(promotion, Queen)
+            self.squares[final.row][final.col].piece = promoted(piece.color, original_position=piece.original_position)
+            self.squares[final.row][final.col].piece.moved = True
+            return self.squares[final.row][final.col].piece.type
+        
+        return None
             
     def castling(self, initial: Square, final: Square):
         return abs(initial.col - final.col) == 2
@@ -368,125 +646,125 @@ class Board:
     def en_passant(self, initial: Square, final: Square):
         return abs(initial.row - final.row) == 2
     
-    def set_true_en_passant(self, piece):
+    '''
+    Tells whether making a move would leave the
+    moving piece's own king in check
+    
+    @return bool
+    '''
+    def in_check(self, piece: Piece, move: Move|None):
+        if move is None:
+            return self.is_check(color=piece.color)
         
-        if not isinstance(piece, Pawn):
-            return
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                if isinstance(self.squares[row][col].piece, Pawn):
-                    self.squares[row][col].piece.en_passant = False
+        # Making the move resets the piece's move list, which calc_moves is still filling
+        valid_moves = piece.valid_moves
+        self.move(piece, move, testing=True)
+        check = self.is_check(color=piece.color)
+        self.undo_last_move()
+        piece.valid_moves = valid_moves
         
-        piece.en_passant = True
+        return check
     
-    def in_check(self, piece: Piece, move: Move|None):
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
+    '''
+    Tells whether the king of a color is in check, or with a
+    piece given, whether that piece gives check to the enemy king
+    
+    @return bool
+    '''
+    def is_check(self, color = None, piece: Piece|None = None):
+        if piece:
+            king_square = self.king('black' if piece.color == 'white' else 'white')
+            return king_square is not None and any(attacker is piece for attacker, _ in self._attackers(piece.color, king_square))
         
-        if move != None:
-            temp_board.move(temp_piece, move, testing=True)
+        color = self.current_player if color == None else color
+        king_square = self.king(color)
         
+        return king_square is not None and self.is_attacked(king_square, 'black' if color == 'white' else 'white')
+    
+    def valid_move(self, piece: Piece, move: Move):
+        return move in piece.valid_moves
+    
+    def has_legal_moves(self, color):
         for row in range(ROWS):
             for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    _piece = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(_piece, row, col, fromMain = False)
+                if self.squares[row][col].has_team_piece(color):
+                    piece: Piece = self.squares[row][col].piece
+                    self.calc_moves(piece, row, col)
                     
-                    for _move in _piece.valid_moves:
-                        if isinstance(_move.final.piece, King):
-                            return True
-                        
-        return False
-    
-    def is_check(self, color = None, piece: Piece|None = None):
-        temp_piece: Piece|None = copy.deepcopy(piece) if piece else None
-        temp_board = copy.deepcopy(self)
+                    if len(piece.valid_moves) > 0:
+                        return True
         
-        if not piece:
-            for row in range(ROWS):
-                for col in range(COLS):
-                    square = self.squares[row][col]
-                    
-                    if square.has_enemy_piece(self.current_player if color == None else color):
-                        piece: Piece = square.piece
-                        temp_board.calc_moves(piece, row, col)
-                        
-                        for move in piece.valid_moves:
-                            if isinstance(move.final.piece, King):
-                                return True
-        else:
-            row = temp_piece.current_position.get("row")
-            col = temp_piece.current_position.get("col")
-            temp_board.calc_moves(temp_piece, row, col)
-            
-            for move in temp_piece.valid_moves:
-                if isinstance(move.final.piece, King):
-                    return True
-                        
         return False
     
-    def valid_move(self, piece: Piece, move: Move):
-        return move in piece.valid_moves
+    '''
+    Tells whether a color is checkmated, with a piece given
+    the color is the enemy of the piece that just moved
     
+    @return bool
+    '''
     def is_checkmate(self, color = None, piece: Piece = None):
-        temp_board: Board = copy.deepcopy(self)
-                        
-        # If the enemy's king is in check, check if all the enemy's piece (including their king) has valid moves
-        if self.is_check(color=color, piece=piece):
-            for _row in range(ROWS):
-                for _col in range(COLS):
-                    if temp_board.squares[_row][_col].has_enemy_piece(self.current_player if color == None else color):
-                        enemy_piece: Piece = temp_board.squares[_row][_col].piece
-                        temp_board.calc_moves(enemy_piece, _row, _col)
-                        
-                        # If enemy's piece has valid moves, then enemy is not yet checkmate
-                        if len(enemy_piece.valid_moves) > 0:
-                            return False
-        else:
-            return False
-                
-        return True
+        if piece:
+            color = 'black' if piece.color == 'white' else 'white'
+        elif color == None:
+            color = self.current_player
+        
+        return self.is_check(color=color) and not self.has_legal_moves(color)
     
-    def attackers(self, color, target_square):
-        temp_board = copy.deepcopy(self)
-        target_row = target_square // 8
-        target_col = target_square % 8
-        attackers = []
+    '''
+    Yields the pieces of a color attacking a square, found by
+    looking outwards from the target square along the knight,
+    king and pawn tables and the sliding rays
+    
+    @return Iterator[tuple[Piece, tuple[int, int]]]
+    '''
+    def _attackers(self, color, target_square):
+        squares = self.squares
         
-        for row in range(ROWS):
-            for col in range(COLS):
-                square = self.squares[row][col]
-                
-                if square.has_team_piece(color):
-                    piece: Piece = square.piece
-                    temp_board.calc_moves(piece, row, col)
-                    
-                    moves = [(move.final.row, move.final.col) for move in piece.valid_moves]
-                    
-                    if (target_row, target_col) in moves:
-                        attackers.append((piece, (row, col)))
+        for row, col in attacks.PAWN_ATTACKERS[color][target_square]:
+            piece = squares[row][col].piece
+            if piece is not None and piece.type == PAWN and piece.color == color:
+                yield piece, (row, col)
+        
+        for row, col in attacks.KNIGHT_ATTACKS[target_square]:
+            piece = squares[row][col].piece
+            if piece is not None and piece.type == KNIGHT and piece.color == color:
+                yield piece, (row, col)
+        
+        for row, col in attacks.KING_ATTACKS[target_square]:
+            piece = squares[row][col].piece
+            if piece is not None and piece.type == KING and piece.color == color:
+                yield piece, (row, col)
         
-        return attackers
+        for rays, sliders in ((attacks.ROOK_RAYS, (ROOK, QUEEN)), (attacks.BISHOP_RAYS, (BISHOP, QUEEN))):
+            for ray in rays[target_square]:
+                for row, col in ray:
+                    piece = squares[row][col].piece
+                    
+                    # The first piece on the ray blocks everything behind it
+                    if piece is not None:
+                        if piece.type in sliders and piece.color == color:
+                            yield piece, (row, col)
+                        break
+    
+    def attackers(self, color, target_square):
+        return list(self._attackers(color, target_square))
     
+    def is_attacked(self, target_square, color):
+        return next(self._attackers(color, target_square), None) is not None
+    
+    '''
+    Tells whether a color is stalemated, with a piece given
+    the color is the enemy of the piece that just moved
+    
+    @return bool
+    '''
     def is_stalemate(self, color = None, piece: Piece|None = None):
-        temp_board: Board = copy.deepcopy(self)
-                        
-        # If the enemy's king is not in check, check if all the enemy's piece (including their king) has valid moves
-        # that will not put their king in check
-        if not self.is_check(color=color, piece=piece):
-            for _row in range(ROWS):
-                for _col in range(COLS):
-                    if temp_board.squares[_row][_col].has_enemy_piece(self.current_player if color == None else color):
-                        enemy_piece: Piece = temp_board.squares[_row][_col].piece
-                        temp_board.calc_moves(enemy_piece, _row, _col)
-                        
-                        if len(enemy_piece.valid_moves) > 0:
-                            return False
-        else:
-            return False
-                
-        return True
+        if piece:
+            color = 'black' if piece.color == 'white' else 'white'
+        elif color == None:
+            color = self.current_player
+        
+        return not self.is_check(color=color) and not self.has_legal_moves(color)
     
     def is_insufficient_material(self):
         white_pieces = self.count_all_pieces("white")
@@ -501,6 +779,8 @@ class Board:
             (white_pieces == {"K": 1, "N": 1} and black_pieces == {"K": 1, "N": 1})
     
     def calc_moves(self, piece: Piece, row, col, fromMain = True):
+        # Start from an empty list so moves from an earlier position never leak in
+        piece.clear_valid_moves()
         
         def knight_moves():
             possible_moves = [
@@ -598,7 +878,7 @@ class Board:
                 if self.squares[row][col-1].has_enemy_piece(piece.color):
                     __piece = self.squares[row][col-1].piece
                     if isinstance(__piece, Pawn):
-                        if __piece.en_passant:
+                        if self.en_passant_square == fr * 8 + col - 1:
                             # Create squares of the move
                             initial = Square(row, col)
                             final = Square(fr, col-1, __piece)
@@ -620,7 +900,7 @@ class Board:
                 if self.squares[row][col+1].has_enemy_piece(piece.color):
                     __piece = self.squares[row][col+1].piece
                     if isinstance(__piece, Pawn):
-                        if __piece.en_passant:
+                        if self.en_passant_square == fr * 8 + col + 1:
                             # Create squares of the move
                             initial = Square(row, col)
                             final = Square(fr, col+1, __piece)
@@ -723,7 +1003,7 @@ class Board:
                 left_rook = self.squares[row][0].piece
                 
                 if isinstance(left_rook, Rook):
-                    if not left_rook.moved:
+                    if self.castling_mask & (0b0010 if piece.color == 'white' else 0b1000):
                         for _col in range(1, 4):
                             if self.squares[row][_col].has_piece():
                                 break
@@ -732,30 +1012,21 @@ class Board:
                                 # Add left rook to king
                                 piece.left_rook = left_rook
                                 
-                                # Rook move
-                                initial = Square(row, 0)
-                                final = Square(row, 3)
-                                moveR = Move(initial, final)
-                                
                                 # King move
                                 initial = Square(row, col)
                                 final = Square(row, 2)
                                 moveK = Move(initial, final)
                                 
-                                # Check for potential checks
+                                # Check for potential checks, the rook moves along with the king
+                                # so castling is only ever a move of the king
                                 if fromMain:
-                                    # Append new move to Rook
-                                    piece.left_rook.add_valid_move(moveR)
-                                    
-                                    if not self.in_check(piece, moveK) and not self.in_check(piece.left_rook, moveR):
+                                    # The king may not castle out of or through check
+                                    if not self.is_check(color=piece.color) and not self.in_check(piece, Move(Square(row, col), Square(row, 3))) \
+                                        and not self.in_check(piece, moveK):
                                         # Append new move to King
                                         piece.add_valid_move(moveK)
-                                    else:
-                                        piece.left_rook.remove_last_move()
                                         
                                 else:
-                                    # Append new move to Rook
-                                    piece.left_rook.add_valid_move(moveR)
                                     # Append new move to King
                                     piece.add_valid_move(moveK)
                                 
@@ -763,7 +1034,7 @@ class Board:
                 right_rook = self.squares[row][7].piece
                 
                 if isinstance(right_rook, Rook):
-                    if not right_rook.moved:
+                    if self.castling_mask & (0b0001 if piece.color == 'white' else 0b0100):
                         for _col in range(5, 7):
                             if self.squares[row][_col].has_piece():
                                 break
@@ -772,30 +1043,21 @@ class Board:
                                 # Add right rook to king
                                 piece.right_rook = right_rook
                                 
-                                # Rook move
-                                initial = Square(row, 7)
-                                final = Square(row, 5)
-                                moveR = Move(initial, final)
-                                
                                 # King move
                                 initial = Square(row, col)
                                 final = Square(row, 6)
                                 moveK = Move(initial, final)
                                 
-                                # Check for potential checks
+                                # Check for potential checks, the rook moves along with the king
+                                # so castling is only ever a move of the king
                                 if fromMain:
-                                    # Append new move to Rook
-                                    piece.right_rook.add_valid_move(moveR)
-                                    
-                                    if not self.in_check(piece, moveK) and not self.in_check(piece.right_rook, moveR):
+                                    # The king may not castle out of or through check
+                                    if not self.is_check(color=piece.color) and not self.in_check(piece, Move(Square(row, col), Square(row, 5))) \
+                                        and not self.in_check(piece, moveK):
                                         # Append new move to King
                                         piece.add_valid_move(moveK)
-                                    else:
-                                        piece.right_rook.remove_last_move()
                                         
                                 else:
-                                    # Append new move to Rook
-                                    piece.right_rook.add_valid_move(moveR)
                                     # Append new move to King
                                     piece.add_valid_move(moveK)
                                 
@@ -0,0 +1,333 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+import pgn
+from board import Board
+from const import *
+from move import Move
+
+MAGIC = b'PCBK'
+VERSION = 1
+
+# Header: magic, version, ply limit of the build, number of entries
+HEADER = struct.Struct('<4sIIQ')
+
+# Entry: position key, encoded move, weight, games and score (half points of the side that played the move)
+ENTRY = struct.Struct('<QHHII')
+KEY = struct.Struct('<Q')
+
+# Shard record: position key, encoded move, games and score
+RECORD = struct.Struct('<QHII')
+
+# Half points of the side to move for a result, white first
+SCORES = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+MAX_WEIGHT = 0xFFFF
+
+_board: Board | None = None
+
+
+def _init_worker():
+    global _board
+    _board = Board()
+
+
+'''
+Replays a batch of games up to the ply limit and adds up the
+games and score of every (position, move), then splits the
+sorted records by key prefix into one block per shard
+
+@return tuple[list[bytes], int]
+'''
+def batch_records(job):
+    games, shard_bits = job
+    counts = {}
+    positions = 0
+    
+    for fen, moves, result in games:
+        white_score, black_score = SCORES[result]
+        _board.load_fen(fen)
+        
+        try:
+            for text in moves:
+                move = pgn.parse_san(_board, text)
+                entry = counts.setdefault((_board.hash, move.encode()), [0, 0])
+                entry[0] += 1
+                entry[1] += white_score if _board.current_player == 'white' else black_score
+                positions += 1
+                
+                # Only the keys are needed, not the end of game checks of Board.play
+                _board.move(_board.squares[move.initial.row][move.initial.col].piece, move, testing=True)
+        except ValueError:
+            # Keep the positions replayed before an illegal or unreadable move
+            pass
+    
+    shards = [[] for _ in range(1 << shard_bits)]
+    for (key, code), (games_count, score) in sorted(counts.items()):
+        shards[key >> (64 - shard_bits)].append(RECORD.pack(key, code, games_count, score))
+    
+    return [b''.join(records) for records in shards], positions
+
+
+'''
+Merges the records of a shard: every (position, move) once, with
+its weight as its share of the score of all moves from the
+position. Moves played in fewer than min_games games are left out
+
+@return int number of entries written
+'''
+def merge_shard(job):
+    path, min_games = job
+    counts = {}
+    
+    with open(path, 'rb') as file:
+        for key, code, games, score in RECORD.iter_unpack(file.read()):
+            entry = counts.setdefault((key, code), [0, 0])
+            entry[0] += games
+            entry[1] += score
+    
+    totals = {}
+    for (key, _), (games, score) in counts.items():
+        if games >= min_games:
+            totals[key] = totals.get(key, 0) + score
+    
+    entries = []
+    for (key, code), (games, score) in sorted(counts.items()):
+        if games < min_games:
+            continue
+        
+        total = totals[key]
+        weight = score * MAX_WEIGHT // total if total else 0
+        entries.append(ENTRY.pack(key, code, weight, games, score))
+    
+    with open(path + '.book', 'wb') as file:
+        file.write(b''.join(entries))
+    
+    os.remove(path)
+    return len(entries)
+
+
+def read_input(pgn_paths, ply):
+    for pgn_path in pgn_paths:
+        with open(pgn_path, errors='replace') as file:
+            for game in pgn.read_games(file):
+                # Games without a result say nothing about their moves
+                if game.result in SCORES:
+                    yield game.tags.get('FEN', STARTING_FEN), game.moves[:ply], game.result
+
+
+def batches(items, size):
+    batch = []
+    
+    for item in items:
+        batch.append(item)
+        
+        if len(batch) == size:
+            yield batch
+            batch = []
+    
+    if batch:
+        yield batch
+
+
+class Book:
+    '''
+    Opening book read from a sorted entry file: the file is
+    memory-mapped and the entries of a position are found
+    with a binary search on their keys
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, self.ply, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an opening book')
+    
+    def close(self):
+        self.mm.close()
+        self.file.close()
+    
+    def _key_at(self, index):
+        return KEY.unpack_from(self.mm, HEADER.size + index * ENTRY.size)[0]
+    
+    '''
+    Moves of a position in the book with their weight,
+    games and score, the most played first
+    
+    @return list[tuple[int, int, int, int]]
+    '''
+    def entries(self, key):
+        low, high = 0, self.count
+        
+        # Lower bound of the key
+        while low < high:
+            middle = (low + high) // 2
+            
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        
+        entries = []
+        for index in range(low, self.count):
+            entry_key, code, weight, games, score = ENTRY.unpack_from(self.mm, HEADER.size + index * ENTRY.size)
+            
+            if entry_key != key:
+                break
+            
+            entries.append((code, weight, games, score))
+        
+        entries.sort(key=lambda entry: -entry[2])
+        return entries
+    
+    '''
+    Picks a move of the position at random, the better a
+    move scored the more likely it is to be played
+    
+    @return int|None the encoded move
+    '''
+    def choose(self, key, rng):
+        entries = self.entries(key)
+        
+        if not entries:
+            return None
+        
+        weights = [weight for _, weight, _, _ in entries]
+        if not any(weights):
+            weights = [games for _, _, games, _ in entries]
+        
+        return rng.choices([code for code, _, _, _ in entries], weights)[0]
+
+
+'''
+Builds a book in three steps: workers replay batches of games
+and split their records into shard files by key prefix, then
+every shard is merged on its own, and the merged shards, which
+are already in key order, are written one after the other
+
+@return tuple[int, int] positions replayed and entries written
+'''
+def build(path, pgn_paths, ply=20, min_games=1, shards=64, batch_size=256, workers=1):
+    if shards < 1 or shards & (shards - 1):
+        raise ValueError(f'Number of shards must be a power of two, got {shards}')
+    
+    shard_bits = shards.bit_length() - 1
+    positions = 0
+    
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp, \
+            multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        shard_paths = [os.path.join(tmp, f'{shard}.bin') for shard in range(1 << shard_bits)]
+        shard_files = [open(shard_path, 'wb') for shard_path in shard_paths]
+        
+        # A few batches in flight per worker, Pool.imap would read every game up front
+        pending = deque()
+        
+        def write(result):
+            nonlocal positions
+            blocks, batch_positions = result.get()
+            positions += batch_positions
+            
+            for shard_file, block in zip(shard_files, blocks):
+                shard_file.write(block)
+        
+        for batch in batches(read_input(pgn_paths, ply), batch_size):
+            pending.append(pool.apply_async(batch_records, ((batch, shard_bits),)))
+            
+            if len(pending) >= 2 * workers:
+                write(pending.popleft())
+        
+        while pending:
+            write(pending.popleft())
+        
+        for shard_file in shard_files:
+            shard_file.close()
+        
+        counts = pool.map(merge_shard, [(shard_path, min_games) for shard_path in shard_paths])
+        
+        with open(path + '.tmp', 'wb') as out:
+            out.write(HEADER.pack(MAGIC, VERSION, ply, sum(counts)))
+            
+            for shard_path in shard_paths:
+                with open(shard_path + '.book', 'rb') as shard_file:
+                    while chunk := shard_file.read(ENTRY.size * 65536):
+                        out.write(chunk)
+                
+                os.remove(shard_path + '.book')
+        
+        entries = sum(counts)
+    
+    os.replace(path + '.tmp', path)
+    return positions, entries
+
+
+def query_board(args):
+    board = Board()
+    board.load_fen(args.fen or STARTING_FEN)
+    
+    for text in args.moves or []:
+        board.play(pgn.parse_san(board, text))
+    
+    return board
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Opening book built from PGN files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    build_command = commands.add_parser('build', help='build a book from PGN files')
+    build_command.add_argument('book')
+    build_command.add_argument('pgn', nargs='+')
+    build_command.add_argument('--ply', type=int, default=20, help='plies of every game that go into the book')
+    build_command.add_argument('--min-games', type=int, default=1, help='leave out moves played in fewer games')
+    build_command.add_argument('--shards', type=int, default=64, help='power of two, more shards use less memory')
+    build_command.add_argument('--batch', type=int, default=256, help='games a worker replays at a time')
+    build_command.add_argument('--workers', type=int, default=os.cpu_count())
+    
+    query = commands.add_parser('query', help='book moves of a position')
+    query.add_argument('book')
+    query.add_argument('--fen')
+    query.add_argument('--moves', nargs='*', help='SAN moves played from the FEN or the start position')
+    
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    
+    if args.command == 'build':
+        if args.shards < 1 or args.shards & (args.shards - 1):
+            parser.error('--shards must be a power of two')
+        
+        positions, entries = build(args.book, args.pgn, args.ply, args.min_games, args.shards, args.batch, args.workers)
+        elapsed = time.perf_counter() - start
+        print(
+            f'{positions} positions into {entries} entries ({os.path.getsize(args.book)} bytes) in {elapsed:.1f}s, '
+            f'{positions / elapsed if elapsed else 0:.0f} positions/s',
+            file=sys.stderr
+        )
+        return
+    
+    board = query_board(args)
+    
+    book = Book(args.book)
+    start = time.perf_counter()
+    entries = book.entries(board.hash)
+    elapsed = time.perf_counter() - start
+    
+    moves = {}
+    for code, weight, games, score in entries:
+        moves[pgn.san(board, Move.decode(code))] = dict(games=games, score=score / (2 * games), weight=weight)
+    
+    print(json.dumps(dict(key=f'{board.hash:016x}', moves=moves, query_ms=elapsed * 1000), indent=2))
+    book.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,5 @@
 import pygame
-import os
 
-from sound import Sound
 from theme import Theme
 
 class Config:
@@ -11,10 +9,18 @@ class Config:
         self._add_themes()
         self.idx = 0
         self.theme = self.themes[self.idx]
-        self.font = pygame.font.SysFont('monospace', 18, bold=True)
+        self._fonts = {}
+    
+    # Looking up a system font is slow, it is only done once the board is drawn
+    @property
+    def font(self):
+        return self.get_font(18)
+    
+    def get_font(self, size):
+        if size not in self._fonts:
+            self._fonts[size] = pygame.font.SysFont('monospace', size, bold=True)
         
-        self.move_sound = Sound(os.path.join('assets/sounds/move.wav'))
-        self.capture_sound = Sound(os.path.join('assets/sounds/capture.wav'))
+        return self._fonts[size]
     
     def change_theme(self):
         self.idx += 1
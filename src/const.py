@@ -5,4 +5,7 @@ HEIGHT = 800
 # Board Dimensions
 ROWS = 8
 COLS = 8
-SQSIZE = WIDTH // COLS
\ No newline at end of file
+SQSIZE = WIDTH // COLS
+
+# Starting Position
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
\ No newline at end of file
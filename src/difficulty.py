@@ -0,0 +1,41 @@
+import os
+
+class Difficulty:
+    '''
+    A difficulty preset: how much the AI may search
+    (depth, time and node budgets, worker processes)
+    and how often it plays a weaker move on purpose
+    (noise added to the root scores of its best
+    multipv moves before picking one)
+    '''
+    
+    def __init__(self, name, depth, time_limit=None, nodes=None, noise=0, multipv=1, workers=1):
+        self.name = name
+        self.depth = depth
+        self.time_limit = time_limit
+        self.nodes = nodes
+        self.noise = noise
+        self.multipv = multipv
+        self.workers = workers
+    
+    def __repr__(self) -> str:
+        return f'Difficulty({self.name})'
+
+
+DIFFICULTIES = [
+    Difficulty('beginner', depth=1, time_limit=0.005, nodes=20, noise=300, multipv=5),
+    Difficulty('easy', depth=1, time_limit=0.05, nodes=200, noise=120, multipv=3),
+    Difficulty('medium', depth=2, time_limit=0.5, nodes=2000, noise=40, multipv=2),
+    Difficulty('hard', depth=3, time_limit=2.0),
+    Difficulty('expert', depth=5, time_limit=5.0, workers=os.cpu_count() or 1),
+]
+
+DEFAULT_DIFFICULTY = 2
+
+
+def difficulty_by_name(name: str):
+    for difficulty in DIFFICULTIES:
+        if difficulty.name == name:
+            return difficulty
+    
+    raise KeyError(f'Unknown difficulty: {name}')
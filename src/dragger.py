@@ -1,11 +1,13 @@
 import pygame
 
+from atlas import TextureAtlas, drag_size
 from const import *
 from piece import Piece
 
 class Dragger:
     
-    def __init__(self):
+    def __init__(self, atlas: TextureAtlas):
+        self.atlas = atlas
         self.piece: Piece | None = None
         self.dragging = False
         self.mouseX = 0
@@ -15,8 +17,7 @@ class Dragger:
         
         
     def update_blit(self, screen: pygame.Surface, chess_board: pygame.Surface):
-        self.piece.set_texture(size = 128)
-        img = pygame.image.load(self.piece.texture)
+        img = self.atlas.sprite(self.piece, drag_size(SQSIZE))
         
         self.piece.texture_rect = img.get_rect(center = (self.mouseX, self.mouseY))
         chess_board.blit(img, self.piece.texture_rect)
@@ -0,0 +1,200 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import pgn
+from ai import AI
+from board import Board
+
+# Iterations are only cut short by the budget
+MAX_DEPTH = 32
+
+OPERATION = re.compile(r'(\w+)((?:\s+(?:"[^"]*"|[^\s;"]+))*)\s*;')
+OPERAND = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+_ai: AI | None = None
+
+
+'''
+Splits an EPD line into its position and operations,
+operands are kept as lists of strings
+
+@return tuple[str, dict[str, list[str]]]
+'''
+def parse_epd(line: str):
+    fields = line.split(maxsplit=4)
+    operations = {}
+    
+    for opcode, operands in OPERATION.findall(fields[4] if len(fields) > 4 else ''):
+        operations[opcode] = [quoted or plain for quoted, plain in OPERAND.findall(operands)]
+    
+    halfmove = operations.get('hmvc', ['0'])[0]
+    fullmove = operations.get('fmvn', ['1'])[0]
+    return ' '.join(fields[:4] + [halfmove, fullmove]), operations
+
+
+def read_suite(files):
+    for file in files:
+        for line in file:
+            line = line.strip()
+            
+            if line and not line.startswith('#'):
+                yield parse_epd(line)
+
+
+def _init_worker(weights, network):
+    global _ai
+    
+    _ai = AI()
+    if weights:
+        _ai.load_weights(weights)
+    _ai.load_network(network)
+
+
+'''
+Searches a position of the suite and checks the move against its
+best and avoid moves. The solution is found at the first iteration
+from which every iteration, and the move played, are right
+
+@return dict
+'''
+def solve(job):
+    index, fen, operations, depth, time_limit, max_nodes = job
+    ai = _ai
+    board = Board()
+    position = dict(
+        index=index,
+        id=operations.get('id', [str(index + 1)])[0],
+        fen=fen,
+        bm=operations.get('bm', []),
+        am=operations.get('am', []),
+    )
+    
+    try:
+        board.load_fen(fen)
+        best = {pgn.parse_san(board, text).encode() for text in operations.get('bm', [])}
+        avoid = {pgn.parse_san(board, text).encode() for text in operations.get('am', [])}
+    except ValueError as error:
+        # A bm or am move that is not legal in the position leaves nothing to check, the rest of the suite still runs
+        return dict(
+            position, move=None, solved=False, depth=0, time=0.0, nodes=0,
+            solution_depth=None, time_to_solution=None, nodes_to_solution=None, error=str(error)
+        )
+    
+    def correct(code):
+        return (not best or code in best) and code not in avoid
+    
+    iterations = []
+    start = time.perf_counter()
+    
+    def on_iteration(current_depth, scores):
+        if scores:
+            iterations.append((current_depth, scores[0][2].encode(), time.perf_counter() - start, ai.nodes))
+    
+    # Every position starts from an empty table, results do not depend on the order of the suite
+    ai.tt.clear()
+    ai.max_nodes = max_nodes
+    ai.on_iteration = on_iteration
+    best_move = ai.find_best_move(board, depth, time_limit=time_limit)
+    elapsed = time.perf_counter() - start
+    ai.on_iteration = None
+    
+    move = best_move[1] if best_move else None
+    solved = move is not None and correct(move.encode())
+    solution = None
+    
+    if solved:
+        solution = (ai.completed_depth, elapsed, ai.nodes)
+        
+        for current_depth, code, seconds, nodes in reversed(iterations):
+            if not correct(code):
+                break
+            solution = (current_depth, seconds, nodes)
+    
+    return dict(
+        position,
+        move=pgn.san(board, move) if move else None,
+        solved=solved,
+        depth=ai.completed_depth,
+        time=elapsed,
+        nodes=ai.nodes,
+        solution_depth=solution[0] if solution else None,
+        time_to_solution=solution[1] if solution else None,
+        nodes_to_solution=solution[2] if solution else None,
+        error=None,
+    )
+
+
+def run_suite(suite, depth=MAX_DEPTH, time_limit=None, max_nodes=None, weights=None, network=None, workers=1):
+    jobs = ((index, fen, operations, depth, time_limit, max_nodes) for index, (fen, operations) in enumerate(suite))
+    results = []
+    
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(weights, network)) as pool:
+        for result in pool.imap_unordered(solve, jobs):
+            results.append(result)
+            
+            if result['error']:
+                print(f"{result['id']}: skipped, {result['error']}", file=sys.stderr)
+                continue
+            
+            print(
+                f"{result['id']}: {result['move']} {'solved' if result['solved'] else 'failed'} "
+                f"depth {result['depth']} {result['time']:.2f}s {result['nodes']} nodes",
+                file=sys.stderr
+            )
+    
+    results.sort(key=lambda result: result['index'])
+    solved = [result for result in results if result['solved']]
+    
+    return dict(
+        positions=len(results),
+        solved=len(solved),
+        errors=sum(result['error'] is not None for result in results),
+        depth=depth,
+        time_limit=time_limit,
+        max_nodes=max_nodes,
+        time=sum(result['time'] for result in results),
+        nodes=sum(result['nodes'] for result in results),
+        time_to_solution=sum(result['time_to_solution'] for result in solved),
+        nodes_to_solution=sum(result['nodes_to_solution'] for result in solved),
+        results=results,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an EPD test suite with bm/am operations')
+    parser.add_argument('input', nargs='*', help='EPD files, stdin when none')
+    parser.add_argument('--time-limit', type=float, help='seconds per position')
+    parser.add_argument('--nodes', type=int, help='nodes per position')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH, help='deepest iteration')
+    parser.add_argument('--weights', metavar='PATH', help='JSON file of evaluation weights, see tune.py')
+    parser.add_argument('--network', metavar='PATH', help='evaluate with a network file instead, see nnue.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', metavar='PATH', help='write the report to a file instead of stdout')
+    args = parser.parse_args(argv)
+    
+    if args.time_limit is None and args.nodes is None and args.depth == MAX_DEPTH:
+        parser.error('set a budget with --time-limit, --nodes or --depth')
+    
+    files = [open(path) for path in args.input] or [sys.stdin]
+    start = time.perf_counter()
+    report = run_suite(read_suite(files), args.depth, args.time_limit, args.nodes, args.weights, args.network, args.workers)
+    elapsed = time.perf_counter() - start
+    
+    for file in files:
+        file.close()
+    
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    
+    print(f"solved {report['solved']}/{report['positions']} in {elapsed:.1f}s, {report['errors']} skipped", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
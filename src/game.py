@@ -1,63 +1,83 @@
 import pygame
+from atlas import TextureAtlas, piece_size, drag_size
 from config import Config
 from const import *
 from piece import Piece
 from board import Board
+from difficulty import DIFFICULTIES, DEFAULT_DIFFICULTY
 from dragger import Dragger
+from sound import SoundBank, MOVE, CAPTURE, UNDO
 from square import Square
 
 class Game:
     
-    def __init__(self):
+    def __init__(self, sounds: SoundBank | None = None, atlas: TextureAtlas | None = None):
         self.next_player = 'white'
         self.ai_enemy_enabled = False
         self.ai_turn = False
+        self.difficulty_idx = DEFAULT_DIFFICULTY
+        self.difficulty = DIFFICULTIES[self.difficulty_idx]
         self.hovered_sqr = None
+        
+        # Size of a square in pixels, other sizes draw the board for diagrams
+        self.sqsize = SQSIZE
         self.board = Board()
-        self.dragger = Dragger()
         self.config = Config()
+        self.sounds = sounds if sounds is not None else SoundBank()
+        
+        # Piece images are read from disk once, for the sizes the board draws
+        if atlas is None:
+            atlas = TextureAtlas()
+            atlas.preload(piece_size(SQSIZE), drag_size(SQSIZE))
+        
+        self.atlas = atlas
+        self.dragger = Dragger(atlas)
     
     def show_bg(self, screen: pygame.Surface, chess_board: pygame.Surface):
         theme = self.config.theme
+        sqsize = self.sqsize
+        
+        # Labels are 18px on 100px squares
+        font = self.config.get_font(sqsize * 18 // 100)
         
         for row in range(ROWS):
             for col in range(COLS):
                 color = theme.bg.light if (row + col) % 2 == 0 else theme.bg.dark
                     
-                rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
+                rect = (col * sqsize, row * sqsize, sqsize, sqsize)
                 pygame.draw.rect(chess_board, color, rect)
                 
                 # Show numbers on the left side of the board
                 if col == 0:
                     color = theme.bg.dark if row % 2 == 0 else theme.bg.light
-                    label = self.config.font.render(str(ROWS-row), 1, color)
-                    label_pos = (5, 5 + row * SQSIZE)
+                    label = font.render(str(ROWS-row), 1, color)
+                    label_pos = (sqsize // 20, sqsize // 20 + row * sqsize)
                     chess_board.blit(label, label_pos)
                  
                 # Show letters A-H on the bottom of the board   
                 if row == 7:
                     color = theme.bg.dark if (row + col) % 2 == 0 else theme.bg.light
-                    label = self.config.font.render(Square.get_alphacol(col).upper(), 1, color)
-                    label_pos = (col * SQSIZE + SQSIZE - 20, HEIGHT - 20)
+                    label = font.render(Square.get_alphacol(col).upper(), 1, color)
+                    label_pos = (col * sqsize + sqsize - sqsize // 5, ROWS * sqsize - sqsize // 5)
                     chess_board.blit(label, label_pos)
                     
-        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=WIDTH, height=HEIGHT))
+        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=COLS * sqsize, height=ROWS * sqsize))
     
     def show_pieces(self, screen: pygame.Surface, chess_board: pygame.Surface):
+        sqsize = self.sqsize
+        
         for row in range(ROWS):
             for col in range(COLS):
                 if self.board.squares[row][col].has_piece():
                     piece: Piece = self.board.squares[row][col].piece
                     
                     if piece is not self.dragger.piece:
-                        piece.set_texture()
-                        
-                        img = pygame.image.load(piece.texture)
-                        img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
+                        img = self.atlas.sprite(piece, piece_size(sqsize))
+                        img_center = col * sqsize + sqsize // 2, row * sqsize + sqsize // 2
                         piece.texture_rect = img.get_rect(center=img_center)
                         chess_board.blit(img, piece.texture_rect)
                         
-        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=WIDTH, height=HEIGHT))
+        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=COLS * sqsize, height=ROWS * sqsize))
     
     def show_moves(self, screen: pygame.Surface, chess_board: pygame.Surface, current_square: Square|None = None):
         theme = self.config.theme
@@ -67,15 +87,15 @@ class Game:
             
             if current_square:
                 _color = theme.trace.dark
-                _rect = (current_square.col * SQSIZE, current_square.row * SQSIZE, SQSIZE, SQSIZE)
+                _rect = (current_square.col * self.sqsize, current_square.row * self.sqsize, self.sqsize, self.sqsize)
                 pygame.draw.rect(chess_board, _color, _rect)
             
             for move in piece.valid_moves:
                 color = theme.valid_moves.light if (move.final.row + move.final.col) % 2 == 0 else theme.valid_moves.dark
-                rect = (move.final.col * SQSIZE, move.final.row * SQSIZE, SQSIZE, SQSIZE)
+                rect = (move.final.col * self.sqsize, move.final.row * self.sqsize, self.sqsize, self.sqsize)
                 pygame.draw.rect(chess_board, color, rect)
                 
-        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=WIDTH, height=HEIGHT))
+        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=COLS * self.sqsize, height=ROWS * self.sqsize))
                 
     def show_last_move(self, screen: pygame.Surface, chess_board: pygame.Surface):
         theme = self.config.theme
@@ -86,18 +106,18 @@ class Game:
             
             for pos in [initial, final]:
                 color = theme.trace.light if (pos.row + pos.col) % 2 == 0 else theme.trace.dark
-                rect = (pos.col * SQSIZE, pos.row * SQSIZE, SQSIZE, SQSIZE)
+                rect = (pos.col * self.sqsize, pos.row * self.sqsize, self.sqsize, self.sqsize)
                 pygame.draw.rect(chess_board, color, rect)
                 
-        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=WIDTH, height=HEIGHT))
+        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=COLS * self.sqsize, height=ROWS * self.sqsize))
                 
     def show_hover(self, screen: pygame.Surface, chess_board: pygame.Surface):
         if self.hovered_sqr:
             color = (180, 180, 180)
-            rect = (self.hovered_sqr.col * SQSIZE, self.hovered_sqr.row * SQSIZE, SQSIZE, SQSIZE)
+            rect = (self.hovered_sqr.col * self.sqsize, self.hovered_sqr.row * self.sqsize, self.sqsize, self.sqsize)
             pygame.draw.rect(chess_board, color, rect, width=3)
             
-        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=WIDTH, height=HEIGHT))
+        screen.blit(chess_board, (0, 0), chess_board.get_rect(width=COLS * self.sqsize, height=ROWS * self.sqsize))
     
     def enable_ai_enemy(self):
         self.ai_enemy_enabled = not self.ai_enemy_enabled        
@@ -109,7 +129,7 @@ class Game:
         self.board.undo_last_move()
         
     def can_undo_last_move(self):
-        return len(self.board.last_moves) > 0 
+        return len(self.board.history) > 0 
                 
     def next_turn(self):
         self.ai_turn = not self.ai_turn if self.ai_enemy_enabled else False
@@ -128,12 +148,25 @@ class Game:
         
     def change_theme(self):
         self.config.change_theme()
+    
+    def change_difficulty(self):
+        self.difficulty_idx += 1
+        self.difficulty_idx %= len(DIFFICULTIES)
+        self.difficulty = DIFFICULTIES[self.difficulty_idx]
         
-    def play_sound(self, captured = False):
-        if captured:
-            self.config.capture_sound.play()
-        else:
-            self.config.move_sound.play()
+    # Called once a move has been played on the board
+    def on_move(self):
+        self.sounds.play(CAPTURE if self.board.last_captured() is not None else MOVE)
+    
+    def on_undo(self):
+        self.sounds.play(UNDO)
             
     def reset(self):
-        self.__init__()
\ No newline at end of file
+        # The player's settings carry over to the new game, the sounds and images are already loaded
+        ai_enemy_enabled, difficulty_idx, config = self.ai_enemy_enabled, self.difficulty_idx, self.config
+        self.__init__(self.sounds, self.atlas)
+        
+        self.ai_enemy_enabled = ai_enemy_enabled
+        self.difficulty_idx = difficulty_idx
+        self.difficulty = DIFFICULTIES[difficulty_idx]
+        self.config = config
\ No newline at end of file
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# pygame greets on stdout, where the report goes
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+import state
+from const import *
+
+VERSION = 1
+
+# Events Main.main_game handles and the attributes kept for each of them
+EVENTS = {
+    pygame.MOUSEBUTTONDOWN: ('MOUSEBUTTONDOWN', ['pos', 'button']),
+    pygame.MOUSEBUTTONUP: ('MOUSEBUTTONUP', ['pos', 'button']),
+    pygame.MOUSEMOTION: ('MOUSEMOTION', ['pos', 'rel', 'buttons']),
+    pygame.KEYDOWN: ('KEYDOWN', ['key', 'mod', 'unicode']),
+    pygame.QUIT: ('QUIT', []),
+}
+EVENT_TYPES = {name: event_type for event_type, (name, _) in EVENTS.items()}
+
+PERCENTILES = [50, 90, 99]
+
+
+def encode_event(event: pygame.event.Event):
+    name, attributes = EVENTS[event.type]
+    encoded = {'type': name}
+    
+    for attribute in attributes:
+        value = getattr(event, attribute)
+        encoded[attribute] = list(value) if isinstance(value, tuple) else value
+    
+    return encoded
+
+
+def decode_event(encoded: dict):
+    attributes = {name: tuple(value) if isinstance(value, list) else value for name, value in encoded.items() if name != 'type'}
+    return pygame.event.Event(EVENT_TYPES[encoded['type']], attributes)
+
+
+class EventRecorder:
+    '''
+    Appends the events of every frame of a game to a file, one
+    JSON line per frame that had any, with its frame number and
+    time. Frames without events are only counted
+    '''
+    
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.frame = 0
+        self.start = time.perf_counter()
+        self.file.write(json.dumps(dict(version=VERSION, width=WIDTH, height=HEIGHT)) + '\n')
+    
+    def record(self, events: list):
+        encoded = [encode_event(event) for event in events if event.type in EVENTS]
+        
+        if encoded:
+            self.file.write(json.dumps(dict(frame=self.frame, time=time.perf_counter() - self.start, events=encoded)) + '\n')
+            
+            # A game ends with sys.exit(), every frame has to be on disk by then
+            self.file.flush()
+        
+        self.frame += 1
+    
+    def close(self):
+        self.file.close()
+
+
+'''
+Reads a recording
+
+@return tuple[dict, list[list[pygame.event.Event]]] its header and the events of every frame up to the last one that had any
+'''
+def read_log(path):
+    with open(path) as file:
+        header = json.loads(file.readline())
+        
+        if header.get('version') != VERSION:
+            raise ValueError(f'{path} is not an event recording')
+        
+        frames = []
+        
+        for line in file:
+            if not line.strip():
+                continue
+            
+            record = json.loads(line)
+            
+            # Frames without events were not written, they are played again empty
+            frames += [[] for _ in range(record['frame'] - len(frames))]
+            frames.append([decode_event(event) for event in record['events']])
+    
+    return header, frames
+
+
+def percentiles(values):
+    if not values:
+        return None
+    
+    values = sorted(values)
+    result = {f'p{p}': values[min(len(values) - 1, len(values) * p // 100)] * 1000 for p in PERCENTILES}
+    result['max'] = values[-1] * 1000
+    result['mean'] = sum(values) / len(values) * 1000
+    return result
+
+
+'''
+Plays recorded frames through Main.main_game without waiting
+between them, with pygame on SDL's dummy drivers, timing every
+frame from the delivery of its events to the end of its display
+update. Frames are sorted by what they showed: a piece picked up
+with its moves highlighted, a move played by the player, or a
+move of the AI, whose search dominates its frame
+
+@return dict
+'''
+def replay(frames, seed=0):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    from main import Main
+    
+    main = Main()
+    main.ai.random.seed(seed)
+    
+    frame_times = []
+    highlight_times = []
+    move_times = []
+    ai_times = []
+    quit_requested = False
+    
+    start = time.perf_counter()
+    
+    for events in frames:
+        game = main.game
+        board = game.board
+        plies = len(board.history)
+        ai_turn = game.ai_enemy_enabled and game.ai_turn
+        clicked_square = main.clicked_square
+        
+        frame_start = time.perf_counter()
+        
+        # Main.mainloop only hands the events to playing games
+        if game.get_state() in (state.STATE_INITIAL, state.STATE_PLAYING):
+            try:
+                main.main_game(main.screen, main.chess_board, game, main.ai, board, game.dragger, events)
+            except SystemExit:
+                quit_requested = True
+        
+        if quit_requested:
+            break
+        
+        pygame.display.update()
+        elapsed = time.perf_counter() - frame_start
+        
+        if ai_turn and len(board.history) > plies:
+            ai_times.append(elapsed)
+            continue
+        
+        frame_times.append(elapsed)
+        
+        if main.clicked_square is not None and main.clicked_square is not clicked_square:
+            highlight_times.append(elapsed)
+        
+        if game.board is board and len(board.history) > plies:
+            move_times.append(elapsed)
+    
+    total = time.perf_counter() - start
+    main.ponder.stop()
+    fen = main.game.board.generate_fen()
+    
+    if not quit_requested:
+        pygame.quit()
+    
+    return dict(
+        frames=len(frame_times) + len(ai_times),
+        time=total,
+        frames_per_second=(len(frame_times) + len(ai_times)) / total if total else 0.0,
+        frame_ms=percentiles(frame_times),
+        click_to_highlight_ms=percentiles(highlight_times),
+        move_to_render_ms=percentiles(move_times),
+        ai_move_ms=percentiles(ai_times),
+        highlights=len(highlight_times),
+        moves=len(move_times),
+        ai_moves=len(ai_times),
+        fen=fen,
+    )
+
+
+def record(path):
+    from main import Main
+    
+    main = Main()
+    main.recorder = EventRecorder(path)
+    
+    try:
+        main.mainloop()
+    finally:
+        main.recorder.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record the input of a game and replay it headless for frame timings')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    record_command = commands.add_parser('record', help='play a game, writing its events to a file')
+    record_command.add_argument('events')
+    
+    replay_command = commands.add_parser('replay', help='replay a recording as fast as possible and time its frames')
+    replay_command.add_argument('events')
+    replay_command.add_argument('--seed', type=int, default=0, help='seed of the AI, for the weaker levels')
+    replay_command.add_argument('--output', metavar='PATH', help='write the report to a file instead of stdout')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'record':
+        record(args.events)
+        return
+    
+    header, frames = read_log(args.events)
+    if (header['width'], header['height']) != (WIDTH, HEIGHT):
+        print(f"recorded at {header['width']}x{header['height']}, replaying at {WIDTH}x{HEIGHT}", file=sys.stderr)
+    
+    report = replay(frames, args.seed)
+    
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    
+    frame_ms = report['frame_ms'] or {}
+    print(f"{report['frames']} frames in {report['time']:.2f}s, frame p50 {frame_ms.get('p50', 0):.2f}ms p99 {frame_ms.get('p99', 0):.2f}ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from server import PORT
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def percentiles(values):
+    if not values:
+        return None
+    
+    values = sorted(values)
+    result = {f'p{p}': values[min(len(values) - 1, len(values) * p // 100)] for p in PERCENTILES}
+    result['max'] = values[-1]
+    result['mean'] = sum(values) / len(values)
+    return result
+
+
+class Session:
+    '''
+    A simulated player: one connection to the server, playing
+    random legal moves and timing every move until the update
+    that carries it comes back
+    '''
+    
+    def __init__(self, host, port, moves, rng: random.Random, latencies: list, ai_latencies: list):
+        self.host = host
+        self.port = port
+        self.moves = moves
+        self.rng = rng
+        self.latencies = latencies
+        self.ai_latencies = ai_latencies
+        self.errors = 0
+    
+    async def request(self, writer, message):
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+    
+    async def receive(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+        
+        message = json.loads(line)
+        if message['op'] == 'error':
+            self.errors += 1
+        
+        return message
+    
+    '''
+    Creates or joins a game and plays until it has played its
+    moves or the game is over. host_game is resolved with the
+    game's id by the session that creates it
+    
+    @return None
+    '''
+    async def play(self, request: dict, host_game: asyncio.Future | None = None, ai=False):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=1 << 16)
+        
+        try:
+            if 'game' in request and isinstance(request['game'], asyncio.Future):
+                request = dict(request, game=await request['game'])
+            
+            await self.request(writer, request)
+            
+            joined = await self.receive(reader)
+            while joined['op'] != 'joined':
+                joined = await self.receive(reader)
+            
+            color = joined['color']
+            if host_game is not None:
+                host_game.set_result(joined['game'])
+            
+            played = 0
+            waiting_since = time.perf_counter()
+            update = await self.receive(reader)
+            
+            while played < self.moves:
+                if update['op'] != 'update':
+                    update = await self.receive(reader)
+                    continue
+                
+                if update['result'] is not None:
+                    break
+                
+                if update['turn'] != color:
+                    update = await self.receive(reader)
+                    
+                    # Time from our move to the AI's reply
+                    if ai and update['op'] == 'update' and update['turn'] == color:
+                        self.ai_latencies.append(time.perf_counter() - waiting_since)
+                    continue
+                
+                ply = update['ply']
+                start = time.perf_counter()
+                await self.request(writer, dict(op='move', game=joined['game'], move=self.rng.choice(update['legal'])))
+                
+                update = await self.receive(reader)
+                while update['op'] != 'update' or update['ply'] <= ply:
+                    update = await self.receive(reader)
+                
+                waiting_since = time.perf_counter()
+                self.latencies.append(waiting_since - start)
+                played += 1
+        finally:
+            writer.close()
+
+
+async def run(host, port, sessions, moves, ai_share, difficulty, seed):
+    rng = random.Random(seed)
+    latencies = []
+    ai_latencies = []
+    tasks = []
+    players = []
+    
+    ai_sessions = round(sessions * ai_share)
+    for index in range(ai_sessions):
+        session = Session(host, port, moves, random.Random(rng.random()), latencies, ai_latencies)
+        players.append(session)
+        tasks.append(session.play(dict(op='new', ai='black', difficulty=difficulty), ai=True))
+    
+    # The other sessions play each other in pairs, the second one joins the first one's game
+    for index in range((sessions - ai_sessions) // 2):
+        game = asyncio.get_running_loop().create_future()
+        white = Session(host, port, moves, random.Random(rng.random()), latencies, ai_latencies)
+        black = Session(host, port, moves, random.Random(rng.random()), latencies, ai_latencies)
+        players += [white, black]
+        tasks.append(white.play(dict(op='new', color='white'), host_game=game))
+        tasks.append(black.play(dict(op='join', game=game, color='black')))
+    
+    start = time.perf_counter()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    
+    failures = [result for result in results if isinstance(result, BaseException)]
+    for failure in failures[:5]:
+        print(f'session failed: {failure!r}', file=sys.stderr)
+    
+    return dict(
+        sessions=len(players),
+        ai_sessions=ai_sessions,
+        failed_sessions=len(failures),
+        errors=sum(player.errors for player in players),
+        moves=len(latencies),
+        elapsed=elapsed,
+        moves_per_second=len(latencies) / elapsed if elapsed else 0.0,
+        move_latency_ms={name: value * 1000 for name, value in (percentiles(latencies) or {}).items()},
+        ai_latency_ms={name: value * 1000 for name, value in (percentiles(ai_latencies) or {}).items()},
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate many concurrent sessions against the game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--moves', type=int, default=20, help='moves every session plays')
+    parser.add_argument('--ai', type=float, default=0.0, help='share of the sessions playing the AI')
+    parser.add_argument('--difficulty', default='beginner', help='difficulty of the AI games')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', metavar='PATH', help='write the report to a file instead of stdout')
+    args = parser.parse_args(argv)
+    
+    report = asyncio.run(run(args.host, args.port, args.sessions, args.moves, args.ai, args.difficulty, args.seed))
+    
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    
+    latency = report['move_latency_ms']
+    if latency:
+        print(
+            f"{report['moves']} moves in {report['elapsed']:.1f}s, "
+            f"latency p50 {latency['p50']:.1f}ms p99 {latency['p99']:.1f}ms",
+            file=sys.stderr
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
+import logging
+import multiprocessing
 import pygame
+import random
 import sys
+import time
 from threading import Thread
 from piece import Piece
+import snapshot
 import state
-from copy import deepcopy
 from board import Board
 from const import *
 from dragger import Dragger
@@ -11,6 +15,10 @@ from game import Game
 from move import Move
 from square import Square
 from ai import AI
+from difficulty import Difficulty
+from ponder import Ponder
+
+logger = logging.getLogger(__name__)
 
 # Main Class
 class Main:
@@ -21,8 +29,16 @@ class Main:
         self._init_screen()
         self.game = Game()
         self.ai = AI()
+        self.ponder = Ponder(self.ai)
         self.clicked_square: Square|None = None
+        self.best_move = None
+        
+        # Optional inputlog.EventRecorder, every frame's events are written to it
+        self.recorder = None
         
+        # Optional session.SessionLog, every move, undo, reset and AI decision is written to it
+        self.session = None
+    
     def _init_screen(self):
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         self.screen.fill(color='#ffffff')
@@ -31,27 +47,49 @@ class Main:
         self.chess_board = pygame.Surface((WIDTH, HEIGHT))
         self.screen.blit(self.chess_board, (0, 0), self.chess_board.get_rect(width=WIDTH, height=HEIGHT))
     
-    def ai_thread(thread, ai: AI, board: Board):
-        thread.best_move =  ai.find_best_move(deepcopy(board), 3)
+    def ai_thread(self, ai: AI, board: Board, difficulty: Difficulty):
+        ai.set_difficulty(difficulty)
+        self.best_move = ai.find_best_move(snapshot.copy(board), difficulty.depth, time_limit=difficulty.time_limit)
     
-    def main_game(self, screen: pygame.Surface, chess_board: pygame.Surface, game: Game, ai: AI, board: Board, dragger: Dragger):
+    '''
+    Draws a frame and handles its events, the ones pygame has
+    queued unless they are given, e.g. replayed from a file
+    
+    @return None
+    '''
+    def main_game(self, screen: pygame.Surface, chess_board: pygame.Surface, game: Game, ai: AI, board: Board, dragger: Dragger, events: list | None = None):
         if game.ai_enemy_enabled and game.ai_turn:
-            thread = Thread(target=self.ai_thread, args=(ai, game.board))
-            thread.start()
-            thread.join()
+            # Every decision gets its own seed, so a session log can repeat it
+            seed = random.getrandbits(32)
+            ai.random.seed(seed)
+            start = time.perf_counter()
+            
+            # The player made the reply the AI was pondering on, its search is (nearly) done
+            self.best_move = self.ponder.take(game.board, game.difficulty)
+            
+            if self.best_move is None:
+                thread = Thread(target=self.ai_thread, args=(ai, game.board, game.difficulty))
+                thread.start()
+                thread.join()
             
-            best_move = thread.best_move
+            best_move = self.best_move
             
-            if not isinstance(best_move, int):
-                piece, move = best_move
-                captured = board.squares[move.final.row][move.final.col].has_piece()
+            if best_move is not None:
+                # The search ran on a copy, play the move with the board's own piece
+                _, move = best_move
+                piece = game.board.squares[move.initial.row][move.initial.col].piece
                 game.board.move(piece, move)
                 
-                board.set_true_en_passant(dragger.piece)
-                game.play_sound(captured)
+                if self.session is not None:
+                    self.session.ai_move(game.board, move, game.difficulty_idx, game.difficulty, seed, ai, time.perf_counter() - start)
+                
+                game.on_move()
                 game.show_bg(screen, chess_board)
                 game.show_last_move(screen, chess_board)
                 game.show_pieces(screen, chess_board)
+                
+                # Keep searching on the player's time
+                self.ponder.start(game.board, game.difficulty)
             
             game.next_turn()
         
@@ -65,7 +103,10 @@ class Main:
         if dragger.dragging:
             dragger.update_blit(screen, chess_board)
         
-        for event in pygame.event.get():
+        if events is None:
+            events = pygame.event.get()
+        
+        for event in events:
             
             # Click Triggered
             if event.type == pygame.MOUSEBUTTONDOWN and not game.ai_turn:
@@ -142,11 +183,12 @@ class Main:
                     move = Move(initial, final)
                     
                     if board.valid_move(dragger.piece, move):
-                        captured = board.squares[released_row][released_col].has_piece()
-                        
                         board.move(dragger.piece, move)
-                        board.set_true_en_passant(dragger.piece)
-                        game.play_sound(captured)
+                        
+                        if self.session is not None:
+                            self.session.move(board, move)
+                        
+                        game.on_move()
                         game.show_bg(screen, chess_board)
                         game.show_last_move(screen, chess_board)
                         game.show_pieces(screen, chess_board)
@@ -162,17 +204,28 @@ class Main:
                     game.change_theme()
                     
                 elif event.key == pygame.K_r:
-                    self.mainloop(reset=True)
+                    self.reset()
+                    
+                    # The rest of the frame's events were meant for the old board
+                    return
                     
                 elif event.key == pygame.K_m:
                     game.enable_ai_enemy()
-                    print(f"AI is {'enabled' if  game.ai_enemy_enabled else 'disabled'}!")
+                    logger.info(f"AI is {'enabled' if  game.ai_enemy_enabled else 'disabled'}!")
                     
+                elif event.key == pygame.K_d:
+                    game.change_difficulty()
+                    logger.info(f"AI difficulty: {game.difficulty.name}")
+                
                 elif event.key == pygame.K_u:
                     if game.can_undo_last_move():
+                        self.ponder.stop()
                         game.undo_last_move()
                         
-                        game.play_sound()
+                        if self.session is not None:
+                            self.session.undo(game.board)
+                        
+                        game.on_undo()
                         game.show_bg(screen, chess_board)
                         game.show_last_move(screen, chess_board)
                         game.show_pieces(screen, chess_board)
@@ -188,24 +241,45 @@ class Main:
                 pygame.quit()
                 sys.exit()
     
+    def reset(self):
+        self.ponder.stop()
+        self.clicked_square = None
+        self.game.reset()
+        
+        if self.session is not None:
+            self.session.reset(self.game.board)
+    
     def mainloop(self, reset=False):
-        if reset: self.game.reset()
+        if reset: self.reset()
             
         screen = self.screen
         chess_board = self.chess_board
         game = self.game
-        board = self.game.board
-        dragger = self.game.dragger
         ai = self.ai
         
         while True:
+            # A reset sets up a new board and dragger
+            board = game.board
+            dragger = game.dragger
             game_state = game.get_state()
             
             if game_state == state.STATE_INITIAL or game_state == state.STATE_PLAYING:
-                self.main_game(screen, chess_board, game, ai, board, dragger)
+                events = pygame.event.get()
+                
+                if self.recorder is not None:
+                    self.recorder.record(events)
+                
+                self.main_game(screen, chess_board, game, ai, board, dragger, events)
                 
             pygame.display.update()
 
-# Create instance of Main class and execute mainloop() function
-main = Main()
-main.mainloop()
\ No newline at end of file
+# Create instance of Main class and execute mainloop() function, the
+# guard keeps the search worker processes from starting a game of their own
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    
+    # Game messages (AI toggles, checkmate, draws) go to the terminal
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
+    main = Main()
+    main.mainloop()
\ No newline at end of file
@@ -1,11 +1,19 @@
+from piece import *
 from square import Square
 
+# 3-bit codes of the promotion piece in an encoded move
+PROMOTION_CODES = {None: 0, KNIGHT: 1, BISHOP: 2, ROOK: 3, QUEEN: 4}
+PROMOTION_TYPES = {code: piece_type for piece_type, code in PROMOTION_CODES.items()}
+
 class Move:
     
-    def __init__(self, initial: Square, final: Square):
+    def __init__(self, initial: Square, final: Square, promotion: int | None = None):
         self.initial: Square = initial
         self.final: Square = final
         
+        # Piece type a pawn promotes to, a queen when not given
+        self.promotion = promotion
+        
     def __eq__(self, other: object) -> bool:
         if other == None:
             return False
@@ -14,4 +22,15 @@ class Move:
     
     def __repr__(self) -> str:
         return f'([{self.initial.row}, {self.initial.col}], [{self.final.row}, {self.final.col}])'
-    
\ No newline at end of file
+    
+    # Packs the move into 16 bits: from square, to square and promotion piece
+    def encode(self) -> int:
+        initial = self.initial.row * 8 + self.initial.col
+        final = self.final.row * 8 + self.final.col
+        return initial | (final << 6) | (PROMOTION_CODES[self.promotion] << 12)
+    
+    @staticmethod
+    def decode(code: int):
+        initial = code & 63
+        final = (code >> 6) & 63
+        return Move(Square(initial // 8, initial % 8), Square(final // 8, final % 8), PROMOTION_TYPES[code >> 12])
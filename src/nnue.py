@@ -0,0 +1,291 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import numpy as np
+from board import Board
+from const import *
+from move import PROMOTION_TYPES
+from piece import *
+from undo import EN_PASSANT_FLAG, CASTLING_FLAG
+
+MAGIC = b'PCNN'
+VERSION = 1
+
+# Header: magic, version, accumulator size, size of the dense layers
+HEADER = struct.Struct('<4sIII')
+
+HIDDEN = 64
+DENSE = 16
+
+# Inputs of a perspective: its king's square, a piece other than a king and the piece's square
+PIECE_INDEX = {PAWN: 0, KNIGHT: 1, BISHOP: 2, ROOK: 3, QUEEN: 4}
+INPUTS = 64 * 10 * 64
+
+# Accumulator values mapped to 1.0 by the clipped ReLU
+QA = 127
+
+COLORS = ('white', 'black')
+
+
+'''
+Input index of a piece on a square seen from a perspective,
+black sees the board with the ranks flipped and its own
+pieces first, like white does
+
+@return int
+'''
+def feature(perspective, king, color, piece_type, square):
+    if perspective == 1:
+        king ^= 56
+        square ^= 56
+    
+    own = 0 if color == COLORS[perspective] else 5
+    return (king * 10 + own + PIECE_INDEX[piece_type]) * 64 + square
+
+
+class Network:
+    '''
+    Efficiently updatable network: a feature transformer from the
+    (king square, piece, square) inputs of both sides to int16
+    accumulators, followed by two small dense layers and the output.
+    Only the transformer depends on the position, which is what lets
+    its output be updated move by move instead of computed again
+    '''
+    
+    def __init__(self, path=None, hidden=HIDDEN, dense=DENSE):
+        self.path = path
+        
+        if path is not None:
+            self.load(path)
+            return
+        
+        self.hidden = hidden
+        self.dense = dense
+        self.ft_weights = np.zeros((INPUTS, hidden), dtype=np.int16)
+        self.ft_bias = np.zeros(hidden, dtype=np.int16)
+        self.l1_weights = np.zeros((2 * hidden, dense), dtype=np.float32)
+        self.l1_bias = np.zeros(dense, dtype=np.float32)
+        self.l2_weights = np.zeros((dense, dense), dtype=np.float32)
+        self.l2_bias = np.zeros(dense, dtype=np.float32)
+        self.out_weights = np.zeros(dense, dtype=np.float32)
+        self.out_bias = np.zeros(1, dtype=np.float32)
+    
+    def layers(self):
+        return [
+            self.ft_weights, self.ft_bias, self.l1_weights, self.l1_bias,
+            self.l2_weights, self.l2_bias, self.out_weights, self.out_bias,
+        ]
+    
+    def load(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        
+        magic, version, self.hidden, self.dense = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a network file')
+        
+        hidden, dense = self.hidden, self.dense
+        shapes = [
+            (np.int16, (INPUTS, hidden)), (np.int16, (hidden,)),
+            (np.float32, (2 * hidden, dense)), (np.float32, (dense,)),
+            (np.float32, (dense, dense)), (np.float32, (dense,)),
+            (np.float32, (dense,)), (np.float32, (1,)),
+        ]
+        
+        offset = HEADER.size
+        arrays = []
+        for dtype, shape in shapes:
+            array = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+            arrays.append(array)
+            offset += array.nbytes
+        
+        (self.ft_weights, self.ft_bias, self.l1_weights, self.l1_bias,
+         self.l2_weights, self.l2_bias, self.out_weights, self.out_bias) = arrays
+    
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.hidden, self.dense))
+            
+            for array in self.layers():
+                file.write(np.ascontiguousarray(array).tobytes())
+    
+    '''
+    Score of the position from the side to move's point of view.
+    The board's accumulator is attached on the first call and kept
+    up to date by Board.move and Board.undo_last_move from then on
+    
+    @return int
+    '''
+    def evaluate(self, board: Board):
+        accumulator = board.accumulator
+        
+        if accumulator is None or accumulator.network is not self:
+            accumulator = board.accumulator = Accumulator(self)
+        
+        # The board was set up again or changed without a move
+        if accumulator.keys[accumulator.top] != board.hash:
+            accumulator.refresh(board)
+        
+        values = accumulator.values[accumulator.top]
+        side = 0 if board.current_player == 'white' else 1
+        return self.forward(values[side], values[1 - side])
+    
+    def forward(self, us, them):
+        inputs = np.concatenate((us, them)).clip(0, QA).astype(np.float32) / QA
+        hidden = np.maximum(inputs @ self.l1_weights + self.l1_bias, 0)
+        hidden = np.maximum(hidden @ self.l2_weights + self.l2_bias, 0)
+        return int(hidden @ self.out_weights + self.out_bias[0])
+
+
+class Accumulator:
+    '''
+    Transformer outputs of both perspectives for every position
+    from the last refresh down to the current one, so undoing a
+    move only steps back. A move only adds and removes the inputs
+    of the pieces it touches, a king move refreshes its own side
+    '''
+    
+    def __init__(self, network: Network, capacity=128):
+        self.network = network
+        self.values = np.zeros((capacity, 2, network.hidden), dtype=np.int16)
+        self.keys = [None] * capacity
+        self.top = 0
+    
+    def refresh(self, board: Board):
+        self.top = 0
+        self.keys[0] = board.hash
+        
+        for perspective in (0, 1):
+            self.refresh_perspective(board, perspective, self.values[0])
+    
+    def refresh_perspective(self, board: Board, perspective, values):
+        king = board.king(COLORS[perspective])
+        inputs = []
+        
+        for square in range(64):
+            piece = board.squares[square // 8][square % 8].piece
+            
+            if piece is not None and piece.type != KING:
+                inputs.append(feature(perspective, king, piece.color, piece.type, square))
+        
+        values[perspective] = (self.network.ft_bias + self.network.ft_weights[inputs].sum(axis=0)).astype(np.int16)
+    
+    # Called by Board.move once the move is on the board and in its undo history
+    def push(self, board: Board):
+        history = board.history
+        index = len(history) - 1
+        
+        if self.top + 1 == len(self.keys):
+            self.values = np.concatenate((self.values, np.zeros_like(self.values)))
+            self.keys.extend([None] * len(self.keys))
+        
+        info = history.info[index]
+        piece: Piece = history.pieces[index]
+        captured: Piece | None = history.captured[index]
+        initial, final = info & 63, (info >> 6) & 63
+        
+        removed = [(piece.color, piece.type, initial)]
+        added = [(piece.color, PROMOTION_TYPES[(info >> 12) & 7] or piece.type, final)]
+        
+        if captured is not None:
+            square = initial // 8 * 8 + final % 8 if info & EN_PASSANT_FLAG else final
+            removed.append((captured.color, captured.type, square))
+        
+        if info & CASTLING_FLAG:
+            row = initial // 8
+            rook_col, rook_final_col = (0, 3) if final % 8 < initial % 8 else (7, 5)
+            removed.append((piece.color, ROOK, row * 8 + rook_col))
+            added.append((piece.color, ROOK, row * 8 + rook_final_col))
+        
+        previous = self.values[self.top]
+        self.top += 1
+        values = self.values[self.top]
+        weights = self.network.ft_weights
+        
+        # Only a position the accumulator knew can be updated from
+        self.keys[self.top] = board.hash if self.keys[self.top - 1] == history.keys[index] else None
+        
+        for perspective in (0, 1):
+            if piece.type == KING and piece.color == COLORS[perspective]:
+                self.refresh_perspective(board, perspective, values)
+                continue
+            
+            king = board.king(COLORS[perspective])
+            values[perspective] = previous[perspective]
+            
+            for color, piece_type, square in removed:
+                if piece_type != KING:
+                    values[perspective] -= weights[feature(perspective, king, color, piece_type, square)]
+            
+            for color, piece_type, square in added:
+                if piece_type != KING:
+                    values[perspective] += weights[feature(perspective, king, color, piece_type, square)]
+    
+    # Called by Board.undo_last_move
+    def pop(self):
+        if self.top > 0:
+            self.top -= 1
+        else:
+            self.keys[0] = None
+
+
+'''
+A network that counts material from the side to move's point of
+view, for checking the evaluator and as a start for training: one
+accumulator unit holds the own material and one the enemy's
+
+@return Network
+'''
+def material_network(hidden=HIDDEN, dense=DENSE):
+    network = Network(hidden=hidden, dense=dense)
+    
+    # Material in units of 50 centipawns, 80 for the pieces of a side at the start
+    values = {PAWN: 2, KNIGHT: 6, BISHOP: 7, ROOK: 10, QUEEN: 18}
+    
+    for perspective in (0, 1):
+        for king in range(64):
+            for color in COLORS:
+                for piece_type, value in values.items():
+                    for square in range(64):
+                        unit = 0 if color == COLORS[perspective] else 1
+                        network.ft_weights[feature(perspective, king, color, piece_type, square), unit] = value
+    
+    network.l1_weights[0, 0] = network.l1_weights[1, 1] = 1
+    network.l2_weights[0, 0] = network.l2_weights[1, 1] = 1
+    network.out_weights[0], network.out_weights[1] = QA * 50, -QA * 50
+    return network
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NNUE-style network evaluator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    init = commands.add_parser('init', help='write a material-only network')
+    init.add_argument('network')
+    init.add_argument('--hidden', type=int, default=HIDDEN, help='accumulator size')
+    init.add_argument('--dense', type=int, default=DENSE, help='size of the dense layers')
+    
+    evaluate = commands.add_parser('eval', help='evaluate a position with a network')
+    evaluate.add_argument('network')
+    evaluate.add_argument('--fen', default=STARTING_FEN)
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'init':
+        material_network(args.hidden, args.dense).save(args.network)
+        print(f'wrote {args.network}, {os.path.getsize(args.network)} bytes', file=sys.stderr)
+        return
+    
+    board = Board()
+    board.load_fen(args.fen)
+    
+    network = Network(args.network)
+    start = time.perf_counter()
+    score = network.evaluate(board)
+    print(f'{score} ({(time.perf_counter() - start) * 1000:.2f}ms)')
+
+
+if __name__ == '__main__':
+    main()
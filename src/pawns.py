@@ -0,0 +1,69 @@
+from array import array
+
+# Default number of entries, a power of two
+PAWN_TABLE_SIZE = 16384
+
+
+class PawnTable:
+    '''
+    Cache of pawn structure scores keyed by the pawn-only
+    Zobrist key. Pawns rarely move between sibling nodes of
+    the search, so most lookups are hits. The misses are the
+    first lookups of the structures the search reaches, which
+    no size avoids. An entry is simply overwritten when
+    another structure maps to its slot
+    '''
+    
+    def __init__(self, size=PAWN_TABLE_SIZE):
+        if size <= 0 or size & (size - 1):
+            raise ValueError(f'Pawn table size must be a power of two, got {size}')
+        
+        self.size = size
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('i', bytes(4 * size))
+        self.filled = bytearray(size)
+        
+        self.hits = 0
+        self.misses = 0
+    
+    '''
+    Returns the cached score of a pawn structure,
+    or None when it has not been stored
+    
+    @return int|None
+    '''
+    def probe(self, key):
+        index = key & self.mask
+        
+        if self.filled[index] and self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        
+        self.misses += 1
+        return None
+    
+    def store(self, key, score):
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+        self.filled[index] = 1
+    
+    def clear(self):
+        self.filled = bytearray(self.size)
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self):
+        probes = self.hits + self.misses
+        
+        return dict(
+            size=self.size,
+            used=sum(self.filled),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / probes if probes else 0.0,
+        )
@@ -0,0 +1,315 @@
+import re
+from board import Board
+from const import *
+from move import Move
+from piece import *
+from square import Square
+
+LETTERS = {
+    KNIGHT: 'N',
+    BISHOP: 'B',
+    ROOK: 'R',
+    QUEEN: 'Q',
+    KING: 'K'
+}
+PIECE_LETTERS = {letter: piece_type for piece_type, letter in LETTERS.items()}
+
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|\(|\)|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{}();$]+')
+SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+# Tags that always come first, in this order
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+
+
+def square_name(row, col):
+    return f'{Square.get_alphacol(col)}{8 - row}'
+
+
+'''
+Returns the Standard Algebraic Notation of a move,
+without the check suffix since that depends on the
+position after the move (see suffix())
+
+@return str
+'''
+def san(board: Board, move: Move, legal_moves: dict | None = None):
+    piece: Piece = board.squares[move.initial.row][move.initial.col].piece
+    target = square_name(move.final.row, move.final.col)
+    
+    if isinstance(piece, King) and board.castling(move.initial, move.final):
+        return 'O-O' if move.final.col > move.initial.col else 'O-O-O'
+    
+    capture = board.squares[move.final.row][move.final.col].has_enemy_piece(piece.color)
+    
+    if isinstance(piece, Pawn):
+        # A diagonal pawn move is always a capture, en passant included
+        if move.initial.col != move.final.col:
+            text = f'{Square.get_alphacol(move.initial.col)}x{target}'
+        else:
+            text = target
+        
+        if move.final.row in (0, 7):
+            text += f"={LETTERS[move.promotion or QUEEN]}"
+        
+        return text
+    
+    # Disambiguate between pieces of the same type that can reach the same square
+    if legal_moves is None:
+        legal_moves = board.get_legal_moves(piece.color)
+    
+    same_file = same_rank = ambiguous = False
+    for square, other in legal_moves.items():
+        row, col = square // 8, square % 8
+        
+        if other.type != piece.type or (row, col) == (move.initial.row, move.initial.col):
+            continue
+        
+        if any(m.final.row == move.final.row and m.final.col == move.final.col for m in other.valid_moves):
+            ambiguous = True
+            same_file = same_file or col == move.initial.col
+            same_rank = same_rank or row == move.initial.row
+    
+    origin = ''
+    if ambiguous:
+        if not same_file:
+            origin = Square.get_alphacol(move.initial.col)
+        elif not same_rank:
+            origin = str(8 - move.initial.row)
+        else:
+            origin = square_name(move.initial.row, move.initial.col)
+    
+    return f"{LETTERS[piece.type]}{origin}{'x' if capture else ''}{target}"
+
+
+'''
+Returns the check (+) or checkmate (#) suffix
+for the position reached after a move
+
+@return str
+'''
+def suffix(board: Board):
+    if not board.is_check(color=board.current_player):
+        return ''
+    
+    return '#' if len(board.get_legal_moves()) == 0 else '+'
+
+
+def write_game(file, tags: dict, sans: list[str], result: str):
+    tags = dict(tags, Result=result)
+    ordered = [name for name in SEVEN_TAG_ROSTER if name in tags] + \
+        [name for name in tags if name not in SEVEN_TAG_ROSTER]
+    
+    for name in ordered:
+        value = str(tags[name]).replace('\\', '\\\\').replace('"', '\\"')
+        file.write(f'[{name} "{value}"]\n')
+    
+    file.write('\n')
+    
+    # Games set up from a FEN may start with black to move and at a later move number
+    fields = tags.get('FEN', '').split()
+    black_first = len(fields) > 1 and fields[1] == 'b'
+    number = int(fields[5]) if len(fields) > 5 else 1
+    
+    tokens = []
+    for index, text in enumerate(sans):
+        white_to_move = (index % 2 == 0) != black_first
+        
+        if white_to_move:
+            tokens.append(f'{number}.')
+        elif index == 0:
+            tokens.append(f'{number}...')
+        
+        tokens.append(text)
+        
+        if not white_to_move:
+            number += 1
+    
+    tokens.append(result)
+    
+    # Wrap the movetext at 80 columns
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            file.write(line + '\n')
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    
+    file.write(line + '\n\n')
+
+
+class Game:
+    
+    def __init__(self, tags: dict | None = None, moves: list[str] | None = None, result='*'):
+        self.tags = tags if tags is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+    
+    def __repr__(self) -> str:
+        return f"Game({self.tags.get('White', '?')} - {self.tags.get('Black', '?')}, {len(self.moves)} moves, {self.result})"
+
+
+def _parse_movetext(text: str):
+    moves = []
+    result = '*'
+    depth = 0
+    
+    for token in TOKEN.findall(text):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(depth - 1, 0)
+        elif depth > 0 or token[0] in '{;$' or token[0].isdigit() and token.endswith('.'):
+            # Variations, comments, NAGs and move numbers carry no moves of the main line
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    
+    return moves, result
+
+
+'''
+Streams the games of a PGN file one at a time, only
+the game being parsed is kept in memory
+
+@return Iterator[Game]
+'''
+def read_games(file):
+    tags = {}
+    movetext = []
+    
+    for line in file:
+        line = line.strip()
+        
+        # Escaped lines are reserved for other programs
+        if line.startswith('%'):
+            continue
+        
+        if line.startswith('['):
+            # A tag after movetext starts the next game
+            if movetext:
+                moves, result = _parse_movetext('\n'.join(movetext))
+                yield Game(tags, moves, tags.get('Result', result) if result == '*' else result)
+                tags, movetext = {}, []
+            
+            match = TAG.match(line)
+            if match:
+                tags[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+        elif line:
+            movetext.append(line)
+    
+    if tags or movetext:
+        moves, result = _parse_movetext('\n'.join(movetext))
+        yield Game(tags, moves, tags.get('Result', result) if result == '*' else result)
+
+
+'''
+Resolves a SAN move against the moves the pieces of
+the side to move can legally make
+
+@return Move
+'''
+def parse_san(board: Board, text: str):
+    text = text.rstrip('+#!?')
+    color = board.current_player
+    row = 7 if color == 'white' else 0
+    
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        final_col = 6 if len(text) == 3 else 2
+        candidates = [(row, 4, KING)]
+        target = (row, final_col)
+        promotion = None
+    else:
+        match = SAN.match(text)
+        if not match:
+            raise ValueError(f'Invalid SAN move: {text}')
+        
+        letter, from_file, from_rank, square, promotion = match.groups()
+        piece_type = PIECE_LETTERS[letter] if letter else PAWN
+        target = (ROWS - int(square[1]), ord(square[0]) - ord('a'))
+        promotion = PIECE_LETTERS[promotion] if promotion else None
+        
+        candidates = []
+        for _row in range(ROWS):
+            if from_rank and _row != ROWS - int(from_rank):
+                continue
+            
+            for _col in range(COLS):
+                if from_file and _col != ord(from_file) - ord('a'):
+                    continue
+                
+                candidates.append((_row, _col, piece_type))
+    
+    # Only generate moves for the pieces that could have played this move
+    for _row, _col, piece_type in candidates:
+        square = board.squares[_row][_col]
+        
+        if not square.has_team_piece(color) or square.piece.type != piece_type:
+            continue
+        
+        piece: Piece = square.piece
+        board.calc_moves(piece, _row, _col)
+        moves = piece.valid_moves
+        piece.clear_valid_moves()
+        
+        for move in moves:
+            if (move.final.row, move.final.col) == target:
+                move.promotion = promotion
+                return move
+    
+    raise ValueError(f'Illegal move {text} in {board.generate_fen()}')
+
+
+'''
+Replays a game, yielding every position together with
+the move played from it before the move is made
+
+@return Iterator[tuple[Board, Move]]
+'''
+def replay(game: Game, board: Board | None = None):
+    if board is None:
+        board = Board()
+    
+    board.load_fen(game.tags.get('FEN', STARTING_FEN))
+    
+    for text in game.moves:
+        move = parse_san(board, text)
+        yield board, move
+        board.play(move)
+
+
+'''
+Writes the game played on a board as PGN, replaying
+it from its start position to produce the SAN moves
+
+@return None
+'''
+def export(board: Board, file, tags: dict | None = None):
+    tags = dict(tags or {})
+    replayed = Board()
+    replayed.load_fen(board.start_fen)
+    
+    if board.start_fen != STARTING_FEN:
+        tags.setdefault('FEN', board.start_fen)
+        tags.setdefault('SetUp', '1')
+    
+    for name in SEVEN_TAG_ROSTER:
+        tags.setdefault(name, '?')
+    
+    sans = []
+    for move in board.played_moves():
+        move = Move(
+            Square(move.initial.row, move.initial.col),
+            Square(move.final.row, move.final.col, replayed.squares[move.final.row][move.final.col].piece),
+            move.promotion
+        )
+        text = san(replayed, move)
+        replayed.play(move)
+        sans.append(text + suffix(replayed))
+    
+    write_game(file, tags, sans, board.result() or '*')
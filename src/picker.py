@@ -0,0 +1,155 @@
+import attacks
+from board import Board
+from const import *
+from move import Move
+from piece import *
+from square import Square
+
+# Killer moves kept for every ply of the search
+KILLER_SLOTS = 2
+MAX_PLY = 64
+
+class MovePicker:
+    '''
+    Hands out the legal moves of a position one at a time, each
+    stage generated only once the ones before it are used up: the
+    hash move, captures that do not lose material by SEE, the killer
+    moves, quiet moves, and the losing captures last. A cutoff on an
+    early move skips the rest of the generation, and legality is only
+    checked for a move right before it is handed out
+    '''
+    
+    def __init__(self, ai, board: Board, hash_move: int | None = None, killers=(), captures_only=False):
+        self.ai = ai
+        self.board = board
+        self.hash_move = hash_move
+        self.killers = killers
+        self.captures_only = captures_only
+        
+        # Encoded moves handed out so far, a move can come up in more than one stage
+        self.played = set()
+    
+    def __iter__(self):
+        board = self.board
+        
+        if self.hash_move is not None and not self.captures_only:
+            hash_move = self._pseudo_legal(self.hash_move)
+            
+            if hash_move is not None and self._legal(*hash_move):
+                self.played.add(self.hash_move)
+                yield hash_move
+        
+        captures = sorted(self._captures(), key=lambda capture: -capture[0])
+        losing = []
+        
+        for score, piece, move in captures:
+            if score < 0:
+                losing.append((piece, move))
+            elif move.encode() not in self.played and self._legal(piece, move):
+                yield piece, move
+        
+        if self.captures_only:
+            return
+        
+        for code in self.killers:
+            if code is None or code in self.played:
+                continue
+            
+            killer = self._pseudo_legal(code)
+            
+            # A killer from a sibling position may capture here, it already came up with the captures
+            if killer is not None and not self.ai.is_capture(board, *killer) and self._legal(*killer):
+                self.played.add(code)
+                yield killer
+        
+        for piece, move in self._quiets():
+            if move.encode() not in self.played and self._legal(piece, move):
+                yield piece, move
+        
+        for piece, move in losing:
+            if move.encode() not in self.played and self._legal(piece, move):
+                yield piece, move
+    
+    '''
+    Captures of the side to move with their exchange values,
+    found from the attack tables of every enemy piece
+    
+    @return list[tuple[int, Piece, Move]]
+    '''
+    def _captures(self):
+        board = self.board
+        color = board.current_player
+        captures = []
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                target = board.squares[row][col].piece
+                
+                if target is None or target.color == color or target.type == KING:
+                    continue
+                
+                for piece, (_row, _col) in board._attackers(color, row * 8 + col):
+                    move = Move(Square(_row, _col), Square(row, col, target))
+                    captures.append((self.ai.see(board, move), piece, move))
+        
+        # En passant, the pawn taken is not on the target square
+        if board.en_passant_square is not None:
+            row, col = divmod(board.en_passant_square, 8)
+            
+            for _row, _col in attacks.PAWN_ATTACKERS[color][board.en_passant_square]:
+                piece = board.squares[_row][_col].piece
+                
+                if piece is not None and piece.type == PAWN and piece.color == color:
+                    move = Move(Square(_row, _col), Square(row, col, board.squares[_row][col].piece))
+                    captures.append((self.ai.see(board, move), piece, move))
+        
+        return captures
+    
+    def _quiets(self):
+        board = self.board
+        color = board.current_player
+        
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board.squares[row][col].piece
+                
+                if piece is not None and piece.color == color:
+                    board.calc_moves(piece, row, col, fromMain=False)
+                    
+                    # The search overwrites valid_moves before this loop comes back
+                    for move in list(piece.valid_moves):
+                        if not self.ai.is_capture(board, piece, move):
+                            yield piece, move
+    
+    '''
+    Turns an encoded move back into a move of the side to
+    move, if its piece can make it, legal or not
+    
+    @return tuple[Piece, Move]|None
+    '''
+    def _pseudo_legal(self, code):
+        board = self.board
+        wanted = Move.decode(code)
+        piece = board.squares[wanted.initial.row][wanted.initial.col].piece
+        
+        if piece is None or piece.color != board.current_player:
+            return None
+        
+        board.calc_moves(piece, wanted.initial.row, wanted.initial.col, fromMain=False)
+        for move in piece.valid_moves:
+            if move == wanted:
+                return piece, move
+        
+        return None
+    
+    def _legal(self, piece: Piece, move: Move):
+        board = self.board
+        
+        # The king may not castle out of or through check
+        if piece.type == KING and abs(move.final.col - move.initial.col) == 2:
+            passing = Move(move.initial, Square(move.initial.row, (move.initial.col + move.final.col) // 2))
+            
+            if board.is_check(color=piece.color) or board.in_check(piece, passing):
+                return False
+        
+        return not board.in_check(piece, move)
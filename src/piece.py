@@ -46,8 +46,6 @@ class Pawn(Piece):
     def __init__(self, color, original_position=dict):
         self.type = PAWN
         self.dir = -1 if color == 'white' else 1
-        self.en_passant = False
-        self.en_passant_capture_location = dict()
         super().__init__('pawn', color, PAWN, original_position=original_position)
         
 class Knight(Piece):
@@ -0,0 +1,107 @@
+import time
+import snapshot
+from threading import Thread
+from ai import AI
+from board import Board
+from difficulty import Difficulty
+from move import Move
+
+class Ponder:
+    '''
+    Thinks on the player's time: after the AI moves, searches the
+    position that follows the reply it expects in a background
+    thread. When the player makes that reply (a ponder hit) the
+    search becomes the AI's own and only gets what is left of the
+    move's time budget. On a miss it is dropped, and the AI searches
+    as usual with the transposition table the ponder search warmed
+    '''
+    
+    def __init__(self, ai: AI):
+        self.ai = ai
+        self.thread: Thread | None = None
+        
+        # Expected reply, the position it leads to, its Zobrist key and the root scores found so far
+        self.reply: Move | None = None
+        self.board: Board | None = None
+        self.key = None
+        self.scores = []
+        self.started = 0.0
+        
+        self.hits = 0
+        self.misses = 0
+    
+    '''
+    Starts pondering on the position after the AI's move,
+    if the last search left an expected reply
+    
+    @return bool whether a ponder search was started
+    '''
+    def start(self, board: Board, difficulty: Difficulty):
+        self.stop()
+        
+        # Node budgets keep the weak levels weak, pondering would make them stronger
+        if difficulty.nodes:
+            return False
+        
+        board = snapshot.copy(board)
+        reply = self.ai.expected_reply(board)
+        if reply is None:
+            return False
+        
+        piece, move = reply
+        board.move(piece, move, testing=True)
+        
+        self.ai.set_difficulty(difficulty)
+        self.ai.abort = False
+        self.ai.deadline = None
+        
+        self.reply = move
+        self.board = board
+        self.key = board.hash
+        self.scores = []
+        self.started = time.perf_counter()
+        self.thread = Thread(target=self._search, args=(board, difficulty.depth), daemon=True)
+        self.thread.start()
+        return True
+    
+    def _search(self, board: Board, depth):
+        self.scores = self.ai.ponder(board, depth)
+    
+    '''
+    Called when it is the AI's turn. On a ponder hit waits for the
+    ponder search, which stops once the time since pondering began
+    reaches the move's time budget, and returns its move
+    
+    @return tuple[Piece, Move]|None the move on the pondered copy of the board, None on a miss
+    '''
+    def take(self, board: Board, difficulty: Difficulty):
+        if self.thread is None:
+            return None
+        
+        if board.hash != self.key or difficulty.nodes:
+            self.misses += 1
+            self.stop()
+            return None
+        
+        self.hits += 1
+        
+        if difficulty.time_limit:
+            self.ai.deadline = self.started + difficulty.time_limit
+        
+        self.thread.join()
+        self.thread = None
+        self.ai.deadline = None
+        
+        return self.ai.choose_move(self.board, self.scores)
+    
+    # Aborts the ponder search, whatever it stored in the transposition table stays
+    def stop(self):
+        if self.thread is not None:
+            self.ai.abort = True
+            self.thread.join()
+            self.ai.abort = False
+            self.ai.deadline = None
+            self.thread = None
+    
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
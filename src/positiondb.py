@@ -0,0 +1,315 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+import pgn
+from board import Board
+from const import *
+from move import Move
+
+MAGIC = b'PCDB'
+VERSION = 1
+
+# Header: magic, version, number of records
+HEADER = struct.Struct('<4sIQ')
+
+# Record: position key, game id, encoded move, result of the game
+RECORD = struct.Struct('<QIHBx')
+
+# Index of the first record of every 16-bit key prefix, plus an end marker
+FANOUT_BITS = 16
+FANOUT = struct.Struct(f'<{(1 << FANOUT_BITS) + 1}Q')
+KEY = struct.Struct('<Q')
+OFFSET = struct.Struct('<Q')
+
+RESULT_CODES = {'1-0': 0, '1/2-1/2': 1, '0-1': 2, '*': 3}
+RESULT_NAMES = ['white', 'draws', 'black', 'unknown']
+
+# Tags kept for every game in the database
+GAME_TAGS = ['Event', 'Date', 'White', 'Black', 'Result']
+
+_board: Board | None = None
+
+
+def _init_worker():
+    global _board
+    _board = Board()
+
+
+'''
+Replays a game and packs one record for every
+position reached before a move was played
+
+@return tuple[int, dict, bytes]
+'''
+def game_records(item):
+    game_id, game = item
+    result = RESULT_CODES.get(game.result, RESULT_CODES['*'])
+    records = []
+    
+    try:
+        for board, move in pgn.replay(game, _board):
+            records.append(RECORD.pack(board.hash, game_id, move.encode(), result))
+    except ValueError:
+        # Keep the positions replayed before an illegal or unreadable move
+        pass
+    
+    return game_id, {name: game.tags[name] for name in GAME_TAGS if name in game.tags}, b''.join(records)
+
+
+class PositionDB:
+    '''
+    Read side of the database: the sorted record file is
+    memory-mapped and searched with the fanout table and
+    a binary search, nothing is loaded up front
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a position database')
+        
+        self.fanout_offset = HEADER.size
+        self.records_offset = HEADER.size + FANOUT.size
+        
+        self.games_file = open(path + '.games', 'rb')
+        self.game_offsets = open(path + '.gidx', 'rb')
+    
+    def close(self):
+        self.mm.close()
+        self.file.close()
+        self.games_file.close()
+        self.game_offsets.close()
+    
+    def _key_at(self, index):
+        return KEY.unpack_from(self.mm, self.records_offset + index * RECORD.size)[0]
+    
+    def lookup(self, key):
+        prefix = key >> (64 - FANOUT_BITS)
+        low = OFFSET.unpack_from(self.mm, self.fanout_offset + prefix * OFFSET.size)[0]
+        high = OFFSET.unpack_from(self.mm, self.fanout_offset + (prefix + 1) * OFFSET.size)[0]
+        
+        # Lower bound of the key inside its prefix range
+        while low < high:
+            middle = (low + high) // 2
+            
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        
+        index = low
+        while index < self.count:
+            record_key, game_id, move, result = RECORD.unpack_from(self.mm, self.records_offset + index * RECORD.size)
+            
+            if record_key != key:
+                break
+            
+            yield game_id, move, result
+            index += 1
+    
+    '''
+    Counts how often every move was played from a position
+    and how the games continued
+    
+    @return dict[int, dict]
+    '''
+    def stats(self, key):
+        moves = {}
+        
+        for _, move, result in self.lookup(key):
+            entry = moves.setdefault(move, dict(games=0, white=0, draws=0, black=0, unknown=0))
+            entry['games'] += 1
+            entry[RESULT_NAMES[result]] += 1
+        
+        return dict(sorted(moves.items(), key=lambda item: -item[1]['games']))
+    
+    def games(self, key, limit=None):
+        game_ids = []
+        
+        for game_id, _, _ in self.lookup(key):
+            if game_ids and game_ids[-1] == game_id:
+                continue
+            
+            game_ids.append(game_id)
+            if limit and len(game_ids) >= limit:
+                break
+        
+        return game_ids
+    
+    def game(self, game_id):
+        self.game_offsets.seek(game_id * OFFSET.size)
+        offset = OFFSET.unpack(self.game_offsets.read(OFFSET.size))[0]
+        self.games_file.seek(offset)
+        return json.loads(self.games_file.readline())
+
+
+class PositionDBBuilder:
+    '''
+    Write side of the database: records are appended to an
+    unsorted log, indexing splits the log into buckets by key
+    prefix so each one can be sorted in memory on its own
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + '.log'
+    
+    def next_game_id(self):
+        if not os.path.exists(path := self.path + '.gidx'):
+            return 0
+        
+        return os.path.getsize(path) // OFFSET.size
+    
+    def add(self, pgn_paths, workers=1):
+        game_id = self.next_game_id()
+        positions = 0
+        
+        def items():
+            nonlocal game_id
+            
+            for pgn_path in pgn_paths:
+                with open(pgn_path, errors='replace') as file:
+                    for game in pgn.read_games(file):
+                        yield game_id, game
+                        game_id += 1
+        
+        with open(self.log_path, 'ab') as log, \
+                open(self.path + '.games', 'ab') as games, \
+                open(self.path + '.gidx', 'ab') as offsets, \
+                multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            for _, tags, records in pool.imap(game_records, items(), chunksize=16):
+                offsets.write(OFFSET.pack(games.tell()))
+                games.write(json.dumps(tags).encode() + b'\n')
+                log.write(records)
+                positions += len(records) // RECORD.size
+        
+        return positions
+    
+    def index(self, buckets=256):
+        if buckets < 1 or buckets & (buckets - 1):
+            raise ValueError(f'Number of buckets must be a power of two, got {buckets}')
+        
+        bucket_bits = buckets.bit_length() - 1
+        fanout = [0] * ((1 << FANOUT_BITS) + 1)
+        count = 0
+        
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(self.path))) as tmp:
+            bucket_files = [open(os.path.join(tmp, f'{bucket}.bin'), 'wb') for bucket in range(buckets)]
+            
+            # Split the log by key prefix, reading it in bounded chunks
+            with open(self.log_path, 'rb') as log:
+                while chunk := log.read(RECORD.size * 65536):
+                    for offset in range(0, len(chunk), RECORD.size):
+                        key = KEY.unpack_from(chunk, offset)[0]
+                        bucket_files[key >> (64 - bucket_bits)].write(chunk[offset:offset + RECORD.size])
+            
+            for bucket_file in bucket_files:
+                bucket_file.close()
+            
+            with open(self.path + '.tmp', 'wb') as out:
+                out.write(HEADER.pack(MAGIC, VERSION, 0))
+                out.write(FANOUT.pack(*fanout))
+                
+                for bucket in range(buckets):
+                    with open(os.path.join(tmp, f'{bucket}.bin'), 'rb') as bucket_file:
+                        records = sorted(RECORD.iter_unpack(bucket_file.read()))
+                    
+                    for record in records:
+                        fanout[(record[0] >> (64 - FANOUT_BITS)) + 1] += 1
+                    
+                    out.write(b''.join(RECORD.pack(*record) for record in records))
+                    count += len(records)
+                
+                # Turn the per-prefix counts into start indexes
+                for prefix in range(1, len(fanout)):
+                    fanout[prefix] += fanout[prefix - 1]
+                
+                out.seek(0)
+                out.write(HEADER.pack(MAGIC, VERSION, count))
+                out.write(FANOUT.pack(*fanout))
+        
+        os.replace(self.path + '.tmp', self.path)
+        return count
+
+
+def query_board(args):
+    board = Board()
+    board.load_fen(args.fen or STARTING_FEN)
+    
+    for text in args.moves or []:
+        board.play(pgn.parse_san(board, text))
+    
+    return board
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Position database built from PGN files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    add = commands.add_parser('add', help='append the positions of PGN files to the database log')
+    add.add_argument('db')
+    add.add_argument('pgn', nargs='+')
+    add.add_argument('--workers', type=int, default=os.cpu_count())
+    
+    index = commands.add_parser('index', help='sort the log into the memory-mapped index')
+    index.add_argument('db')
+    index.add_argument('--buckets', type=int, default=256, help='power of two, more buckets use less memory')
+    
+    query = commands.add_parser('query', help='move statistics of a position')
+    query.add_argument('db')
+    query.add_argument('--fen')
+    query.add_argument('--moves', nargs='*', help='SAN moves played from the FEN or the start position')
+    query.add_argument('--games', type=int, default=10, help='number of games to list')
+    
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    
+    if args.command == 'add':
+        positions = PositionDBBuilder(args.db).add(args.pgn, args.workers)
+        print(f'added {positions} positions in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+    
+    elif args.command == 'index':
+        if args.buckets < 1 or args.buckets & (args.buckets - 1):
+            parser.error('--buckets must be a power of two')
+        
+        count = PositionDBBuilder(args.db).index(args.buckets)
+        print(f'indexed {count} positions in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+    
+    else:
+        board = query_board(args)
+        
+        db = PositionDB(args.db)
+        key = board.hash
+        
+        start = time.perf_counter()
+        stats = db.stats(key)
+        games = db.games(key, args.games)
+        elapsed = time.perf_counter() - start
+        
+        moves = {}
+        for code, entry in stats.items():
+            move = Move.decode(code)
+            moves[pgn.san(board, move)] = entry
+        
+        report = dict(
+            key=f'{key:016x}',
+            moves=moves,
+            games=[dict(id=game_id, **db.game(game_id)) for game_id in games],
+            query_ms=elapsed * 1000,
+        )
+        print(json.dumps(report, indent=2))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
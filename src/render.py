@@ -0,0 +1,101 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import pygame
+from const import *
+from game import Game
+from sound import SoundBank
+
+# Board sizes in pixels written for every position by default
+SIZES = [400]
+
+_game: Game | None = None
+_surfaces: dict[int, tuple[pygame.Surface, pygame.Surface]] = {}
+
+
+def _init_worker(theme):
+    global _game
+    
+    # Draw without a window and leave SIGTERM to the pool
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')
+    pygame.display.init()
+    pygame.font.init()
+    
+    _game = Game(sounds=SoundBank(enabled=False))
+    _game.config.idx = theme
+    _game.config.theme = _game.config.themes[theme]
+
+
+# Keeps the first four fields of a FEN or EPD line, the move counters do not change the picture
+def read_fens(files):
+    for file in files:
+        for line in file:
+            fields = line.split()
+            
+            if fields and not fields[0].startswith('#'):
+                yield ' '.join(fields[:4])
+
+
+'''
+Draws a position with the game's own board and piece
+drawing, once for every size, and saves the images
+
+@return int number of images written
+'''
+def render(job):
+    index, fen, sizes, directory = job
+    game = _game
+    game.board.load_fen(fen)
+    
+    for size in sizes:
+        if size not in _surfaces:
+            _surfaces[size] = pygame.Surface((size, size)), pygame.Surface((size, size))
+        
+        screen, chess_board = _surfaces[size]
+        game.sqsize = size // COLS
+        game.show_bg(screen, chess_board)
+        game.show_pieces(screen, chess_board)
+        
+        pygame.image.save(screen, os.path.join(directory, f'{index:06d}_{size}px.png'))
+    
+    return len(sizes)
+
+
+def render_all(fens, directory, sizes=SIZES, theme=0, workers=1, chunksize=32):
+    os.makedirs(directory, exist_ok=True)
+    jobs = ((index, fen, sizes, directory) for index, fen in enumerate(fens))
+    images = 0
+    
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(theme,)) as pool:
+        for count in pool.imap_unordered(render, jobs, chunksize=chunksize):
+            images += count
+    
+    return images
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render board diagrams of FEN positions to PNG files')
+    parser.add_argument('input', nargs='*', help='files with one FEN or EPD position per line, stdin when none')
+    parser.add_argument('--output', default='diagrams', help='directory the images are written to')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='board sizes in pixels, multiples of 8')
+    parser.add_argument('--theme', type=int, default=0, choices=range(4), help='0 green, 1 brown, 2 blue, 3 gray')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=32, help='positions handed to a worker at a time')
+    args = parser.parse_args(argv)
+    
+    files = [open(path) for path in args.input] or [sys.stdin]
+    start = time.perf_counter()
+    images = render_all(read_fens(files), args.output, args.sizes, args.theme, args.workers, args.chunksize)
+    elapsed = time.perf_counter() - start
+    
+    for file in files:
+        file.close()
+    
+    print(f'rendered {images} images in {elapsed:.1f}s, {images / elapsed * 60:.0f} per minute', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import pgn
+import snapshot
+from ai import AI
+from board import Board
+from difficulty import Difficulty, difficulty_by_name, DIFFICULTIES, DEFAULT_DIFFICULTY
+from move import Move
+from piece import *
+
+PORT = 5555
+COLORS = ('white', 'black')
+PROMOTION_LETTERS = {'n': KNIGHT, 'b': BISHOP, 'r': ROOK, 'q': QUEEN}
+
+_ai: AI | None = None
+
+
+def _init_worker():
+    global _ai
+    _ai = AI()
+
+
+'''
+Searches a position sent as a snapshot in a worker process,
+the history only comes along for finding repetitions
+
+@return int|None the encoded move
+'''
+def search(job):
+    position, history, name = job
+    board = snapshot.from_bytes(position)
+    board.history = history
+    
+    # The server's workers are the parallelism, a game's search stays in one process
+    preset = difficulty_by_name(name)
+    _ai.set_difficulty(Difficulty(preset.name, preset.depth, preset.time_limit, preset.nodes, preset.noise, preset.multipv))
+    
+    best_move = _ai.find_best_move(board, preset.depth, time_limit=preset.time_limit)
+    return best_move[1].encode() if best_move else None
+
+
+# Coordinate notation of the protocol, e.g. e2e4 and e7e8q
+def uci(move: Move):
+    text = pgn.square_name(move.initial.row, move.initial.col) + pgn.square_name(move.final.row, move.final.col)
+    
+    for letter, piece_type in PROMOTION_LETTERS.items():
+        if move.promotion == piece_type:
+            text += letter
+    
+    return text
+
+
+'''
+Legal moves of the side to move by coordinate notation, a
+promotion is listed once for every piece it can promote to
+
+@return dict[str, tuple[Piece, Move]]
+'''
+def legal_moves(board: Board):
+    moves = {}
+    
+    for piece in board.get_legal_moves().values():
+        for move in piece.valid_moves:
+            if isinstance(piece, Pawn) and move.final.row in (0, 7):
+                for piece_type in PROMOTION_LETTERS.values():
+                    promotion = Move(move.initial, move.final, piece_type)
+                    moves[uci(promotion)] = piece, promotion
+            else:
+                moves[uci(move)] = piece, move
+    
+    return moves
+
+
+class Room:
+    '''
+    A game hosted by the server: its board, the connections of
+    its players and spectators, and the AI when it plays one side
+    '''
+    
+    def __init__(self, game_id, ai_color=None, difficulty=DIFFICULTIES[DEFAULT_DIFFICULTY].name):
+        self.id = game_id
+        self.board = Board()
+        self.sans = []
+        self.result = None
+        self.players = {'white': None, 'black': None}
+        self.spectators = set()
+        self.ai_color = ai_color
+        self.difficulty = difficulty
+        self.thinking = False
+        self.legal = legal_moves(self.board)
+    
+    def connections(self):
+        return [writer for writer in self.players.values() if writer is not None] + list(self.spectators)
+    
+    def free_color(self):
+        for color in COLORS:
+            if self.players[color] is None and color != self.ai_color:
+                return color
+        
+        return None
+    
+    def play(self, piece: Piece, move: Move):
+        text = pgn.san(self.board, move)
+        self.board.move(piece, move)
+        self.sans.append(text + pgn.suffix(self.board))
+        self.result = self.board.result()
+        self.legal = legal_moves(self.board) if self.result is None else {}
+    
+    def update(self):
+        return dict(
+            op='update',
+            game=self.id,
+            ply=len(self.sans),
+            move=self.sans[-1] if self.sans else None,
+            fen=self.board.generate_fen(),
+            turn=self.board.current_player,
+            result=self.result,
+            legal=sorted(self.legal),
+        )
+
+
+class GameServer:
+    '''
+    Hosts many games in one process. Connections speak JSON lines:
+    new, join, watch and move requests, answered with joined and
+    update messages (or error). Moves are checked by the rules
+    engine, and every update goes to the game's players and
+    spectators. AI moves are searched in a pool of worker processes
+    '''
+    
+    def __init__(self, workers=1):
+        self.rooms: dict[int, Room] = {}
+        self.next_id = 1
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker)
+        
+        # The event loop only keeps weak references to tasks
+        self.tasks = set()
+    
+    async def send(self, writer: asyncio.StreamWriter, message: dict):
+        if writer.is_closing():
+            return
+        
+        writer.write(json.dumps(message).encode() + b'\n')
+        
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+    
+    async def broadcast(self, room: Room, message: dict):
+        await asyncio.gather(*(self.send(writer, message) for writer in room.connections()))
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        rooms = set()
+        
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    await self.dispatch(request, writer, rooms)
+                except (ValueError, KeyError, TypeError) as error:
+                    await self.send(writer, dict(op='error', message=str(error)))
+        except ConnectionError:
+            pass
+        finally:
+            for room in rooms:
+                self.leave(room, writer)
+            
+            writer.close()
+    
+    async def dispatch(self, request: dict, writer: asyncio.StreamWriter, rooms: set):
+        op = request['op']
+        
+        if op == 'new':
+            ai_color = request.get('ai')
+            if ai_color not in (None, *COLORS):
+                raise ValueError(f'Unknown color: {ai_color}')
+            
+            difficulty = request.get('difficulty', DIFFICULTIES[DEFAULT_DIFFICULTY].name)
+            try:
+                difficulty_by_name(difficulty)
+            except KeyError:
+                raise ValueError(f'Unknown difficulty: {difficulty}')
+            
+            room = Room(self.next_id, ai_color, difficulty)
+            self.rooms[room.id] = room
+            self.next_id += 1
+            await self.join(room, writer, rooms, request.get('color'))
+            return
+        
+        room = self.rooms.get(request['game'])
+        if room is None:
+            raise ValueError(f"No game {request['game']}")
+        
+        if op == 'join':
+            await self.join(room, writer, rooms, request.get('color'))
+        elif op == 'watch':
+            room.spectators.add(writer)
+            rooms.add(room)
+            await self.send(writer, dict(op='joined', game=room.id, color=None))
+            await self.send(writer, room.update())
+        elif op == 'move':
+            await self.move(room, writer, request['move'])
+        else:
+            raise ValueError(f'Unknown op: {op}')
+    
+    async def join(self, room: Room, writer: asyncio.StreamWriter, rooms: set, color=None):
+        color = color or room.free_color()
+        if color not in COLORS or room.players[color] is not None or color == room.ai_color:
+            raise ValueError(f'No free seat in game {room.id}')
+        
+        room.players[color] = writer
+        rooms.add(room)
+        await self.send(writer, dict(op='joined', game=room.id, color=color))
+        await self.send(writer, room.update())
+        
+        if room.board.current_player == room.ai_color and not room.thinking:
+            self.start_ai_move(room)
+    
+    async def move(self, room: Room, writer: asyncio.StreamWriter, text: str):
+        color = room.board.current_player
+        
+        if room.players[color] is not writer:
+            raise ValueError('Not your turn')
+        if room.thinking or room.result is not None:
+            raise ValueError('No move can be played now')
+        if text not in room.legal:
+            raise ValueError(f'Illegal move {text}')
+        
+        room.play(*room.legal[text])
+        await self.broadcast(room, room.update())
+        
+        if room.result is None and room.board.current_player == room.ai_color:
+            self.start_ai_move(room)
+    
+    def start_ai_move(self, room: Room):
+        task = asyncio.create_task(self.ai_move(room))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+    
+    async def ai_move(self, room: Room):
+        room.thinking = True
+        board = room.board
+        job = (snapshot.to_bytes(board), board.history.records(), room.difficulty)
+        
+        try:
+            code = await asyncio.get_running_loop().run_in_executor(self.pool, search, job)
+            
+            # The game was closed while the AI was thinking
+            if room.id not in self.rooms or code is None:
+                return
+            
+            # The search leaves the promotion piece out when it is a queen
+            text = uci(Move.decode(code))
+            room.play(*room.legal[text if text in room.legal else text + 'q'])
+        except Exception as error:
+            if room.id not in self.rooms:
+                return
+            
+            # A failed search (a crashed worker, a move the rules engine refuses) resigns the game for the AI
+            room.result = '0-1' if room.ai_color == 'white' else '1-0'
+            room.legal = {}
+            await self.broadcast(room, dict(op='error', game=room.id, message=f'AI move failed: {error!r}'))
+        finally:
+            room.thinking = False
+        
+        await self.broadcast(room, room.update())
+    
+    def leave(self, room: Room, writer: asyncio.StreamWriter):
+        room.spectators.discard(writer)
+        
+        for color in COLORS:
+            if room.players[color] is writer:
+                room.players[color] = None
+        
+        if not room.connections():
+            self.rooms.pop(room.id, None)
+    
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 16, backlog=4096)
+        print(f'serving on {host}:{port}', file=sys.stderr)
+        
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Host many games over TCP, one JSON message per line')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes searching AI moves')
+    args = parser.parse_args(argv)
+    
+    server = GameServer(args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown(cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from ai import AI
+from board import Board
+from difficulty import Difficulty, DIFFICULTIES
+from move import Move
+
+MAGIC = b'PCSL'
+VERSION = 1
+
+# Header: magic, version
+HEADER = struct.Struct('<4sI')
+
+# Step: operation, difficulty level, depth budget, completed depth, encoded move,
+# board state after the step, seed, node budget, nodes searched, time budget,
+# seconds the step took and Zobrist key after the step. 36 bytes
+RECORD = struct.Struct('<BBBBHBxIIIffQ')
+
+# Operations
+NEW = 0
+MOVE = 1
+UNDO = 2
+AI_MOVE = 3
+RESET = 4
+
+OPERATIONS = {NEW: 'new', MOVE: 'move', UNDO: 'undo', AI_MOVE: 'ai', RESET: 'reset'}
+
+PERCENTILES = [50, 90, 99]
+
+
+class SessionLog:
+    '''
+    Append-only log of the games played in the window: every move,
+    undo, reset and AI decision, with the key of the position it
+    led to. AI decisions keep their seed and budgets so they can be
+    searched again. Every step is flushed as soon as it is written
+    '''
+    
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+        
+        # Every window starts a new session, and its own AI
+        self.write(NEW, 0, 0)
+    
+    def write(self, operation, key, board_state, level=0, depth=0, completed_depth=0, code=0, seed=0, nodes=0, searched=0, time_limit=0.0, elapsed=0.0):
+        self.file.write(RECORD.pack(
+            operation, level, depth, completed_depth, code, board_state, seed,
+            nodes, searched, time_limit, elapsed, key
+        ))
+        self.file.flush()
+    
+    def move(self, board: Board, move: Move):
+        self.write(MOVE, board.hash, board.state, code=move.encode())
+    
+    def undo(self, board: Board):
+        self.write(UNDO, board.hash, board.state)
+    
+    def reset(self, board: Board):
+        self.write(RESET, board.hash, board.state)
+    
+    def ai_move(self, board: Board, move: Move, level, difficulty: Difficulty, seed, ai: AI, elapsed):
+        self.write(
+            AI_MOVE, board.hash, board.state, level, difficulty.depth, ai.completed_depth, move.encode(), seed,
+            difficulty.nodes or 0, ai.nodes, difficulty.time_limit or 0.0, elapsed
+        )
+    
+    def close(self):
+        self.file.close()
+
+
+'''
+Reads the steps of a session log
+
+@return list[tuple]
+'''
+def read_log(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a session log')
+    
+    # A step cut short when the game was killed is left out
+    end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+    return list(RECORD.iter_unpack(data[HEADER.size:end]))
+
+
+'''
+Plays the steps of a log again through Board and AI, checking
+the position after every step against the recorded key and board
+state. AI decisions are searched again with their seed, as deep
+as the recorded search got and with its node budget; a different
+move is a divergence, the recorded move is played either way so
+the rest of the log still compares. With search=False the
+recorded AI moves are only played
+
+@return dict
+'''
+def replay(job):
+    path, search = job
+    steps = read_log(path)
+    board = None
+    ai = None
+    divergences = []
+    timings = {name: [] for name in OPERATIONS.values()}
+    
+    def diverged(index, kind, **details):
+        divergences.append(dict(path=path, step=index, kind=kind, **details))
+    
+    for index, step in enumerate(steps):
+        operation, level, depth, completed_depth, code, board_state, seed, nodes, searched, time_limit, elapsed, key = step
+        start = time.perf_counter()
+        
+        if operation in (NEW, RESET):
+            board = Board()
+            
+            # The window keeps its AI, and its transposition table, across resets
+            if operation == NEW or ai is None:
+                ai = AI()
+        
+        elif operation == UNDO:
+            board.undo_last_move()
+        
+        elif operation in (MOVE, AI_MOVE):
+            if operation == AI_MOVE and search:
+                preset = DIFFICULTIES[level]
+                ai.set_difficulty(Difficulty(preset.name, depth, None, nodes or None, preset.noise, preset.multipv))
+                ai.random.seed(seed)
+                best_move = ai.find_best_move(board, max(1, completed_depth))
+                
+                if best_move is None or best_move[1].encode() != code:
+                    diverged(
+                        index, 'ai', expected=code, got=best_move[1].encode() if best_move else None,
+                        difficulty=preset.name, time_limit=time_limit
+                    )
+            
+            legal = ai.legal_move(board, code)
+            if legal is None:
+                diverged(index, 'illegal', move=code)
+                break
+            
+            piece, move = legal
+            board.move(piece, Move(move.initial, move.final, Move.decode(code).promotion))
+        
+        timings[OPERATIONS[operation]].append(time.perf_counter() - start)
+        
+        if operation != NEW and (board.hash != key or board.state != board_state):
+            diverged(index, 'position', expected=f'{key:016x}', got=f'{board.hash:016x}', state=board.state, expected_state=board_state)
+            break
+    
+    return dict(path=path, steps=len(steps), sessions=sum(step[0] == NEW for step in steps), divergences=divergences, timings=timings)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    
+    values = sorted(values)
+    result = {f'p{p}': values[min(len(values) - 1, len(values) * p // 100)] * 1000 for p in PERCENTILES}
+    result['max'] = values[-1] * 1000
+    result['mean'] = sum(values) / len(values) * 1000
+    return result
+
+
+def replay_logs(paths, search=True, workers=1):
+    steps = 0
+    sessions = 0
+    divergences = []
+    timings = {name: [] for name in OPERATIONS.values()}
+    
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(replay, [(path, search) for path in paths]):
+            steps += result['steps']
+            sessions += result['sessions']
+            divergences += result['divergences']
+            
+            for name, values in result['timings'].items():
+                timings[name] += values
+            
+            print(f"{result['path']}: {result['steps']} steps, {len(result['divergences'])} divergences", file=sys.stderr)
+    
+    return dict(
+        logs=len(paths),
+        sessions=sessions,
+        steps=steps,
+        divergences=len(divergences),
+        step_ms={name: percentiles(values) for name, values in timings.items() if values},
+        time=sum(sum(values) for values in timings.values()),
+        details=divergences,
+    )
+
+
+def record(path):
+    from main import Main
+    
+    main = Main()
+    main.session = SessionLog(path)
+    
+    try:
+        main.mainloop()
+    finally:
+        main.session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record game sessions and replay them headless against the engine')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    record_command = commands.add_parser('record', help='play, appending the session to a log')
+    record_command.add_argument('log')
+    
+    replay_command = commands.add_parser('replay', help='replay session logs and report divergences')
+    replay_command.add_argument('logs', nargs='+')
+    replay_command.add_argument('--no-search', action='store_true', help='play the recorded AI moves without searching them again')
+    replay_command.add_argument('--workers', type=int, default=os.cpu_count())
+    replay_command.add_argument('--output', metavar='PATH', help='write the report to a file instead of stdout')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'record':
+        record(args.log)
+        return
+    
+    start = time.perf_counter()
+    report = replay_logs(args.logs, not args.no_search, args.workers)
+    elapsed = time.perf_counter() - start
+    
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    
+    print(f"{report['steps']} steps of {report['sessions']} sessions in {elapsed:.1f}s, {report['divergences']} divergences", file=sys.stderr)
+    
+    if report['divergences']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import struct
+from board import Board
+from const import *
+from piece import *
+from square import Square
+from undo import UndoStack, PIECE_CODES, NO_SQUARE
+
+# Snapshot: piece codes of the 64 squares two to a byte, side to move
+# and castling rights, en passant square, board state, halfmove
+# clock, fullmove number and Zobrist key. 48 bytes, fixed size
+SNAPSHOT = struct.Struct('<32sBBBxHHQ')
+SIZE = SNAPSHOT.size
+
+# The key alone, read without unpacking the rest
+KEY = struct.Struct('<Q')
+KEY_OFFSET = SIZE - KEY.size
+
+TYPE_LETTERS = {PAWN: 'p', KNIGHT: 'n', BISHOP: 'b', ROOK: 'r', QUEEN: 'q', KING: 'k'}
+TYPE_CLASSES = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen, KING: King}
+
+# Color, class and FEN letter of every piece code
+PIECES = {code: (color, TYPE_CLASSES[piece_type]) for (color, piece_type), code in PIECE_CODES.items()}
+LETTERS = {
+    code: TYPE_LETTERS[piece_type].upper() if color == 'white' else TYPE_LETTERS[piece_type]
+    for (color, piece_type), code in PIECE_CODES.items()
+}
+
+# Castling rights of Board.castling_mask with the squares of their king and rook
+CASTLING = [('K', 7, 7), ('Q', 7, 0), ('k', 0, 7), ('q', 0, 0)]
+
+
+def fullmove(board: Board):
+    fields = board.start_fen.split()
+    start = int(fields[5]) if len(fields) > 5 else 1
+    black = len(fields) > 1 and fields[1] == 'b'
+    
+    return start + (len(board.history) + black) // 2
+
+
+'''
+Packs a position into a buffer at an offset, a bytearray,
+an mmap or the buffer of a shared memory block
+
+@return None
+'''
+def pack_into(board: Board, buffer, offset=0):
+    placement = bytearray(32)
+    
+    for square in range(64):
+        piece = board.squares[square // 8][square % 8].piece
+        
+        if piece is not None:
+            placement[square >> 1] |= PIECE_CODES[(piece.color, piece.type)] << (4 * (square & 1))
+    
+    flags = (board.current_player == 'black') | (board.castling_mask << 1)
+    en_passant = NO_SQUARE if board.en_passant_square is None else board.en_passant_square
+    
+    SNAPSHOT.pack_into(
+        buffer, offset, bytes(placement), flags, en_passant, board.state,
+        min(board.move_counter, 0xFFFF), min(fullmove(board), 0xFFFF), board.hash
+    )
+
+
+def to_bytes(board: Board):
+    buffer = bytearray(SIZE)
+    pack_into(board, buffer)
+    return bytes(buffer)
+
+
+# A board with nothing set up, Board() would set up the start position and its hashes only for everything to be overwritten
+def _blank():
+    board = Board.__new__(Board)
+    board.squares = [[None] * COLS for _ in range(ROWS)]
+    board.history = UndoStack()
+    board.score = 0
+    board.accumulator = None
+    return board
+
+
+'''
+Sets up a board from a snapshot read in place from a buffer,
+the board given is reused. Pieces get the moved state FEN loading
+gives them, kings and rooks only keep castling rights they still have
+
+@return Board
+'''
+def from_bytes(data, offset=0, board: Board | None = None):
+    placement, flags, en_passant, board_state, halfmove, fullmove_number, key = SNAPSHOT.unpack_from(data, offset)
+    
+    if board is None:
+        board = _blank()
+    
+    castling_mask = flags >> 1
+    unmoved = set()
+    for bit, (_, row, rook_col) in enumerate(CASTLING):
+        if castling_mask & (1 << bit):
+            unmoved.add((row, 4))
+            unmoved.add((row, rook_col))
+    
+    rows = []
+    for row in range(ROWS):
+        rank = ''
+        empty = 0
+        
+        for col in range(COLS):
+            square = row * 8 + col
+            code = (placement[square >> 1] >> (4 * (square & 1))) & 15
+            
+            if not code:
+                board.squares[row][col] = Square(row, col)
+                empty += 1
+                continue
+            
+            color, cls = PIECES[code]
+            piece: Piece = cls(color, original_position=dict(row=row, col=col))
+            
+            if cls is Pawn:
+                piece.moved = row != (6 if color == 'white' else 1)
+            elif cls in (King, Rook):
+                piece.moved = (row, col) not in unmoved
+            else:
+                piece.moved = True
+            
+            piece.current_position = dict(row=row, col=col)
+            if piece.moved:
+                piece.original_position = dict(row=None, col=None)
+            
+            board.squares[row][col] = Square(row, col, piece)
+            rank += (str(empty) if empty else '') + LETTERS[code]
+            empty = 0
+        
+        rows.append(rank + (str(empty) if empty else ''))
+    
+    board._locate_kings()
+    board.castling_mask = castling_mask
+    board.en_passant_square = None if en_passant == NO_SQUARE else en_passant
+    board.current_player = 'black' if flags & 1 else 'white'
+    board.state = board_state
+    board.last_move = None
+    board.winner = ''
+    board.history.clear()
+    board.move_counter = halfmove
+    board.hash = key
+    board.pawn_hash = board.pawn_key()
+    
+    rights = ''.join(right for bit, (right, _, _) in enumerate(CASTLING) if castling_mask & (1 << bit)) or '-'
+    target = '-' if board.en_passant_square is None else Square.get_alphacol(en_passant % 8) + str(ROWS - en_passant // 8)
+    board.start_fen = f"{'/'.join(rows)} {'b' if flags & 1 else 'w'} {rights} {target} {halfmove} {fullmove_number}"
+    return board
+
+
+'''
+A board to search a position on its own, set up from a snapshot
+of another one. It keeps the records of the other board's history
+without their pieces: repetitions of earlier positions are still
+found, the moves played before it cannot be undone
+
+@return Board
+'''
+def copy(board: Board, into: Board | None = None):
+    position = from_bytes(to_bytes(board), board=into)
+    position.history = board.history.records()
+    position.start_fen = board.start_fen
+    position.last_move = board.last_move
+    return position
+
+
+class SnapshotArray:
+    '''
+    Fixed-size snapshots laid out one after the other in a buffer
+    (bytes, a bytearray, an mmap or a shared memory block). Nothing
+    is copied: items are views into the buffer and positions are
+    read from it and written to it in place
+    '''
+    
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+    
+    def __len__(self):
+        return len(self.view) // SIZE
+    
+    def __getitem__(self, index):
+        return self.view[index * SIZE:(index + 1) * SIZE]
+    
+    def key(self, index):
+        return KEY.unpack_from(self.view, index * SIZE + KEY_OFFSET)[0]
+    
+    def load(self, index, board: Board | None = None):
+        return from_bytes(self.view, index * SIZE, board)
+    
+    def store(self, index, board: Board):
+        pack_into(board, self.view, index * SIZE)
+    
+    def release(self):
+        self.view.release()
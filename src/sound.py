@@ -1,10 +1,49 @@
+import os
 import pygame
 
-class Sound:
+# Game events that make a sound
+MOVE = 'move'
+CAPTURE = 'capture'
+UNDO = 'undo'
+
+EFFECTS = {
+    'move': os.path.join('assets/sounds/move.wav'),
+    'capture': os.path.join('assets/sounds/capture.wav'),
+}
+
+# Effect played for every event
+EVENT_EFFECTS = {MOVE: 'move', CAPTURE: 'capture', UNDO: 'move'}
+
+class SoundBank:
+    '''
+    Decodes every sound effect once, up front, and plays each
+    on a mixer channel reserved for it, so a capture never cuts
+    off a move sound. Without a working mixer (no audio device,
+    or enabled=False) events are simply ignored
+    '''
+    
+    def __init__(self, enabled=True):
+        self.sounds: dict[str, pygame.mixer.Sound] = {}
+        self.channels: dict[str, pygame.mixer.Channel] = {}
+        self.enabled = enabled and self._init_mixer()
+        
+        if self.enabled:
+            pygame.mixer.set_reserved(len(EFFECTS))
+            
+            for index, (name, path) in enumerate(EFFECTS.items()):
+                self.sounds[name] = pygame.mixer.Sound(path)
+                self.channels[name] = pygame.mixer.Channel(index)
     
-    def __init__(self, path):
-        self.path = path
-        self.sound = pygame.mixer.Sound(path)
+    def _init_mixer(self):
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+        except pygame.error:
+            return False
+        
+        return True
     
-    def play(self):
-        pygame.mixer.Sound.play(self.sound)
\ No newline at end of file
+    def play(self, event):
+        if self.enabled:
+            effect = EVENT_EFFECTS[event]
+            self.channels[effect].play(self.sounds[effect])
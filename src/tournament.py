@@ -0,0 +1,329 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import pgn
+import snapshot
+from ai import AI
+from board import Board
+from move import Move
+from square import Square
+
+# Short opening suite, each position is played twice with colors swapped
+OPENINGS = [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkb1r/pppppppp/5n2/8/2P5/8/PP1PPPPP/RNBQKBNR w KQkq - 1 2',
+    'rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3',
+]
+
+
+def load_engine(spec: str, default_name: str):
+    # An engine is either a path to a JSON file or an inline JSON object
+    if os.path.exists(spec):
+        with open(spec) as file:
+            engine = json.load(file)
+        engine.setdefault('name', os.path.splitext(os.path.basename(spec))[0])
+    else:
+        engine = json.loads(spec)
+    
+    engine.setdefault('name', default_name)
+    engine.setdefault('depth', 2)
+    engine.setdefault('weights', {})
+    return engine
+
+
+def load_openings(path: str | None):
+    if path is None:
+        return list(OPENINGS)
+    
+    openings = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            
+            if line and not line.startswith('#'):
+                # Accept plain FENs as well as EPD lines with trailing operations
+                openings.append(' '.join(line.split()[:6]))
+    
+    return openings
+
+
+'''
+Plays a single engine-vs-engine game from an opening
+position and returns its moves and result
+
+@return dict
+'''
+def play_game(job: dict):
+    board = Board()
+    board.load_fen(job['opening'])
+    
+    engines = {}
+    for color in ('white', 'black'):
+        spec = job[color]
+        ai = AI()
+        ai.set_weights(spec['weights'])
+        ai.load_network(spec.get('network'))
+        ai.load_book(spec.get('book'))
+        engines[color] = (spec, ai)
+    
+    base, increment = job['tc'] if job['tc'] else (None, 0.0)
+    clocks = {'white': base, 'black': base}
+    sans = []
+    result = None
+    termination = 'normal'
+    
+    while result is None:
+        if len(sans) >= job['max_plies']:
+            result, termination = '1/2-1/2', 'adjudication'
+            break
+        
+        color = board.current_player
+        spec, ai = engines[color]
+        
+        # Fixed time per move, or a slice of the remaining clock
+        if job['movetime']:
+            budget = job['movetime']
+        elif clocks[color] is not None:
+            budget = max(clocks[color] / 30 + increment * 0.8, 0.01)
+        else:
+            budget = None
+        
+        start = time.perf_counter()
+        best_move = ai.find_best_move(snapshot.copy(board), spec['depth'], time_limit=budget)
+        elapsed = time.perf_counter() - start
+        
+        if clocks[color] is not None:
+            clocks[color] -= elapsed
+            
+            if clocks[color] < 0:
+                result = '0-1' if color == 'white' else '1-0'
+                termination = 'time forfeit'
+                break
+            
+            clocks[color] += increment
+        
+        _, best = best_move
+        move = Move(
+            Square(best.initial.row, best.initial.col),
+            Square(best.final.row, best.final.col, board.squares[best.final.row][best.final.col].piece)
+        )
+        
+        text = pgn.san(board, move)
+        board.play(move)
+        sans.append(text + pgn.suffix(board))
+        result = board.result()
+    
+    return dict(
+        index=job['index'],
+        opening=job['opening'],
+        white=job['white']['name'],
+        black=job['black']['name'],
+        result=result,
+        termination=termination,
+        sans=sans,
+    )
+
+
+def elo(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, float('inf')
+    
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    
+    def to_elo(s):
+        if s <= 0: return -float('inf')
+        if s >= 1: return float('inf')
+        return -400 * math.log10(1 / s - 1)
+    
+    return to_elo(score), (to_elo(min(score + margin, 1)) - to_elo(max(score - margin, 0))) / 2
+
+
+'''
+Log-likelihood ratio of the trinomial SPRT between the
+hypotheses elo0 and elo1, using the normal approximation
+
+@return float
+'''
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    games = wins + draws + losses
+    if games == 0 or wins + losses == 0:
+        return 0.0
+    
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    
+    if variance == 0:
+        return 0.0
+    
+    s0 = 1 / (1 + 10 ** (-elo0 / 400))
+    s1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return (s1 - s0) * (2 * score - s0 - s1) / (2 * variance / games)
+
+
+class Tournament:
+    
+    def __init__(self, engine_a, engine_b, openings, rounds=1, tc=None, movetime=None, max_plies=200,
+                 elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.engine_a = engine_a
+        self.engine_b = engine_b
+        self.openings = openings
+        self.rounds = rounds
+        self.tc = tc
+        self.movetime = movetime
+        self.max_plies = max_plies
+        
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        
+        # Results from engine A's point of view
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+    
+    def jobs(self):
+        index = 0
+        
+        for _ in range(self.rounds):
+            for opening in self.openings:
+                for white, black in ((self.engine_a, self.engine_b), (self.engine_b, self.engine_a)):
+                    index += 1
+                    yield dict(
+                        index=index, opening=opening, white=white, black=black,
+                        tc=self.tc, movetime=self.movetime, max_plies=self.max_plies,
+                    )
+    
+    def record(self, game: dict):
+        if game['result'] == '1/2-1/2':
+            self.draws += 1
+        elif (game['result'] == '1-0') == (game['white'] == self.engine_a['name']):
+            self.wins += 1
+        else:
+            self.losses += 1
+    
+    def llr(self):
+        return sprt_llr(self.wins, self.draws, self.losses, self.elo0, self.elo1)
+    
+    def decision(self):
+        llr = self.llr()
+        
+        if llr >= self.upper: return 'H1'
+        if llr <= self.lower: return 'H0'
+        return None
+    
+    def summary(self):
+        rating, margin = elo(self.wins, self.draws, self.losses)
+        return dict(
+            engine_a=self.engine_a['name'],
+            engine_b=self.engine_b['name'],
+            games=self.wins + self.draws + self.losses,
+            wins=self.wins,
+            draws=self.draws,
+            losses=self.losses,
+            elo=rating,
+            elo_margin=margin,
+            sprt=dict(
+                elo0=self.elo0, elo1=self.elo1,
+                llr=self.llr(), lower=self.lower, upper=self.upper,
+                decision=self.decision(),
+            ),
+        )
+    
+    def run(self, workers, pgn_file, stop_on_sprt=False):
+        with multiprocessing.Pool(workers) as pool:
+            for game in pool.imap_unordered(play_game, self.jobs()):
+                self.record(game)
+                
+                tags = dict(
+                    Event='Self-play tournament',
+                    Site='?',
+                    Date=time.strftime('%Y.%m.%d'),
+                    Round=game['index'],
+                    White=game['white'],
+                    Black=game['black'],
+                    FEN=game['opening'],
+                    SetUp='1',
+                    Termination=game['termination'],
+                )
+                pgn.write_game(pgn_file, tags, game['sans'], game['result'])
+                pgn_file.flush()
+                
+                summary = self.summary()
+                print(
+                    f"game {game['index']}: {game['result']} "
+                    f"+{self.wins} ={self.draws} -{self.losses} "
+                    f"elo {summary['elo']:.1f} +/- {summary['elo_margin']:.1f} "
+                    f"llr {summary['sprt']['llr']:.2f} [{self.lower:.2f}, {self.upper:.2f}]",
+                    file=sys.stderr
+                )
+                
+                if stop_on_sprt and self.decision():
+                    pool.terminate()
+                    break
+        
+        return self.summary()
+
+
+def parse_tc(value: str):
+    base, _, increment = value.partition('+')
+    return float(base), float(increment or 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play engine-vs-engine games in parallel')
+    parser.add_argument('--engine-a', default='{"name": "A"}', help='JSON file or inline JSON: name, depth, weights, network, book')
+    parser.add_argument('--engine-b', default='{"name": "B"}', help='JSON file or inline JSON: name, depth, weights, network, book')
+    parser.add_argument('--openings', metavar='PATH', help='FEN/EPD file, one position per line')
+    parser.add_argument('--rounds', type=int, default=1, help='times the opening suite is played')
+    parser.add_argument('--tc', type=parse_tc, help='clock per side as base+increment in seconds, e.g. 60+0.5')
+    parser.add_argument('--movetime', type=float, help='fixed seconds per move')
+    parser.add_argument('--max-plies', type=int, default=200, help='adjudicate a draw after this many plies')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--pgn', metavar='PATH', help='append games to a PGN file instead of stdout')
+    parser.add_argument('--elo0', type=float, default=0.0)
+    parser.add_argument('--elo1', type=float, default=10.0)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--sprt', action='store_true', help='stop as soon as the SPRT reaches a decision')
+    parser.add_argument('--summary', metavar='PATH', help='write the final summary as JSON')
+    args = parser.parse_args(argv)
+    
+    engine_a = load_engine(args.engine_a, 'A')
+    engine_b = load_engine(args.engine_b, 'B')
+    if engine_a['name'] == engine_b['name']:
+        engine_b['name'] += '-2'
+    
+    tournament = Tournament(
+        engine_a, engine_b, load_openings(args.openings),
+        rounds=args.rounds, tc=args.tc, movetime=args.movetime, max_plies=args.max_plies,
+        elo0=args.elo0, elo1=args.elo1, alpha=args.alpha, beta=args.beta,
+    )
+    
+    pgn_file = open(args.pgn, 'a') if args.pgn else sys.stdout
+    try:
+        summary = tournament.run(args.workers, pgn_file, stop_on_sprt=args.sprt)
+    finally:
+        if args.pgn: pgn_file.close()
+    
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            json.dump(summary, file, indent=2)
+    
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+from array import array
+
+# Default number of entries, a power of two
+TT_SIZE = 1 << 18
+
+# Kind of score stored in an entry
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable:
+    '''
+    Search results keyed by the board's Zobrist key: depth
+    searched, score and its bound, and the best move found.
+    Entries live in parallel fixed-size arrays, a new result
+    replaces the old one unless that was searched deeper
+    '''
+    
+    def __init__(self, size=TT_SIZE):
+        if size <= 0 or size & (size - 1):
+            raise ValueError(f'Transposition table size must be a power of two, got {size}')
+        
+        self.size = size
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.depths = array('b', bytes(size))
+        self.flags = array('B', bytes(size))
+        self.scores = array('i', bytes(4 * size))
+        self.moves = array('H', bytes(2 * size))
+        self.filled = bytearray(size)
+        
+        self.hits = 0
+        self.misses = 0
+    
+    '''
+    Returns the entry stored for a position,
+    or None when there is none
+    
+    @return tuple[int, int, int, int|None]|None depth, flag, score and encoded best move
+    '''
+    def probe(self, key):
+        index = key & self.mask
+        
+        if self.filled[index] and self.keys[index] == key:
+            self.hits += 1
+            return self.depths[index], self.flags[index], self.scores[index], self.moves[index] or None
+        
+        self.misses += 1
+        return None
+    
+    def store(self, key, depth, flag, score, move: int | None):
+        index = key & self.mask
+        
+        # Keep a deeper result of the same position
+        if self.filled[index] and self.keys[index] == key and self.depths[index] > depth:
+            return
+        
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.flags[index] = flag
+        self.scores[index] = score
+        self.moves[index] = move or 0
+        self.filled[index] = 1
+    
+    def best_move(self, key):
+        index = key & self.mask
+        
+        if self.filled[index] and self.keys[index] == key:
+            return self.moves[index] or None
+        
+        return None
+    
+    def clear(self):
+        self.filled = bytearray(self.size)
+        self.reset_stats()
+    
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self):
+        probes = self.hits + self.misses
+        
+        return dict(
+            size=self.size,
+            used=sum(self.filled),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / probes if probes else 0.0,
+        )
@@ -0,0 +1,322 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+import pgn
+from ai import AI, PIECE_TYPES
+from board import Board
+from const import *
+from piece import *
+
+# One column for every tuned number: the weight's name and its key or index in the table
+FEATURES = (
+    [('MATERIAL_VALUES', piece_type) for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN)]
+    + [('PAWN_TABLE', square) for square in range(64)]
+    + [('PIECE_VALUES', piece_type) for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN)]
+    + [('MOBILITY_BONUS', None), ('KING_SAFETY_BONUS', None)]
+    + [('DOUBLED_PAWN_PENALTY', None), ('ISOLATED_PAWN_PENALTY', None), ('BACKWARD_PAWN_PENALTY', None)]
+    + [('PASSED_PAWN_BONUS', rank) for rank in range(8)]
+)
+COLUMNS = {feature: index for index, feature in enumerate(FEATURES)}
+
+# Game results in half points for white, the last column of every row
+RESULTS = {'1-0': 2, '1/2-1/2': 1, '0-1': 0}
+
+# Rows read from the feature matrix at a time
+CHUNK = 1 << 16
+
+_ai: AI | None = None
+_board: Board | None = None
+_skip_plies = 0
+
+
+def _init_worker(skip_plies):
+    global _ai, _board, _skip_plies
+    
+    _ai = AI()
+    _board = Board()
+    _skip_plies = skip_plies
+
+
+'''
+Counts every term of AI.evaluate for a position, from white's
+point of view, so the evaluation is the dot product of the counts
+with the weights. Has to follow AI.evaluate and AI.evaluate_pawns;
+whether a capture wins material by SEE is taken as fixed
+
+@return list[int]
+'''
+def features(ai: AI, board: Board):
+    values = [0] * len(FEATURES)
+    
+    for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+        values[COLUMNS['MATERIAL_VALUES', piece_type]] = len(board.pieces(piece_type, 'white')) - len(board.pieces(piece_type, 'black'))
+    
+    files = {'white': [[] for _ in range(COLS)], 'black': [[] for _ in range(COLS)]}
+    
+    for row in range(ROWS):
+        for col in range(COLS):
+            piece = board.squares[row][col].piece
+            
+            if isinstance(piece, Pawn):
+                files[piece.color][col].append(row)
+    
+    for color, sign in (('white', 1), ('black', -1)):
+        own = files[color]
+        enemy = files['black' if color == 'white' else 'white']
+        ahead = (lambda a, b: a < b) if color == 'white' else (lambda a, b: a > b)
+        direction = -1 if color == 'white' else 1
+        
+        for col in range(COLS):
+            if len(own[col]) > 1:
+                values[COLUMNS['DOUBLED_PAWN_PENALTY', None]] -= sign * (len(own[col]) - 1)
+            
+            neighbours = [own[_col] for _col in (col - 1, col + 1) if 0 <= _col < COLS]
+            isolated = not any(neighbours)
+            
+            for row in own[col]:
+                values[COLUMNS['PAWN_TABLE', row * 8 + col if color == 'white' else (7 - row) * 8 + col]] += sign
+                
+                if isolated:
+                    values[COLUMNS['ISOLATED_PAWN_PENALTY', None]] -= sign
+                
+                if not any(ahead(_row, row) for _col in (col - 1, col, col + 1) if 0 <= _col < COLS for _row in enemy[_col]):
+                    values[COLUMNS['PASSED_PAWN_BONUS', 7 - row if color == 'white' else row]] += sign
+                
+                elif not isolated and not any(not ahead(_row, row) for pawns in neighbours for _row in pawns):
+                    guard_row = row + 2 * direction
+                    if any(guard_row in enemy[_col] for _col in (col - 1, col + 1) if 0 <= _col < COLS):
+                        values[COLUMNS['BACKWARD_PAWN_PENALTY', None]] -= sign
+    
+    # Mobility is counted for the side to move
+    sign = 1 if board.current_player == 'white' else -1
+    
+    for piece in board.get_legal_moves().values():
+        for move in piece.valid_moves:
+            if board.is_capture_move(move, piece.color):
+                captured = board.squares[move.final.row][move.final.col].piece
+                
+                if captured.type in ai.PIECE_VALUES and ai.see(board, move) >= 0:
+                    values[COLUMNS['PIECE_VALUES', captured.type]] += sign
+            else:
+                values[COLUMNS['MOBILITY_BONUS', None]] += sign
+    
+    if not (board.is_checkmate(color='white') or board.is_stalemate(color='white') or board.is_insufficient_material()):
+        values[COLUMNS['KING_SAFETY_BONUS', None]] = len(board.attackers('black', board.king('white')))
+    
+    return values
+
+
+'''
+Replays a game and keeps the quiet positions: past the opening,
+not in check, with moves to play, and where no capture changes
+the evaluation. Every row ends with the result of the game
+
+@return bytes int16 rows
+'''
+def game_features(game: pgn.Game):
+    ai = _ai
+    rows = []
+    
+    if game.result not in RESULTS:
+        return b''
+    
+    try:
+        for ply, (board, _) in enumerate(pgn.replay(game, _board)):
+            if ply < _skip_plies or board.is_check() or not board.has_legal_moves(board.current_player):
+                continue
+            
+            if ai.quiescence(board, -float('inf'), float('inf')) != ai.evaluate(board):
+                continue
+            
+            rows.append(features(ai, board) + [RESULTS[game.result]])
+    except ValueError:
+        # Keep the positions replayed before an illegal or unreadable move
+        pass
+    
+    return np.array(rows, dtype=np.int16).tobytes()
+
+
+'''
+Writes the quiet positions of PGN files as a .npy matrix of
+int16 feature counts. Rows go to a raw file first and are then
+copied under a .npy header, neither step holds them all in memory
+
+@return int number of positions
+'''
+def extract(pgn_paths, path, skip_plies=8, workers=1):
+    width = len(FEATURES) + 1
+    
+    def games():
+        for pgn_path in pgn_paths:
+            with open(pgn_path, errors='replace') as file:
+                yield from pgn.read_games(file)
+    
+    with open(path + '.tmp', 'wb') as raw, \
+            multiprocessing.Pool(workers, initializer=_init_worker, initargs=(skip_plies,)) as pool:
+        for rows in pool.imap_unordered(game_features, games(), chunksize=16):
+            raw.write(rows)
+    
+    count = os.path.getsize(path + '.tmp') // (width * 2)
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.int16, shape=(count, width))
+    
+    if count:
+        rows = np.memmap(path + '.tmp', dtype=np.int16, mode='r', shape=(count, width))
+        for start in range(0, count, CHUNK):
+            matrix[start:start + CHUNK] = rows[start:start + CHUNK]
+        del rows
+    
+    matrix.flush()
+    del matrix
+    os.remove(path + '.tmp')
+    return count
+
+
+def weight_vector(ai: AI):
+    return np.array([getattr(ai, name) if key is None else getattr(ai, name)[key] for name, key in FEATURES], dtype=np.float64)
+
+
+# Turns a weight vector back into the weights AI.set_weights takes
+def to_weights(vector):
+    names = {piece_type: name for name, piece_type in PIECE_TYPES.items()}
+    weights = {}
+    
+    for (name, key), value in zip(FEATURES, np.rint(vector).astype(int).tolist()):
+        if key is None:
+            weights[name] = value
+        elif name in ('PAWN_TABLE', 'PASSED_PAWN_BONUS'):
+            weights.setdefault(name, []).append(value)
+        else:
+            weights.setdefault(name, {})[names[key]] = value
+    
+    return weights
+
+
+'''
+Mean squared error between the results and the win probability
+of the evaluations, and its gradient by the weights. The matrix
+is read a chunk of rows at a time
+
+@return tuple[float, np.ndarray]
+'''
+def error(matrix, vector, k, chunk=CHUNK):
+    # Win probability 1 / (1 + 10^(-k * score / 400))
+    scale = k * np.log(10) / 400
+    total = 0.0
+    gradient = np.zeros_like(vector)
+    
+    for start in range(0, len(matrix), chunk):
+        rows = matrix[start:start + chunk]
+        counts = rows[:, :-1].astype(np.float64)
+        results = rows[:, -1] / 2
+        
+        probabilities = 1 / (1 + np.exp(-scale * (counts @ vector)))
+        residuals = probabilities - results
+        
+        total += residuals @ residuals
+        gradient += counts.T @ (residuals * probabilities * (1 - probabilities))
+    
+    return total / len(matrix), gradient * 2 * scale / len(matrix)
+
+
+'''
+Scaling constant of the win probability that best fits the
+results with the current weights, by golden-section search
+
+@return float
+'''
+def fit_k(matrix, vector, low=0.1, high=3.0, iterations=24, chunk=CHUNK):
+    ratio = (np.sqrt(5) - 1) / 2
+    
+    for _ in range(iterations):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        
+        if error(matrix, vector, a, chunk)[0] < error(matrix, vector, b, chunk)[0]:
+            high = b
+        else:
+            low = a
+    
+    return (low + high) / 2
+
+
+'''
+Fits the weights to the results with Adam over full passes of
+the matrix, the step size is in centipawns
+
+@return np.ndarray
+'''
+def tune(matrix, vector, k, epochs=200, rate=1.0, chunk=CHUNK, log=None):
+    vector = vector.copy()
+    moment = np.zeros_like(vector)
+    second = np.zeros_like(vector)
+    beta1, beta2 = 0.9, 0.999
+    
+    for epoch in range(1, epochs + 1):
+        value, gradient = error(matrix, vector, k, chunk)
+        
+        moment = beta1 * moment + (1 - beta1) * gradient
+        second = beta2 * second + (1 - beta2) * gradient ** 2
+        step = moment / (1 - beta1 ** epoch) / (np.sqrt(second / (1 - beta2 ** epoch)) + 1e-12)
+        vector -= rate * step
+        
+        if log and (epoch % 10 == 0 or epoch == epochs):
+            print(f'epoch {epoch}: error {value:.6f}', file=log)
+    
+    return vector
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the evaluation weights on the results of games')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    extract_parser = commands.add_parser('extract', help='write the quiet positions of PGN files as a feature matrix')
+    extract_parser.add_argument('matrix', help='.npy file to write')
+    extract_parser.add_argument('pgn', nargs='+')
+    extract_parser.add_argument('--skip-plies', type=int, default=8, help='opening plies left out of every game')
+    extract_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    
+    fit = commands.add_parser('fit', help='fit the weights to a feature matrix')
+    fit.add_argument('matrix')
+    fit.add_argument('--output', default='weights.json', help='JSON file for AI.load_weights')
+    fit.add_argument('--weights', metavar='PATH', help='starting weights, the defaults of AI when not given')
+    fit.add_argument('--epochs', type=int, default=200)
+    fit.add_argument('--rate', type=float, default=1.0, help='step size in centipawns')
+    fit.add_argument('--k', type=float, help='scaling constant, fitted to the starting weights when not given')
+    fit.add_argument('--chunk', type=int, default=CHUNK, help='rows read at a time')
+    
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    
+    if args.command == 'extract':
+        count = extract(args.pgn, args.matrix, args.skip_plies, args.workers)
+        print(f'extracted {count} positions in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+        return
+    
+    matrix = np.load(args.matrix, mmap_mode='r')
+    if matrix.shape[1] != len(FEATURES) + 1:
+        raise ValueError(f'{args.matrix} has {matrix.shape[1]} columns, expected {len(FEATURES) + 1}')
+    
+    ai = AI()
+    if args.weights:
+        ai.load_weights(args.weights)
+    
+    vector = weight_vector(ai)
+    k = args.k if args.k is not None else fit_k(matrix, vector, chunk=args.chunk)
+    before = error(matrix, vector, k, args.chunk)[0]
+    print(f'{len(matrix)} positions, k {k:.4f}, error {before:.6f}', file=sys.stderr)
+    
+    vector = tune(matrix, vector, k, args.epochs, args.rate, args.chunk, log=sys.stderr)
+    after = error(matrix, np.rint(vector), k, args.chunk)[0]
+    
+    with open(args.output, 'w') as file:
+        json.dump(to_weights(vector), file, indent=2)
+    
+    print(f'error {before:.6f} -> {after:.6f} in {time.perf_counter() - start:.1f}s, weights written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
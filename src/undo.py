@@ -0,0 +1,111 @@
+import copy
+from array import array
+from piece import *
+
+# Layout of the info word of an undo record:
+#
+#   bits  0-15  encoded move (from square, to square, promotion)
+#   bits 16-19  captured piece code, 0 when nothing was captured
+#   bits 20-23  castling rights before the move
+#   bits 24-30  en passant square before the move, NO_SQUARE when there was none
+#   bits 31-46  halfmove clock before the move
+#   bit     47  the moving piece had already moved
+#   bit     48  en passant capture
+#   bit     49  castling
+#   bits 50-53  board state before the move
+CAPTURED_SHIFT = 16
+CASTLING_SHIFT = 20
+EN_PASSANT_SHIFT = 24
+HALFMOVE_SHIFT = 31
+MOVED_FLAG = 1 << 47
+EN_PASSANT_FLAG = 1 << 48
+CASTLING_FLAG = 1 << 49
+STATE_SHIFT = 50
+
+NO_SQUARE = 64
+
+PIECE_CODES = {
+    ('white', PAWN): 1, ('white', KNIGHT): 2, ('white', BISHOP): 3,
+    ('white', ROOK): 4, ('white', QUEEN): 5, ('white', KING): 6,
+    ('black', PAWN): 7, ('black', KNIGHT): 8, ('black', BISHOP): 9,
+    ('black', ROOK): 10, ('black', QUEEN): 11, ('black', KING): 12,
+}
+
+
+def piece_code(piece: Piece | None):
+    return 0 if piece is None else PIECE_CODES[(piece.color, piece.type)]
+
+
+class UndoStack:
+    '''
+    Fixed-layout undo history: one 64-bit info word, the position
+    key and the pawn key per move in preallocated arrays, plus references
+    to the moving and captured pieces so undo puts the very same
+    objects back on the board. Slots are reused, nothing is copied
+    '''
+    
+    def __init__(self, capacity=256):
+        self.size = 0
+        self.info = array('Q', bytes(8 * capacity))
+        self.keys = array('Q', bytes(8 * capacity))
+        self.pawn_keys = array('Q', bytes(8 * capacity))
+        self.pieces: list[Piece | None] = [None] * capacity
+        self.captured: list[Piece | None] = [None] * capacity
+    
+    def __len__(self):
+        return self.size
+    
+    def __deepcopy__(self, memo):
+        stack = UndoStack.__new__(UndoStack)
+        stack.size = self.size
+        stack.info = array('Q', self.info)
+        stack.keys = array('Q', self.keys)
+        stack.pawn_keys = array('Q', self.pawn_keys)
+        
+        # Slots above the top are stale, the copy leaves them empty
+        capacity = len(self.pieces)
+        stack.pieces = [copy.deepcopy(piece, memo) for piece in self.pieces[:self.size]] + [None] * (capacity - self.size)
+        stack.captured = [copy.deepcopy(piece, memo) for piece in self.captured[:self.size]] + [None] * (capacity - self.size)
+        return stack
+    
+    # A copy of the records without the pieces they hold, for boards that never undo past their start
+    def records(self):
+        stack = UndoStack.__new__(UndoStack)
+        stack.size = self.size
+        stack.info = array('Q', self.info)
+        stack.keys = array('Q', self.keys)
+        stack.pawn_keys = array('Q', self.pawn_keys)
+        stack.pieces = [None] * len(self.pieces)
+        stack.captured = [None] * len(self.captured)
+        return stack
+    
+    def _grow(self):
+        capacity = len(self.info)
+        self.info.extend(array('Q', bytes(8 * capacity)))
+        self.keys.extend(array('Q', bytes(8 * capacity)))
+        self.pawn_keys.extend(array('Q', bytes(8 * capacity)))
+        self.pieces.extend([None] * capacity)
+        self.captured.extend([None] * capacity)
+    
+    def push(self, info, key, pawn_key, piece: Piece, captured: Piece | None):
+        if self.size == len(self.info):
+            self._grow()
+        
+        index = self.size
+        self.info[index] = info
+        self.keys[index] = key
+        self.pawn_keys[index] = pawn_key
+        self.pieces[index] = piece
+        self.captured[index] = captured
+        self.size = index + 1
+    
+    # Drops the last record and returns its slot, which stays readable until the next push
+    def pop(self):
+        self.size -= 1
+        return self.size
+    
+    def clear(self):
+        self.size = 0
+    
+    def move_code(self, index):
+        return self.info[index] & 0xFFFF
@@ -0,0 +1,28 @@
+import random
+from piece import *
+
+# The keys are stored on disk (position database, opening book), so they
+# must never change between runs: always draw them from the same seed
+_random = random.Random(0x5EED)
+
+PIECE_INDEX = {PAWN: 0, KNIGHT: 1, BISHOP: 2, ROOK: 3, QUEEN: 4, KING: 5}
+COLOR_INDEX = {'white': 0, 'black': 1}
+
+# PIECE_KEYS[color][piece][square]
+PIECE_KEYS = [[[_random.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+SIDE_KEY = _random.getrandbits(64)
+
+# White king side, white queen side, black king side, black queen side
+CASTLING_KEYS = [_random.getrandbits(64) for _ in range(4)]
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+# Combined key of every castling rights mask, so a change of rights is a single xor
+CASTLING_MASK_KEYS = [0] * 16
+for _mask in range(16):
+    for _bit in range(4):
+        if _mask & (1 << _bit):
+            CASTLING_MASK_KEYS[_mask] ^= CASTLING_KEYS[_bit]
+
+
+def piece_key(piece: Piece, square):
+    return PIECE_KEYS[COLOR_INDEX[piece.color]][PIECE_INDEX[piece.type]][square]